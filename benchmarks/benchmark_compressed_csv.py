@@ -0,0 +1,105 @@
+"""
+Compare loading plain, gzip and zstd compressed csv files into DuckDB with load_csv_to_duckdb.
+
+A synthetic measurement-like table is written once in each format, then each file (and a folder of shards
+of each format) is loaded into a fresh in-memory database. DuckDB decompresses the files while parsing them,
+and the shards of a folder are decompressed and parsed in parallel.
+
+Usage:
+    python -m benchmarks.benchmark_compressed_csv --rows 5000000 --shards 8
+"""
+from src.load_duckdb import load_csv_to_duckdb
+from src.util import get_csv_header, get_path_size
+import argparse
+import tempfile
+import duckdb
+import time
+import os
+
+TABLE_DDL = """
+    CREATE TABLE measurement (
+        measurement_id BIGINT,
+        person_id BIGINT,
+        measurement_concept_id INTEGER,
+        measurement_date DATE,
+        value_as_number DOUBLE,
+        measurement_source_value VARCHAR
+    );
+"""
+
+SOURCE_QUERY = """
+    SELECT range AS measurement_id,
+        range % 100000 AS person_id,
+        3000000 + range % 5000 AS measurement_concept_id,
+        DATE '2020-01-01' + (range % 1500)::INTEGER AS measurement_date,
+        round(random() * 200, 2) AS value_as_number,
+        'LAB_' || (range % 5000) AS measurement_source_value
+    FROM range({rows})
+"""
+
+FILE_FORMATS = {
+    'csv': ('.csv', 'none'),
+    'csv.gz': ('.csv.gz', 'gzip'),
+    'csv.zst': ('.csv.zst', 'zstd'),
+}
+
+
+def write_files(work_dir: str, rows: int, shards: int) -> dict:
+    """
+    Write the synthetic table as one file and as a folder of shards, in every format.
+    """
+    paths = dict()
+    with duckdb.connect(database=':memory:') as con:
+        con.execute(f"CREATE TABLE source AS {SOURCE_QUERY.format(rows=rows)}")
+        for name, (file_extension, compression) in FILE_FORMATS.items():
+            file_path = os.path.join(work_dir, f'measurement{file_extension}')
+            con.execute(f"COPY source TO '{file_path}' (FORMAT CSV, HEADER, COMPRESSION {compression})")
+            shard_dir = os.path.join(work_dir, name.replace('.', '_'), 'measurement')
+            os.makedirs(shard_dir)
+            for shard in range(shards):
+                con.execute(f"COPY (SELECT * FROM source WHERE measurement_id % {shards} = {shard}) TO '{shard_dir}/measurement_{shard}{file_extension}' (FORMAT CSV, HEADER, COMPRESSION {compression})")
+            paths[name] = file_path
+            paths[f'{name} ({shards} shards)'] = shard_dir
+    return paths
+
+
+def time_load(path: str, threads: int = None) -> tuple:
+    """
+    Load a file or folder of shards into a fresh in-memory database, return (seconds, row count).
+    """
+    with duckdb.connect(database=':memory:') as con:
+        if threads:
+            con.execute(f"SET threads={threads}")
+        con.execute(TABLE_DDL)
+        start_time = time.perf_counter()
+        load_csv_to_duckdb(path, con, 'measurement', accept_additional_col=False)
+        duration = time.perf_counter() - start_time
+        row_count = con.execute("SELECT COUNT(*) FROM measurement").fetchone()[0]
+    return duration, row_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2_000_000, help='number of rows of the synthetic table')
+    parser.add_argument('--shards', type=int, default=8, help='number of shards of the folder inputs')
+    parser.add_argument('--threads', type=int, default=None, help='DuckDB threads, default to DuckDB default')
+    parser.add_argument('--repeat', type=int, default=3, help='number of loads of each input, the fastest is reported')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        paths = write_files(work_dir, args.rows, args.shards)
+        print(f"{'input':<28}{'size (MB)':>12}{'load (s)':>12}{'rows/s':>14}")
+        for name, path in paths.items():
+            # header is read from the first line only, decompressing a single block
+            assert get_csv_header(path if os.path.isfile(path) else os.path.join(path, sorted(os.listdir(path))[0]))[0] == 'measurement_id'
+            durations = []
+            for _ in range(args.repeat):
+                duration, row_count = time_load(path, args.threads)
+                assert row_count == args.rows, f"{name}: loaded {row_count} rows, expected {args.rows}"
+                durations.append(duration)
+            duration = min(durations)
+            print(f"{name:<28}{get_path_size(path) / 1024 / 1024:>12.1f}{duration:>12.2f}{args.rows / duration:>14,.0f}")
+
+
+if __name__ == '__main__':
+    main()
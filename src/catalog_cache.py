@@ -0,0 +1,82 @@
+from typing import Dict, Optional, Set, Tuple
+from duckdb import DuckDBPyConnection
+import threading
+
+
+class CatalogCache:
+    """
+    Snapshot of the tables, views and columns of the DuckDB database, read from information_schema.columns in one query.
+    util.table_exists and util.column_exists answer from the snapshot while the cache is enabled, instead of running
+    SHOW TABLES / DESCRIBE for every check.
+
+    The snapshot is loaded on first use and dropped by invalidate(), which must be called after any statement that
+    changes the schema (CREATE, DROP, ALTER TABLE, CREATE VIEW). The next lookup loads a new snapshot.
+
+    Example:
+        CatalogCache.enable(con)
+        util.table_exists(con, 'person')  # loads the snapshot
+        util.column_exists(con, 'person', 'person_id')  # answered from the snapshot
+        CatalogCache.invalidate()  # after ALTER TABLE person ADD COLUMN ...
+        CatalogCache.disable()
+    """
+
+    duckdb_conn: Optional[DuckDBPyConnection] = None  # Class variable, connection used to load the snapshot. The cache is disabled while None.
+    _columns: Optional[Dict[Tuple[str, str], Set[str]]] = None  # Class variable, a dict of {(schema, table_name): {column_name, ...}}
+    _lock = threading.Lock()
+
+    @classmethod
+    def enable(cls, con: DuckDBPyConnection):
+        """
+        Enable the cache for the database of a connection. Cursors of the connection share the database and the cache.
+        """
+        with cls._lock:
+            cls.duckdb_conn = con
+            cls._columns = None
+
+    @classmethod
+    def disable(cls):
+        with cls._lock:
+            cls.duckdb_conn = None
+            cls._columns = None
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        return cls.duckdb_conn is not None
+
+    @classmethod
+    def invalidate(cls):
+        """
+        Drop the snapshot after a schema change. The next lookup loads a new snapshot.
+        """
+        with cls._lock:
+            cls._columns = None
+
+    @classmethod
+    def _get_columns(cls) -> Dict[Tuple[str, str], Set[str]]:
+        with cls._lock:
+            if cls._columns is None:
+                with cls.duckdb_conn.cursor() as cursor:
+                    rows = cursor.execute("""
+                        SELECT table_schema, table_name, column_name
+                        FROM information_schema.columns
+                        WHERE table_catalog = current_database();
+                    """).fetchall()
+                columns = dict()
+                for schema, table_name, column_name in rows:
+                    columns.setdefault((schema, table_name), set()).add(column_name)
+                cls._columns = columns
+            return cls._columns
+
+    @classmethod
+    def table_exists(cls, table_name: str, schema: str = 'main') -> bool:
+        """
+        Check if a table or view exists in the snapshot.
+        """
+        return (schema, table_name) in cls._get_columns()
+
+    @classmethod
+    def column_exists(cls, table_name: str, column_name: str, schema: str = 'main') -> bool:
+        """
+        Check if a column of a table or view exists in the snapshot.
+        """
+        return column_name in cls._get_columns().get((schema, table_name), set())
@@ -0,0 +1,260 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from duckdb import DuckDBPyConnection
+from src.dq_checks.check_result import CheckResult
+from src.config import LOGGER
+import threading
+
+
+class CheckTask:
+    """
+    A check (or any step a check needs, e.g. building a key set) registered in a CheckScheduler.
+
+    Parameters:
+        name (str): Unique name of the task, e.g. 'check foreign keys visit_occurrence'.
+        func (Callable): Function run by the task. It is called with con=<cursor of the worker> and the kwargs.
+        tables (Iterable[str]): Tables read by the task. The task waits for the tasks providing these tables, if any.
+        depends_on (Iterable[str]): Names of the tasks to wait for.
+        provides_table (Optional[str]): Table written by the task, e.g. the table loaded by a load task.
+        kwargs: Keyword arguments of func.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable,
+        tables: Iterable[str] = (),
+        depends_on: Iterable[str] = (),
+        provides_table: Optional[str] = None,
+        **kwargs
+    ):
+        self.name = name
+        self.func = func
+        self.tables = tuple(tables)
+        self.depends_on = tuple(depends_on)
+        self.provides_table = provides_table
+        self.kwargs = kwargs
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class CheckScheduler:
+    """
+    Runs registered tasks as a dependency graph, with up to max_workers tasks at the same time.
+
+    A task runs once all tasks it depends on have finished: the tasks named in depends_on, and the tasks providing
+    the tables it reads (e.g. a foreign key check of visit_occurrence.person_id waits for the loads of person and
+    visit_occurrence, if they are registered). Tables without a registered provider are considered ready.
+    Each worker runs its tasks on its own cursor of the connection. When several tasks are ready, the first registered
+    runs first, so one worker runs the tasks in registration order.
+
+    A task raising an error does not stop the run: its result is a FAIL CheckResult of check type 'check_task_error',
+    and the tasks depending on it are not run, their result is a SKIPPED CheckResult. Both are logged when the task
+    finishes, and the error is kept in task.error. A task reading a table in skip_tables when it is about to start,
+    e.g. a table a load task failed to load, is not run and returns None.
+
+    Results are collected deterministically: run() returns the results in registration order, and the CheckResults
+    returned by the tasks are listed in CheckResult.dq_fail / dq_warn / dq_skip in registration order.
+
+    Parameters:
+        con (DuckDBPyConnection): a duckdb connection.
+        max_workers (int): number of tasks run at the same time. Defaults to 1.
+        skip_tables (Optional[list]): tables whose readers are not run. Read when each task starts, so tasks can add
+            tables to it while the scheduler runs. Defaults to None.
+        on_tables_provided (Optional[Callable]): called once by run(), from the thread of run(), when every task
+            providing a table has finished (immediately if there is none), e.g. to switch DuckDB settings from loads
+            to checks. Defaults to None.
+
+    Example:
+        scheduler = CheckScheduler(con, max_workers=4)
+        scheduler.add('build key set person.person_id', key_sets.build, tables=['person'], reference_table='person', reference_column='person_id')
+        scheduler.add('check foreign keys visit_occurrence', check_fk_violations, tables=['visit_occurrence', 'person'],
+                      depends_on=['build key set person.person_id'], main_table='visit_occurrence', foreign_keys=[...], key_sets=key_sets)
+        results = scheduler.run()  # {task name: returned value}
+    """
+
+    def __init__(
+        self,
+        con: DuckDBPyConnection,
+        max_workers: int = 1,
+        skip_tables: Optional[list] = None,
+        on_tables_provided: Optional[Callable[[], Any]] = None
+    ):
+        self.con = con
+        self.max_workers = max(1, int(max_workers))
+        self.skip_tables = skip_tables if skip_tables is not None else []
+        self.on_tables_provided = on_tables_provided
+        self.tasks: Dict[str, CheckTask] = dict()  # a dict of {task name: task}, in registration order
+        self.table_providers: Dict[str, str] = dict()  # a dict of {table_name: name of the task providing the table}
+        self._local = threading.local()
+        self._cursors: List[DuckDBPyConnection] = []
+        self._lock = threading.Lock()
+
+    def add(
+        self,
+        name: str,
+        func: Callable,
+        tables: Iterable[str] = (),
+        depends_on: Iterable[str] = (),
+        provides_table: Optional[str] = None,
+        **kwargs
+    ) -> CheckTask:
+        """
+        Register a task. See CheckTask for the parameters.
+        """
+        if name in self.tasks:
+            raise ValueError(f"Task {name} is already registered.")
+        task = CheckTask(name, func, tables=tables, depends_on=depends_on, provides_table=provides_table, **kwargs)
+        self.tasks[name] = task
+        if provides_table:
+            self.table_providers[provides_table] = name
+        return task
+
+    def get_dependencies(self, task: CheckTask) -> List[str]:
+        """
+        Get the names of the tasks a task waits for.
+        """
+        dependencies = list(task.depends_on)
+        for table_name in task.tables:
+            provider = self.table_providers.get(table_name)
+            if provider and provider != task.name and provider not in dependencies:
+                dependencies.append(provider)
+        for dependency in dependencies:
+            if dependency not in self.tasks:
+                raise ValueError(f"Task {task.name} depends on task {dependency}, which is not registered.")
+        return dependencies
+
+    def _get_cursor(self) -> DuckDBPyConnection:
+        """
+        Get the cursor of the current worker thread, created on first use.
+        """
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            cursor = self.con.cursor()
+            self._local.cursor = cursor
+            with self._lock:
+                self._cursors.append(cursor)
+        return cursor
+
+    def _run_task(self, task: CheckTask):
+        skipped_tables = [table_name for table_name in task.tables if table_name in self.skip_tables]
+        if skipped_tables:
+            LOGGER.info(f"Check task {task.name} is not run, table(s) {skipped_tables} are in the skip list.")
+            return
+        task.result = task.func(con=self._get_cursor(), **task.kwargs)
+
+    def _record_error(self, task: CheckTask, error: BaseException, failed_dependency: Optional[str] = None):
+        """
+        Record the result of a task that failed (a FAIL CheckResult), or that is not run because a task it depends on
+        failed (a SKIPPED CheckResult).
+        """
+        task.error = error
+        if failed_dependency is None:
+            LOGGER.error(f"Check task {task.name} failed: {error}")
+            task.result = CheckResult(
+                check_type='check_task_error',
+                status='FAIL',
+                table_name=task.tables or task.provides_table,
+                troubleshooting_message=f'Check task {task.name} failed: {type(error).__name__}: {error}'
+            )
+        else:
+            LOGGER.error(f"Check task {task.name} is not run, task {failed_dependency} it depends on failed.")
+            task.result = CheckResult(
+                check_type='check_task_error',
+                status='SKIPPED',
+                table_name=task.tables or task.provides_table,
+                troubleshooting_message=f'Check task {task.name} is not run, task {failed_dependency} it depends on failed: {error}'
+            )
+        task.result.log(LOGGER, duckdb_conn=self.con)
+
+    def _order_check_results(self, result_counts: Dict[str, int]):
+        """
+        Sort the CheckResults added to CheckResult.dq_fail / dq_warn / dq_skip during run() in task registration order.
+        """
+        order = dict()
+        for task in self.tasks.values():
+            returned = task.result if isinstance(task.result, (list, tuple)) else [task.result]
+            for check_result in returned:
+                if isinstance(check_result, CheckResult):
+                    order.setdefault(id(check_result), len(order))
+        for list_name, start in result_counts.items():
+            check_results = getattr(CheckResult, list_name)
+            check_results[start:] = sorted(check_results[start:], key=lambda check_result: order.get(id(check_result), len(order)))
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Run all registered tasks.
+
+        Returns:
+            Dict[str, Any]: a dict of {task name: value returned by the task}, in registration order.
+        """
+        dependencies = {name: self.get_dependencies(task) for name, task in self.tasks.items()}
+        dependents = {name: [] for name in self.tasks}
+        for name, task_dependencies in dependencies.items():
+            for dependency in task_dependencies:
+                dependents[dependency].append(name)
+        remaining = {name: len(task_dependencies) for name, task_dependencies in dependencies.items()}
+        ready = [name for name in self.tasks if remaining[name] == 0]
+        position = {name: i for i, name in enumerate(self.tasks)}
+        result_counts = {list_name: len(getattr(CheckResult, list_name)) for list_name in ('dq_fail', 'dq_warn', 'dq_skip')}
+        LOGGER.info(f"Running {len(self.tasks)} check task(s) with {self.max_workers} worker(s).")
+        pending_providers = sum(1 for task in self.tasks.values() if task.provides_table)
+
+        def provider_finished(name: str):
+            nonlocal pending_providers
+            if self.tasks[name].provides_table:
+                pending_providers -= 1
+                if pending_providers == 0 and self.on_tables_provided:
+                    self.on_tables_provided()
+
+        if pending_providers == 0 and self.on_tables_provided:
+            self.on_tables_provided()
+        failed_dependencies = dict()  # a dict of {task name: name of the failed task it depends on}
+        finished = 0
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                running = dict()  # a dict of {future: task name}
+                while finished < len(self.tasks):
+                    # start the first registered ready tasks
+                    ready.sort(key=lambda name: position[name])
+                    while ready and len(running) < self.max_workers:
+                        name = ready.pop(0)
+                        running[executor.submit(self._run_task, self.tasks[name])] = name
+                    if not running:
+                        raise RuntimeError(f"Check tasks have circular dependencies: {[name for name in self.tasks if remaining[name] > 0]}")
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        finished += 1
+                        error = future.exception()
+                        if error is not None:
+                            self._record_error(self.tasks[name], error)
+                        provider_finished(name)
+                        for dependent in dependents[name]:
+                            if error is not None and failed_dependencies.get(dependent) is None:
+                                failed_dependencies[dependent] = name
+                            remaining[dependent] -= 1
+                            if remaining[dependent] == 0:
+                                if dependent not in failed_dependencies:
+                                    ready.append(dependent)
+                                else:
+                                    # skip the tasks of a failed dependency, and their own dependents
+                                    skipped = [dependent]
+                                    while skipped:
+                                        skipped_name = skipped.pop()
+                                        failed_name = failed_dependencies[skipped_name]
+                                        self._record_error(self.tasks[skipped_name], self.tasks[failed_name].error, failed_dependency=failed_name)
+                                        finished += 1
+                                        provider_finished(skipped_name)
+                                        for skipped_dependent in dependents[skipped_name]:
+                                            failed_dependencies.setdefault(skipped_dependent, failed_name)
+                                            remaining[skipped_dependent] -= 1
+                                            if remaining[skipped_dependent] == 0:
+                                                skipped.append(skipped_dependent)
+        finally:
+            for cursor in self._cursors:
+                cursor.close()
+            self._cursors = []
+            self._local = threading.local()
+        self._order_check_results(result_counts)
+        return {name: task.result for name, task in self.tasks.items()}
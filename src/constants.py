@@ -75,4 +75,45 @@ DQ_THRESHOLDS = {
             "threshold": {'PASS': 0.0, 'WARN': 0.01,},
         },
     ],
-}
+    "load_reject_violation": [
+        {
+            "table_name": "*",
+            "threshold": {'PASS': 0.0, 'WARN': 0.001,},
+        },
+    ],
+    "type_conformance_violation": [
+        {
+            "table_name": "*",
+            "column_name": "*",
+            "threshold": {'PASS': 0.0, 'WARN': 0.001,},
+        },
+    ],
+    "field_size_violation": [
+        {
+            "table_name": "*",
+            "column_name": "*",
+            "threshold": {'PASS': 0.0, 'WARN': 0.001,},
+        },
+    ],
+    "concept_id_violation": [
+        {
+            "table_name": "*",
+            "column_name": "*",
+            "threshold": {'PASS': 0.0, 'WARN': 0.01,},
+        },
+    ],
+    "concept_domain_violation": [
+        {
+            "table_name": "*",
+            "column_name": "*",
+            "threshold": {'PASS': 0.0, 'WARN': 0.05,},
+        },
+    ],
+    "standard_concept_violation": [
+        {
+            "table_name": "*",
+            "column_name": "*",
+            "threshold": {'PASS': 0.0, 'WARN': 0.05,},
+        },
+    ],
+}
\ No newline at end of file
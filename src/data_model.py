@@ -4,6 +4,10 @@ import requests
 from sqlalchemy import Integer, Numeric, Float, String, Date, DateTime, Time, Text, Boolean, LargeBinary,BigInteger, Table, Column, MetaData, create_engine
 from sqlalchemy.schema import CreateTable
 
+DEFAULT_STRING_LENGTH = 256  # VARCHAR length of string fields without a declared length
+DEFAULT_NUMERIC_PRECISION = 20  # DECIMAL precision of number fields without a declared precision
+DEFAULT_NUMERIC_SCALE = 5  # DECIMAL scale of number fields without a declared scale (or a declared scale of 0)
+
 class DataModel():
     @overload
     def __init__(
@@ -125,12 +129,12 @@ class DataModel():
                 type_kwargs = dict()
                 if type_class == String:
                     # Specifying the length for the VARCHAR, STRING, and TEXT types has no effect on DuckDB. 
-                    # Length limit is enforced as a DQ check instead. 
+                    # Length limit is enforced as a DQ check instead, see check_field_size. 
                     # https://duckdb.org/docs/stable/sql/data_types/text.html#specifying-a-length-limit
-                    type_kwargs['length'] = col_kwargs.get('length') or 256
+                    type_kwargs['length'] = col_kwargs.get('length') or DEFAULT_STRING_LENGTH
                 if type_class == Numeric:
-                    type_kwargs['precision'] = col_kwargs.get('precision') or 20
-                    type_kwargs['scale'] = col_kwargs.get('scale') or 5
+                    type_kwargs['precision'] = col_kwargs.get('precision') or DEFAULT_NUMERIC_PRECISION
+                    type_kwargs['scale'] = col_kwargs.get('scale') or DEFAULT_NUMERIC_SCALE
                 cols.append(Column(column_name, type_class(**type_kwargs)))
             t = Table(table_name, metadata, *cols)
             ddl = str(CreateTable(t).compile(engine))
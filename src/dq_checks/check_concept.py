@@ -0,0 +1,171 @@
+from src.dq_checks.check_result import CheckResult
+from src.process_log import ProcessLog
+from src.util import table_exists, column_exists, get_threshold, get_table_count
+from src.config import LOGGER
+from duckdb import DuckDBPyConnection
+from typing import Dict, List, Optional
+
+# Expected domain_id of the standard concept columns of the clinical tables. Concepts of these columns must be
+# standard concepts (standard_concept = 'S') of the domain. Other concept columns (e.g. *_source_concept_id,
+# *_type_concept_id) are only checked to exist in the concept table
+STANDARD_CONCEPT_COLUMN_DOMAINS = {
+    'condition_concept_id': 'Condition',
+    'drug_concept_id': 'Drug',
+    'procedure_concept_id': 'Procedure',
+    'measurement_concept_id': 'Measurement',
+    'observation_concept_id': 'Observation',
+    'device_concept_id': 'Device',
+    'visit_concept_id': 'Visit',
+    'gender_concept_id': 'Gender',
+    'race_concept_id': 'Race',
+    'ethnicity_concept_id': 'Ethnicity',
+    'unit_concept_id': 'Unit',
+    'dose_unit_concept_id': 'Unit',
+    'route_concept_id': 'Route',
+    'specimen_concept_id': 'Specimen',
+}
+
+def get_concept_columns(data_model) -> Dict[str, List[str]]:
+    """
+    Get the concept_id columns of the data model, the columns with a foreign key to concept.concept_id.
+
+    Returns:
+    - Dict[str, List[str]]: a dict of {table_name: [column_name, ...]}, in the order of the foreign keys.
+    """
+    concept_columns = dict()
+    for fk_definition in data_model.data['schema']['constraints']['foreign_keys']:
+        if fk_definition['target_table'] == 'concept' and fk_definition['target_field'] == 'concept_id':
+            column_names = concept_columns.setdefault(fk_definition['source_table'], [])
+            if fk_definition['source_field'] not in column_names:
+                column_names.append(fk_definition['source_field'])
+    return concept_columns
+
+@ProcessLog.trace()
+def check_concept_ids(
+    con: DuckDBPyConnection,
+    table_name: str,
+    column_names: List[str],
+    column_domains: Optional[Dict[str, str]] = None
+) -> List[CheckResult]:
+    """
+    Check the concept_id columns of a table against the concept table, in one scan of the table and one join for all columns.
+
+    The concept columns are grouped to their distinct values with a row count by one GROUPING SETS aggregate (one hash
+    table per column, filled by the same scan), so only the distinct (column, concept_id) values are joined to concept,
+    whatever the size of the table. For each column:
+    - concept_id_violation: concept ids not in the concept table.
+    - concept_domain_violation and standard_concept_violation, for columns with an expected domain (see
+      STANDARD_CONCEPT_COLUMN_DOMAINS): concepts of another domain, and concepts that are not standard.
+    NULL and 0 (no matching concept) are not violations. Violation rates are out of the rows of the table.
+
+    Parameters:
+    - con: DuckDBPyConnection, a duckdb connection.
+    - table_name: str, the name of the table to check.
+    - column_names: List[str], the concept_id columns of the table.
+    - column_domains: Optional[Dict[str, str]], a dict of {column_name: expected domain_id}. Defaults to STANDARD_CONCEPT_COLUMN_DOMAINS.
+
+    Returns:
+    - List[CheckResult]: Results of the checks, by column in the order of column_names.
+    """
+    if column_domains is None:
+        column_domains = STANDARD_CONCEPT_COLUMN_DOMAINS
+    skip_message = None
+    if not table_exists(con, table_name):
+        skip_message = f'Table {table_name} does not exist in the database.'
+    elif not table_exists(con, 'concept') or not column_exists(con, 'concept', 'concept_id'):
+        skip_message = 'Table concept does not exist in the database.'
+    elif get_table_count(con, 'concept') == 0:
+        skip_message = 'Table concept is empty, the vocabulary was not loaded.'
+    if skip_message:
+        results = [CheckResult(
+            check_type='concept_id_violation',
+            table_name=table_name,
+            column_name=column_name,
+            status='SKIPPED',
+            troubleshooting_message=skip_message
+        ) for column_name in column_names]
+        for result in results:
+            result.log(LOGGER, duckdb_conn=con)
+        return results
+
+    existing_columns = [column_name for column_name in dict.fromkeys(column_names) if column_exists(con, table_name, column_name)]
+    column_counts = dict()  # a dict of {column_name: (invalid count, sample, domain count, sample, non-standard count, sample)}
+    if existing_columns:
+        expected_domain = ' '.join(
+            f"WHEN {i} THEN '{column_domains[column_name]}'" for i, column_name in enumerate(existing_columns) if column_name in column_domains
+        )
+        expected_domain = f'CASE v.column_index {expected_domain} END' if expected_domain else 'NULL::VARCHAR'
+        invalid_filter = 'c.concept_id IS NULL'
+        domain_filter = f'c.concept_id IS NOT NULL AND {expected_domain} IS NOT NULL AND c.domain_id IS DISTINCT FROM {expected_domain}'
+        standard_filter = f"c.concept_id IS NOT NULL AND {expected_domain} IS NOT NULL AND c.standard_concept IS DISTINCT FROM 'S'"
+        # one scan of the table: distinct concept ids of each column, with their row counts. A grouping set is one
+        # column, the other columns are NULL in its rows. The 5 most frequent concept ids of each violation are sampled
+        grouping_sets = f"""
+            SELECT {', '.join(f'GROUPING("{column_name}") = 0 AS g{i}' for i, column_name in enumerate(existing_columns))},
+                {', '.join(f'"{column_name}"' for column_name in existing_columns)},
+                COUNT(*) AS row_count
+            FROM "{table_name}"
+            GROUP BY GROUPING SETS ({', '.join(f'("{column_name}")' for column_name in existing_columns)})
+        """
+        check_query = f"""
+            WITH concept_counts AS (
+                SELECT CASE {' '.join(f'WHEN g{i} THEN {i}' for i in range(len(existing_columns)))} END AS column_index,
+                    CASE {' '.join(f'WHEN g{i} THEN "{column_name}"' for i, column_name in enumerate(existing_columns))} END AS concept_id,
+                    row_count
+                FROM ({grouping_sets})
+            )
+            SELECT v.column_index,
+                {', '.join(f'COALESCE(SUM(v.row_count) FILTER (WHERE {violation_filter}), 0), max_by(v.concept_id, v.row_count, 5) FILTER (WHERE {violation_filter})' for violation_filter in (invalid_filter, domain_filter, standard_filter))}
+            FROM concept_counts AS v
+            LEFT JOIN (
+                SELECT DISTINCT ON (concept_id) concept_id, domain_id, standard_concept
+                FROM concept
+            ) AS c
+                ON v.concept_id = c.concept_id
+            WHERE v.concept_id IS NOT NULL AND v.concept_id <> 0
+            GROUP BY v.column_index;
+        """
+        LOGGER.debug(f"Executing concept check query: {check_query}")
+        for column_index, *counts in con.execute(check_query).fetchall():
+            column_counts[existing_columns[column_index]] = counts
+        total_count = get_table_count(con, table_name)
+
+    results = []
+    for column_name in column_names:
+        if column_name not in existing_columns:
+            result = CheckResult(
+                check_type='concept_id_violation',
+                table_name=table_name,
+                column_name=column_name,
+                status='SKIPPED',
+                troubleshooting_message=f'Column {column_name} does not exist in table {table_name}.'
+            )
+            result.log(LOGGER, duckdb_conn=con)
+            results.append(result)
+            continue
+        invalid_count, invalid_sample, domain_count, domain_sample, standard_count, standard_sample = column_counts.get(column_name, (0, None, 0, None, 0, None))
+        column_checks = [('concept_id_violation', invalid_count, invalid_sample, 'concept ids not in the concept table')]
+        if column_name in column_domains:
+            column_checks.append(('concept_domain_violation', domain_count, domain_sample, f"concepts not in domain '{column_domains[column_name]}'"))
+            column_checks.append(('standard_concept_violation', standard_count, standard_sample, 'concepts that are not standard concepts'))
+        for check_type, violation_count, sample_violations, violation_message in column_checks:
+            if violation_count > 0:
+                sample_violations_str = ', '.join([str(value) for value in sample_violations])
+                result = CheckResult(
+                    check_type=check_type,
+                    table_name=table_name,
+                    column_name=column_name,
+                    violation_pct=1.0 * violation_count / total_count,
+                    threshold=get_threshold(check_type, table_name=table_name, column_name=column_name),
+                    troubleshooting_message=f'Found {violation_count} rows with {violation_message} in {table_name}.{column_name}. Total rows in {table_name}: {total_count}.\nSample concept ids: {sample_violations_str}',
+                )
+            else:
+                result = CheckResult(
+                    check_type=check_type,
+                    table_name=table_name,
+                    column_name=column_name,
+                    status='PASS',
+                )
+            result.log(LOGGER, duckdb_conn=con)
+            results.append(result)
+    return results
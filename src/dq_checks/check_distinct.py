@@ -1,27 +1,47 @@
 from src.dq_checks.check_result import CheckResult
+from src.process_log import ProcessLog
 from src.util import get_table_count, table_exists, column_exists
 from src.config import LOGGER
 from duckdb import DuckDBPyConnection
 from typing import Optional
 from src.util import get_threshold
+from src.person_sample import PersonSample
 
+# Relative error of approx_count_distinct: DuckDB's HyperLogLog has 64 registers, a standard error of 1.04 / sqrt(64) = 13%.
+# The screen uses 3 standard errors
+APPROX_COUNT_DISTINCT_RELATIVE_ERROR = 3 * 1.04 / 64 ** 0.5
+
+@ProcessLog.trace()
 def check_distinct_violation(
     con: DuckDBPyConnection,
     table_name: str,
     column_names: tuple[str] | str,
-    threshold: Optional[dict[str, float] ]= None
+    threshold: Optional[dict[str, float] ]= None,
+    approx_precheck: bool = False
 ) -> CheckResult:
     """
     Check for DISTINCT constraint violations in the specified table and column.
 
+    With approx_precheck, the table is first screened with approx_count_distinct (HyperLogLog), which needs a few bytes
+    of memory instead of a hash table of the keys. If the estimate is lower than the row count by more than its relative
+    error (APPROX_COUNT_DISTINCT_RELATIVE_ERROR), the key has duplicates for sure: the violation rate is estimated from
+    the distinct estimate, without the exact count and the sample of duplicated values, and the relative error is
+    recorded with the result. Otherwise, the exact distinct count confirms whether the key is distinct.
+
+    On a table sampled by PersonSample, a key shared by the rows of two persons is only found if both persons are sampled.
+
     Parameters:
     - con: DuckDBPyConnection, a duckdb connection.
     - table_name: str, the name of the table to check.
     - column_name: str, the column in the table that should contain distinct values.
+    - threshold: Optional[dict[str, float]], thresholds of the violation rate. Defaults to the 'distinct_violation' thresholds.
+    - approx_precheck: bool, if True, screen the key with approx_count_distinct before the exact distinct count.
 
     Returns:
     - CheckResult: Result of the DISTINCT check.
     """
+    if isinstance(column_names, str):
+        column_names = (column_names, )
     if isinstance(column_names, list):
         column_names = tuple(column_names, )
     if threshold is None:
@@ -49,27 +69,58 @@ def check_distinct_violation(
             result.log(LOGGER, duckdb_conn=con)
             return result
     
-    # check for DISTINCT violations
+    if approx_precheck:
+        # NULL is not counted by COUNT(DISTINCT) of a single column, a composite key with NULLs is a key
+        key_str = f'"{column_names[0]}"' if len(column_names) == 1 else '(' + ', '.join(['"' + col + '"' for col in column_names]) + ')'
+        precheck_query = f"""
+            SELECT COUNT(*) AS total_count,
+                   approx_count_distinct({key_str}) AS distinct_estimate
+            FROM "{table_name}";
+        """
+        LOGGER.debug(f"Executing DISTINCT approximate precheck query: {precheck_query}")
+        total_count, distinct_estimate = con.execute(precheck_query).fetchone()
+        if distinct_estimate < total_count * (1 - APPROX_COUNT_DISTINCT_RELATIVE_ERROR):
+            violation_count = total_count - distinct_estimate
+            violation_pct = 1.0 * violation_count / total_count
+            result = CheckResult(
+                check_type='distinct_violation',
+                status=None,  # Let CheckResult infer the status based on threshold and violation_pct
+                table_name=table_name,
+                column_name=column_name,
+                violation_count=violation_count,
+                violation_pct=violation_pct,
+                threshold=threshold,
+                troubleshooting_message = f'The column "{column_name}" in table "{table_name}" has about {violation_count} non-distinct values out of {total_count} total values ({violation_pct:.2%}), estimated from approx_count_distinct. Please ensure this column contains only distinct values.',
+                distinct_estimate=distinct_estimate,
+                estimate_relative_error=f'{APPROX_COUNT_DISTINCT_RELATIVE_ERROR:.2f}',
+                **PersonSample.get_check_kwargs(table_name, violation_count, total_count)
+            )
+            result.log(LOGGER, duckdb_conn=con)
+            return result
+        LOGGER.debug(f"DISTINCT approximate precheck of {table_name}.{column_names} estimated {distinct_estimate} distinct values out of {total_count}, running the exact check.")
+
+    # check for DISTINCT violations. Row count, distinct count and the 10 most duplicated values come from one
+    # aggregate over the groups of the key, so a failing check does not scan the table again for the sample
+    key_columns_str = ', '.join(['"' + col + '"' for col in column_names])
+    # NULL is not counted by COUNT(DISTINCT) of a single column
+    distinct_filter = f' FILTER (WHERE "{column_names[0]}" IS NOT NULL)' if len(column_names) == 1 else ''
     check_query = f"""
-        SELECT COUNT(*) AS total_count,
-               COUNT(DISTINCT ( {', '.join(['"' + col + '"' for col in column_names])}) ) AS distinct_count
-        FROM "{table_name}";
-    """
-    sample_query = f"""
-        SELECT "{column_name}" AS value_count
-        FROM "{table_name}"
-        GROUP BY {', '.join(['"' + col + '"' for col in column_names])}
-        HAVING COUNT(*) > 1
-        LIMIT 10;
+        SELECT SUM(row_count)::BIGINT AS total_count,
+               COUNT(*){distinct_filter} AS distinct_count,
+               max_by("{column_name}", row_count, 10) FILTER (WHERE row_count > 1) AS sample_violations
+        FROM (
+            SELECT {key_columns_str}, COUNT(*) AS row_count
+            FROM "{table_name}"
+            GROUP BY {key_columns_str}
+        );
     """
     
     LOGGER.debug(f"Executing DISTINCT check query: {check_query}")
-    total_count, distinct_count = con.execute(check_query).fetchone()
+    total_count, distinct_count, sample_violations = con.execute(check_query).fetchone()
+    total_count = total_count or 0
     violation_count = total_count - distinct_count
     if violation_count > 0:
-        LOGGER.debug(f"Executing sample query for DISTINCT violations: {sample_query}")
-        con.execute(sample_query)
-        sample_violations_str = ', '.join([str(row[0]) for row in con.fetchall()])
+        sample_violations_str = ', '.join([str(value) for value in sample_violations or []])
         violation_pct = 1.0 * violation_count / total_count
         result = CheckResult(
             check_type='distinct_violation',
@@ -80,6 +131,7 @@ def check_distinct_violation(
             violation_pct=violation_pct,
             threshold=threshold,
             troubleshooting_message = f'The column "{column_name}" in table "{table_name}" has {violation_count} non-distinct values out of {total_count} total values ({violation_pct:.2%}). Sample non-distinct values: {sample_violations_str}. Please ensure this column contains only distinct values.',
+            **PersonSample.get_check_kwargs(table_name, violation_count, total_count)
         )
     else:
         result = CheckResult(
@@ -87,6 +139,7 @@ def check_distinct_violation(
             status='PASS',
             table_name=table_name,
             column_name=column_name,
+            **PersonSample.get_check_kwargs(table_name, violation_count, total_count)
         )
     result.log(LOGGER, duckdb_conn=con)
     return result
\ No newline at end of file
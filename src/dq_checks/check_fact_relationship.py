@@ -1,5 +1,7 @@
 from src.dq_checks.check_result import CheckResult
+from src.process_log import ProcessLog
 from duckdb import DuckDBPyConnection
+from typing import List
 from src.util import table_exists, column_exists
 from src.config import LOGGER
 
@@ -14,12 +16,19 @@ FACT_RELATIONSHIP_DOMAIN_CONCEPT_ID_TO_CDM_MAPPING = {
     10: {"table_name": "procedure_occurrence", "column_name": "procedure_occurrence_id"},
 }
 
+@ProcessLog.trace()
 def check_fact_relationship(
     con: DuckDBPyConnection,
     skip_tables: list = None
-) -> CheckResult:
+) -> List[CheckResult]:
     """
     Check fact_ids in fact_relationship table exist in the corresponding domain tables.
+
+    Both sides of fact_relationship are unpivoted in a single scan, and anti-joined against the ids of all domain
+    tables in one plan, which also samples the missing fact ids. One CheckResult is logged per domain_concept_id.
+
+    Returns:
+    - List[CheckResult]: Results of the check, one per domain_concept_id not in skip_tables.
     """
     if not table_exists(con, 'fact_relationship'):
         result = CheckResult(
@@ -28,7 +37,7 @@ def check_fact_relationship(
             troubleshooting_message=f'Table fact_relationship does not exist in the database.'
         )
         result.log(LOGGER, duckdb_conn=con)
-        return result
+        return [result]
     if not column_exists(con, 'fact_relationship', 'domain_concept_id_1') or not column_exists(con, 'fact_relationship', 'domain_concept_id_2') or not column_exists(con, 'fact_relationship', 'fact_id_1') or not column_exists(con, 'fact_relationship', 'fact_id_2'):
         result = CheckResult(
             check_type='fact_relationship_violation',
@@ -36,7 +45,9 @@ def check_fact_relationship(
             troubleshooting_message=f'One or more required columns (domain_concept_id_1, domain_concept_id_2, fact_id_1, fact_id_2) do not exist in fact_relationship table.'
         )
         result.log(LOGGER, duckdb_conn=con)
-        return result
+        return [result]
+    results = []
+    domain_mappings = dict()
     for domain_concept_id, mapping in FACT_RELATIONSHIP_DOMAIN_CONCEPT_ID_TO_CDM_MAPPING.items():
         if skip_tables and mapping["table_name"] in skip_tables:
             continue
@@ -51,18 +62,69 @@ def check_fact_relationship(
                 troubleshooting_message=f'Column {column_name} does not exist in table {table_name}.'
             )
             result.log(LOGGER, duckdb_conn=con)
+            results.append(result)
             continue
-        fact1_total_count_query = f"""
-            SELECT COUNT(*) AS total_count
-            FROM fact_relationship
-            WHERE domain_concept_id_1 = {domain_concept_id}
-        """
-        fact2_total_count_query = f"""
-            SELECT COUNT(*) AS total_count
-            FROM fact_relationship
-            WHERE domain_concept_id_2 = {domain_concept_id}
-        """
-        total_fact_count = con.execute(fact1_total_count_query).fetchone()[0] + con.execute(fact2_total_count_query).fetchone()[0]
+        domain_mappings[domain_concept_id] = mapping
+    if not domain_mappings:
+        return results
+
+    # domain_concept_id is cast to INTEGER to match the integer keys of FACT_RELATIONSHIP_DOMAIN_CONCEPT_ID_TO_CDM_MAPPING.
+    # Only the domain tables of the domains with facts are scanned, the other domains are SKIPPED below
+    fact_domain_concept_ids = {item[0] for item in con.execute(
+        "SELECT DISTINCT UNNEST([domain_concept_id_1::INTEGER, domain_concept_id_2::INTEGER]) FROM fact_relationship"
+    ).fetchall()}
+    fact_domain_mappings = {domain_concept_id: mapping for domain_concept_id, mapping in domain_mappings.items() if domain_concept_id in fact_domain_concept_ids}
+
+    domain_concept_ids_str = ', '.join(str(domain_concept_id) for domain_concept_id in fact_domain_mappings)
+    # both sides of fact_relationship, unpivoted in a single scan: one row per (side, domain_concept_id, fact_id)
+    facts_query = f"""
+        SELECT UNNEST([1, 2]) AS side,
+            UNNEST([domain_concept_id_1::INTEGER, domain_concept_id_2::INTEGER]) AS domain_concept_id,
+            UNNEST([fact_id_1, fact_id_2]) AS fact_id
+        FROM fact_relationship
+    """
+    # ids of the domain tables with facts, tagged with their domain_concept_id. DISTINCT so that duplicate ids do not duplicate facts
+    keys_query = '\n            UNION ALL\n            '.join(
+        f'SELECT DISTINCT {domain_concept_id}::INTEGER AS domain_concept_id, "{mapping["column_name"]}" AS fact_id FROM "{mapping["table_name"]}"'
+        for domain_concept_id, mapping in fact_domain_mappings.items()
+    )
+    missing_facts_query = f"""
+        SELECT f.side, f.domain_concept_id, f.fact_id, k.fact_id IS NULL AS missing
+        FROM ({facts_query}) f
+        LEFT JOIN (
+            {keys_query}
+        ) k
+            ON f.domain_concept_id = k.domain_concept_id
+            AND f.fact_id = k.fact_id
+        WHERE f.domain_concept_id IN ({domain_concept_ids_str})
+    """
+    # counts and the 10 most frequent missing fact ids of each side, in the same aggregate. NULL fact ids are sampled as 'NULL'
+    check_query = f"""
+        SELECT domain_concept_id,
+            COUNT(*) AS total_count,
+            COUNT(*) FILTER (WHERE side = 1 AND missing) AS fact1_bad_count,
+            COUNT(*) FILTER (WHERE side = 2 AND missing) AS fact2_bad_count,
+            approx_top_k(COALESCE(fact_id::VARCHAR, 'NULL'), 10) FILTER (WHERE side = 1 AND missing) AS fact1_sample,
+            approx_top_k(COALESCE(fact_id::VARCHAR, 'NULL'), 10) FILTER (WHERE side = 2 AND missing) AS fact2_sample
+        FROM ({missing_facts_query})
+        GROUP BY domain_concept_id
+    """
+    LOGGER.debug(f"Executing fact_relationship check query: {check_query}")
+    fact_counts = dict()
+    sample_bad_records = dict()
+    check_rows = con.execute(check_query).fetchall() if fact_domain_mappings else []
+    for domain_concept_id, total_count, fact1_bad_count, fact2_bad_count, fact1_sample, fact2_sample in check_rows:
+        fact_counts[domain_concept_id] = (total_count, fact1_bad_count, fact2_bad_count)
+        # fact_id_1 is sampled if any fact_id_1 is missing, otherwise fact_id_2
+        if fact1_bad_count > 0:
+            sample_bad_records[domain_concept_id] = [f"fact_id_1={fact_id}" for fact_id in fact1_sample]
+        elif fact2_bad_count > 0:
+            sample_bad_records[domain_concept_id] = [f"fact_id_2={fact_id}" for fact_id in fact2_sample]
+
+    for domain_concept_id, mapping in domain_mappings.items():
+        table_name = mapping["table_name"]
+        column_name = mapping["column_name"]
+        total_fact_count, fact1_bad_count, fact2_bad_count = fact_counts.get(domain_concept_id, (0, 0, 0))
         if total_fact_count == 0:
             result = CheckResult(
                 check_type='fact_relationship_violation',
@@ -72,62 +134,9 @@ def check_fact_relationship(
                 troubleshooting_message=f'No records in fact_relationship table with domain_concept_id_1 or domain_concept_id_2 = {domain_concept_id}.'
             )
             result.log(LOGGER, duckdb_conn=con)
+            results.append(result)
             continue
-        
-        check_count_fact1_query = f"""
-            SELECT COUNT(*) AS missing_count
-            FROM fact_relationship f
-            LEFT JOIN
-            {table_name} t
-            ON 
-                f.fact_id_1 = t.{column_name}
-            WHERE f.domain_concept_id_1 = {domain_concept_id}
-            AND t.{column_name} IS NULL
-        """
-        check_count_fact2_query = f"""
-            SELECT COUNT(*) AS missing_count
-            FROM fact_relationship f
-            LEFT JOIN
-            {table_name} t
-            ON 
-                f.fact_id_2 = t.{column_name}
-            WHERE f.domain_concept_id_2 = {domain_concept_id}
-            AND t.{column_name} IS NULL
-        """
-        fact1_bad_count = con.execute(check_count_fact1_query).fetchone()[0]
-        fact2_bad_count = con.execute(check_count_fact2_query).fetchone()[0]
-        # get sample of bad records for troubleshooting message
-        sample_bad_records = []
-        if fact1_bad_count > 0:
-            fact1_sample_query = f"""
-                SELECT DISTINCT f.fact_id_1
-                FROM fact_relationship f
-                LEFT JOIN
-                {table_name} t
-                ON 
-                    f.fact_id_1 = t.{column_name}
-                WHERE f.domain_concept_id_1 = {domain_concept_id}
-                AND t.{column_name} IS NULL
-                LIMIT 10
-            """
-            fact1_sample = con.execute(fact1_sample_query).fetchall()
-            sample_bad_records += [f"fact_id_1={row[0]}" for row in fact1_sample]
-        elif fact2_bad_count > 0:
-            fact2_sample_query = f"""
-                SELECT DISTINCT f.fact_id_2
-                FROM fact_relationship f
-                LEFT JOIN
-                {table_name} t
-                ON 
-                    f.fact_id_2 = t.{column_name}
-                WHERE f.domain_concept_id_2 = {domain_concept_id}
-                AND t.{column_name} IS NULL
-                LIMIT 10
-            """
-            fact2_sample = con.execute(fact2_sample_query).fetchall()
-            sample_bad_records += [f"fact_id_2={row[0]}" for row in fact2_sample]
-        
-        
+
         total_bad_count = fact1_bad_count + fact2_bad_count
         if total_bad_count > 0:
             total_bad_percent = 1.0 * total_bad_count / total_fact_count
@@ -137,7 +146,7 @@ def check_fact_relationship(
                 table_name=table_name,
                 column_name=column_name,
                 violation_pct=total_bad_percent,
-                troubleshooting_message=f'There are {total_bad_count} records in fact_relationship table with domain_concept_id_1 or domain_concept_id_2 = {domain_concept_id} that do not have matching records in {table_name} table. This accounts for {total_bad_percent:.2%} of total {total_fact_count} records with this domain_concept_id in fact_relationship. Sample bad records: {", ".join(sample_bad_records)}. Please ensure all fact_ids in fact_relationship have corresponding records in the domain tables.',
+                troubleshooting_message=f'There are {total_bad_count} records in fact_relationship table with domain_concept_id_1 or domain_concept_id_2 = {domain_concept_id} that do not have matching records in {table_name} table. This accounts for {total_bad_percent:.2%} of total {total_fact_count} records with this domain_concept_id in fact_relationship. Sample bad records: {", ".join(sample_bad_records[domain_concept_id])}. Please ensure all fact_ids in fact_relationship have corresponding records in the domain tables.',
             )
         else:
             result = CheckResult(
@@ -148,4 +157,6 @@ def check_fact_relationship(
                 violation_pct=0.0,
                 troubleshooting_message=f'All fact_ids in fact_relationship table with domain_concept_id_1 or domain_concept_id_2 = {domain_concept_id} have matching records in {table_name} table.',
             )
-        result.log(LOGGER, duckdb_conn=con)
\ No newline at end of file
+        result.log(LOGGER, duckdb_conn=con)
+        results.append(result)
+    return results
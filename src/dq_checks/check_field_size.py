@@ -0,0 +1,146 @@
+from src.dq_checks.check_result import CheckResult
+from src.process_log import ProcessLog
+from src.util import table_exists, column_exists, get_threshold
+from src.config import LOGGER
+from src.data_model import DEFAULT_STRING_LENGTH, DEFAULT_NUMERIC_SCALE
+from duckdb import DuckDBPyConnection
+from typing import Dict, List
+
+STRING_TYPES = ('string',)  # data model types created as VARCHAR(length), the length is a number of characters
+NUMERIC_TYPES = ('number', 'decimal', 'float', 'integer', 'biginteger')  # data model types whose precision and scale are digits
+DECIMAL_TYPES = ('number', 'decimal')  # numeric types created as DECIMAL(precision, scale)
+
+def get_size_columns(data_model) -> Dict[str, Dict[str, dict]]:
+    """
+    Get the columns of the data model with a size: string columns, with their declared length or the default VARCHAR
+    length of DataModel.to_duckdb_ddl, and numeric columns with a declared precision. A scale of 0 of a decimal column is
+    not declared: the column is created with the default scale of DataModel.to_duckdb_ddl and holds decimals.
+
+    Returns:
+    - Dict[str, Dict[str, dict]]: a dict of {table_name: {column_name: {'type', 'length', 'precision', 'scale'}}}.
+    """
+    size_columns = dict()
+    for table_item in data_model.data['tables']:
+        for field_item in table_item['fields']:
+            if field_item['type'] in STRING_TYPES or (field_item['type'] in NUMERIC_TYPES and field_item.get('precision')):
+                size_columns.setdefault(table_item['name'], dict())[field_item['name']] = {
+                    'type': field_item['type'],
+                    'length': field_item.get('length') or (DEFAULT_STRING_LENGTH if field_item['type'] in STRING_TYPES else 0),
+                    'precision': field_item.get('precision') or 0,
+                    'scale': field_item.get('scale') or (DEFAULT_NUMERIC_SCALE if field_item['type'] in DECIMAL_TYPES else 0),
+                }
+    return size_columns
+
+def _field_size_filter(column_name: str, field: dict) -> str:
+    """
+    Get the SQL predicate of the values of a column exceeding its declared size: more characters than the length of a
+    string, more integer digits (precision - scale) or more decimals (scale) than a number. Decimals are not limited
+    for a scale of 0 (integer columns, and float columns without a declared scale).
+    """
+    if field['type'] in STRING_TYPES:
+        return f'length("{column_name}"::VARCHAR) > {field["length"]}'
+    integer_digits = field['precision'] - field['scale']
+    if not field['scale']:
+        return f'abs("{column_name}") >= 1e{integer_digits}'
+    return f'(abs("{column_name}") >= 1e{integer_digits} OR "{column_name}" <> round("{column_name}", {field["scale"]}))'
+
+def _field_size_str(field: dict) -> str:
+    """
+    Describe the declared size of a column, e.g. '50 characters'.
+    """
+    if field['type'] in STRING_TYPES:
+        return f'{field["length"]} characters'
+    return f'precision {field["precision"]}, scale {field["scale"]}'
+
+@ProcessLog.trace()
+def check_field_sizes(
+    con: DuckDBPyConnection,
+    table_name: str,
+    fields: Dict[str, dict]
+) -> List[CheckResult]:
+    """
+    Check that the values of a table fit the column sizes of the data model, in one aggregate scan of the table.
+    Column types of the database do not enforce them: DuckDB ignores VARCHAR lengths, and integer and float columns are
+    created without their declared precision (see DataModel.to_duckdb_ddl). Values exceeding the sizes would be
+    truncated or rejected by databases enforcing them.
+
+    - String columns: values with more characters than the declared length. The longest value length is reported.
+    - Numeric columns: values with more integer digits than precision - scale, or more decimals than scale.
+      The 5 most frequent exceeding values are sampled.
+
+    Parameters:
+    - con: DuckDBPyConnection, a duckdb connection.
+    - table_name: str, the name of the table to check.
+    - fields: Dict[str, dict], a dict of {column_name: {'type', 'length', 'precision', 'scale'}}, see get_size_columns.
+
+    Returns:
+    - List[CheckResult]: Results of the checks, one per column in the order of fields.
+    """
+    if not table_exists(con, table_name):
+        results = [CheckResult(
+            check_type='field_size_violation',
+            table_name=table_name,
+            column_name=column_name,
+            status='SKIPPED',
+            troubleshooting_message=f'Table {table_name} does not exist in the database.'
+        ) for column_name in fields]
+        for result in results:
+            result.log(LOGGER, duckdb_conn=con)
+        return results
+
+    existing_columns = [column_name for column_name in fields if column_exists(con, table_name, column_name)]
+    column_counts = dict()  # a dict of {column_name: (violation count, longest length or sample values)}
+    if existing_columns:
+        aggregates = []
+        for column_name in existing_columns:
+            violation_filter = _field_size_filter(column_name, fields[column_name])
+            if fields[column_name]['type'] in STRING_TYPES:
+                detail = f'max(length("{column_name}"::VARCHAR))'
+            else:
+                detail = f'approx_top_k("{column_name}", 5) FILTER (WHERE {violation_filter})'
+            aggregates.append(f'COUNT(*) FILTER (WHERE {violation_filter}), {detail}')
+        check_query = f"""
+            SELECT COUNT(*),
+                {', '.join(aggregates)}
+            FROM "{table_name}";
+        """
+        LOGGER.debug(f"Executing field size check query: {check_query}")
+        total_count, *counts = con.execute(check_query).fetchone()
+        for i, column_name in enumerate(existing_columns):
+            column_counts[column_name] = (counts[2 * i], counts[2 * i + 1])
+
+    results = []
+    for column_name, field in fields.items():
+        if column_name not in column_counts:
+            result = CheckResult(
+                check_type='field_size_violation',
+                table_name=table_name,
+                column_name=column_name,
+                status='SKIPPED',
+                troubleshooting_message=f'Column {column_name} does not exist in table {table_name}.'
+            )
+        elif column_counts[column_name][0] > 0:
+            violation_count, detail = column_counts[column_name]
+            if field['type'] in STRING_TYPES:
+                detail_str = f'Longest value: {detail} characters.'
+            else:
+                detail_str = f'Sample exceeding values: {", ".join(str(value) for value in detail)}'
+            result = CheckResult(
+                check_type='field_size_violation',
+                table_name=table_name,
+                column_name=column_name,
+                violation_pct=1.0 * violation_count / total_count,
+                threshold=get_threshold('field_size_violation', table_name=table_name, column_name=column_name),
+                troubleshooting_message=f'Found {violation_count} values exceeding the declared size ({_field_size_str(field)}) of {table_name}.{column_name}. Total rows in {table_name}: {total_count}. {detail_str}',
+                declared_size=_field_size_str(field)
+            )
+        else:
+            result = CheckResult(
+                check_type='field_size_violation',
+                table_name=table_name,
+                column_name=column_name,
+                status='PASS',
+            )
+        result.log(LOGGER, duckdb_conn=con)
+        results.append(result)
+    return results
@@ -2,44 +2,51 @@ from __future__ import annotations
 import os
 from typing import Tuple, List, Set
 from src.dq_checks.check_result import CheckResult
+from src.process_log import ProcessLog
 from src.config import LOGGER
 from src.constants import OPTIONAL_TABLES
+from src.util import strip_csv_extension, CSV_FILE_EXTENSIONS
 
 def _get_table_names_from_files(
         file_dir: str,
         file_format: str,
-        multiple_file_per_table: bool
+        multiple_file_per_table: bool,
+        manifest = None
     ) -> Set[str]:
     """
     Helper function to get table names from files in the directory.
     Parameters:
         file_dir (str): Path to the directory containing submission files.
         file_format (str): file format, either 'csv' or 'parquet'.
-        multiple_file_per_table (bool): whether each table can have multiple files. If True, will check if there's a folder named after the table. If False, will check for single file named {table_name}.[csv/parquet] depending on file type.
+        multiple_file_per_table (bool): whether each table can have multiple files. If True, will check if there's a folder named after the table. If False, will check for single file named {table_name}.[csv/csv.gz/csv.zst/parquet] depending on file type.
+        manifest (SubmissionManifest): Optional scanned submission files. If provided, table names are read from the manifest instead of listing the directory.
     Returns:
         Set[str]: Set of table names derived from the files in the directory.
     """
     table_names = set()
-    if not multiple_file_per_table:
+    if manifest is not None:
+        table_names = manifest.table_names()
+    elif not multiple_file_per_table:
         if file_format == 'csv':
-            file_extension = '.csv'
+            table_names = {strip_csv_extension(f) for f in os.listdir(file_dir) if f.endswith(CSV_FILE_EXTENSIONS)}
         elif file_format == 'parquet':
-            file_extension = '.parquet'
+            table_names = {os.path.splitext(f)[0] for f in os.listdir(file_dir) if f.endswith('.parquet')}
         else:
             raise ValueError(f"Unsupported file_format: {file_format}. Supported types are 'csv' and 'parquet'.")
-        table_names = {os.path.splitext(f)[0] for f in os.listdir(file_dir) if f.endswith(file_extension)}
     else:
         dir_names_on_dir = [d for d in os.listdir(file_dir) if os.path.isdir(os.path.join(file_dir, d))]
         table_names = set(dir_names_on_dir)
     LOGGER.info(f"Table names found from files: {table_names}")
     return table_names
 
+@ProcessLog.trace(category='file_check', count_table_rows=False)
 def check_missing_submission_file(
         file_dir: str, 
         cdm_tables_expected: Tuple[str, ...],
         file_format: str = 'csv',
         multiple_file_per_table: bool = False,
-        duckdb_conn = None
+        duckdb_conn = None,
+        manifest = None
     ) -> CheckResult:
     """
     Check if the directory misses any expected CSV files for each CDM table.
@@ -49,6 +56,7 @@ def check_missing_submission_file(
         cdm_tables_expected (Tuple[str, ...]): Tuple of expected CDM table names (without file extension).
         file_format (str): file format, either 'csv' or 'parquet'. Default to 'csv'.
         multiple_file_per_table (bool): whether each table can have multiple files. If True, will check if there's a folder named after the table. If False, will check for single file named {table_name}.[csv/parquet] depending on file type. Default to False.
+        manifest (SubmissionManifest): Optional scanned submission files. If provided, table names are read from the manifest instead of listing the directory.
     Returns:
         CheckResult
     """
@@ -66,7 +74,8 @@ def check_missing_submission_file(
     table_names_from_files = _get_table_names_from_files(
         file_dir = file_dir,
         file_format = file_format,
-        multiple_file_per_table = multiple_file_per_table
+        multiple_file_per_table = multiple_file_per_table,
+        manifest = manifest
     )
     missing_tables = set(cdm_tables_expected) - set(table_names_from_files) - set(OPTIONAL_TABLES)
     if len(missing_tables) > 0:
@@ -84,12 +93,14 @@ def check_missing_submission_file(
     result.log(LOGGER, duckdb_conn=duckdb_conn)
     return(result)
 
+@ProcessLog.trace(category='file_check', count_table_rows=False)
 def check_extra_submission_file(
         file_dir: str, 
         cdm_tables_expected: Tuple[str, ...],
         file_format: str = 'csv',
         multiple_file_per_table: bool = False,
-        duckdb_conn = None
+        duckdb_conn = None,
+        manifest = None
     ) -> CheckResult:
     """
     Check if the directory contains extra CSV files for each CDM table.
@@ -99,6 +110,7 @@ def check_extra_submission_file(
         cdm_tables_expected (Tuple[str, ...]): Tuple of expected CDM table names (without file extension).
         file_format (str): file format, either 'csv' or 'parquet'. Default to 'csv'.
         multiple_file_per_table (bool): whether each table can have multiple files. If True, will check if there's a folder named after the table. If False, will check for single file named {table_name}.[csv/parquet] depending on file type. Default to False.
+        manifest (SubmissionManifest): Optional scanned submission files. If provided, table names are read from the manifest instead of listing the directory.
 
     Returns:
         CheckResult
@@ -117,7 +129,8 @@ def check_extra_submission_file(
     filenames_from_tables = _get_table_names_from_files(
         file_dir = file_dir,
         file_format = file_format,
-        multiple_file_per_table = multiple_file_per_table
+        multiple_file_per_table = multiple_file_per_table,
+        manifest = manifest
     )
     extra_files = set(filenames_from_tables) - set(filenames_from_tables)
     if len(extra_files) > 0:
@@ -1,17 +1,23 @@
 
 from src.dq_checks.check_result import CheckResult
-from src.util import get_table_count, table_exists, column_exists, get_threshold
+from src.process_log import ProcessLog
+from src.util import table_exists, column_exists, get_threshold, get_table_count, count_violations_until_fail
 from src.config import LOGGER
+from src.catalog_cache import CatalogCache
+from src.person_sample import PersonSample
 from duckdb import DuckDBPyConnection
-from typing import Optional
+from typing import Optional, List, Dict, Tuple
+import threading
 
+@ProcessLog.trace()
 def check_fk_violation(
     con: DuckDBPyConnection,
     main_table: str,
     main_column: str,
     reference_table: str,
     reference_column: str,
-    threshold: Optional[dict[str, float] ]= None
+    threshold: Optional[dict[str, float] ]= None,
+    fail_fast: bool = False
 ) -> CheckResult:
     """
     Check for foreign key violations in the specified tables and columns.
@@ -22,6 +28,8 @@ def check_fk_violation(
     - main_column: str, the column in the main table that should reference the reference table.
     - reference_table: str, the name of the reference table.
     - reference_column: str, the column in the reference table that is referenced by the main column.
+    - fail_fast: bool, stop counting violations once they are enough to fail the check, the result then records a lower
+      bound of the violation rate. Defaults to False.
 
     Returns:
     - dict: A dictionary with keys 'status' and 'message'.
@@ -70,34 +78,39 @@ def check_fk_violation(
             reference_column=reference_column
         )
     else:
-        # Check for foreign key violations
-        check_query = f"""
-            SELECT COUNT(*)
-            FROM "{main_table}" AS m
-            LEFT JOIN "{reference_table}" AS r
-                ON m."{main_column}" = r."{reference_column}" 
-            WHERE  
-                r."{reference_column}" IS NULL AND
-                m."{main_column}" IS NOT NULL;
-        """
-        sample_query = f"""
-            SELECT DISTINCT m."{main_column}"
-            FROM "{main_table}" AS m
-            LEFT JOIN "{reference_table}" AS r
-                ON m."{main_column}" = r."{reference_column}" 
-            WHERE  
-                r."{reference_column}" IS NULL AND
-                m."{main_column}" IS NOT NULL
-            LIMIT 5;
-            """
-        LOGGER.debug(f"Executing foreign key check query: {check_query}")
-        violation_count = con.execute(check_query).fetchone()[0]    
-        if violation_count > 0:
-            LOGGER.debug(f"Executing sample query for foreign key violations: {sample_query}")
-            con.execute(sample_query)
-            sample_violations_str = ', '.join([str(row[0]) for row in con.fetchall()])
-
+        # Check for foreign key violations. The violation count, the 5 most frequent violating values and the row count
+        # of the main table are computed in one query. Distinct reference keys, so duplicate keys do not duplicate rows
+        violation_filter = f'm."{main_column}" IS NOT NULL AND r.key IS NULL'
+        from_sql = f""""{main_table}" AS m
+            LEFT JOIN (
+                SELECT DISTINCT "{reference_column}" AS key
+                FROM "{reference_table}"
+            ) AS r
+                ON m."{main_column}" = r.key"""
+        fail_count = None
+        early_exit = False
+        if fail_fast:
             total_count = get_table_count(con, main_table)
+            fail_count = CheckResult.get_fail_count(threshold, total_count)
+        if fail_count is not None:
+            counts, samples, lower_bounds = count_violations_until_fail(
+                con, from_sql, {main_column: violation_filter}, {main_column: fail_count}, {main_column: f'm."{main_column}"'}
+            )
+            violation_count, sample_violations = counts[main_column], samples[main_column]
+            early_exit = main_column in lower_bounds
+        else:
+            check_query = f"""
+                SELECT COUNT(*) AS total_count,
+                    COUNT(*) FILTER (WHERE {violation_filter}) AS violation_count,
+                    approx_top_k(m."{main_column}", 5) FILTER (WHERE {violation_filter}) AS sample_violations
+                FROM {from_sql};
+            """
+            LOGGER.debug(f"Executing foreign key check query: {check_query}")
+            total_count, violation_count, sample_violations = con.execute(check_query).fetchone()
+        if early_exit:
+            result = _fk_early_exit_result(main_table, main_column, reference_table, reference_column, violation_count, total_count, sample_violations, threshold)
+        elif violation_count > 0:
+            sample_violations_str = ', '.join([str(value) for value in sample_violations])
             result = CheckResult(
                 check_type='foreign_key_violation',
                 table_name=main_table,
@@ -106,7 +119,8 @@ def check_fk_violation(
                 threshold = threshold,
                 troubleshooting_message=f'Found {violation_count} foreign key violations in {main_table}.{main_column} referencing {reference_table}.{reference_column}. Total rows in {main_table}: {total_count}.\nSample violating values: {sample_violations_str}',
                 reference_table=reference_table,
-                reference_column=reference_column
+                reference_column=reference_column,
+                **PersonSample.get_check_kwargs(main_table, violation_count, total_count)
             )
         else:
             result = CheckResult(
@@ -115,8 +129,257 @@ def check_fk_violation(
                 column_name=main_column,
                 status='PASS',
                 reference_table=reference_table,
-                reference_column=reference_column
+                reference_column=reference_column,
+                **PersonSample.get_check_kwargs(main_table, violation_count, total_count)
             )
             
     result.log(LOGGER, duckdb_conn=con)
     return result
+
+def _fk_early_exit_result(
+    main_table: str,
+    main_column: str,
+    reference_table: str,
+    reference_column: str,
+    violation_count: int,
+    total_count: int,
+    sample_violations: list,
+    threshold: dict[str, float]
+) -> CheckResult:
+    """
+    Build the FAIL CheckResult of a foreign key check whose count stopped once the check failed, violation_count is a lower bound.
+    """
+    sample_violations_str = ', '.join([str(value) for value in sample_violations])
+    return CheckResult(
+        check_type='foreign_key_violation',
+        table_name=main_table,
+        column_name=main_column,
+        status='FAIL',
+        violation_pct=1.0 * violation_count / total_count,
+        threshold=threshold,
+        troubleshooting_message=f'Found at least {violation_count} foreign key violations in {main_table}.{main_column} referencing {reference_table}.{reference_column} (counting stopped once the check failed). Total rows in {main_table}: {total_count}.\nSample violating values: {sample_violations_str}',
+        reference_table=reference_table,
+        reference_column=reference_column,
+        early_exit=True
+    )
+
+class ReferenceKeySets:
+    """
+    Distinct non-NULL keys of referenced columns (e.g. person.person_id), used by check_fk_violations.
+    Each key set is built once, on first use, as a table, then probed by every foreign key referencing it.
+    Call drop() when the foreign key checks are done.
+
+    Key sets are temporary tables of the connection by default. Temporary tables are not visible to other cursors,
+    so when the checks run on several cursors (see CheckScheduler), set schema to build them as tables of that schema.
+
+    Parameters:
+        con (DuckDBPyConnection): the duckdb connection the foreign key checks run on.
+        schema (Optional[str]): schema of the key set tables. Defaults to None, temporary tables.
+
+    Example:
+        key_sets = ReferenceKeySets(con)
+        check_fk_violations(con, 'visit_occurrence', [('person_id', 'person', 'person_id')], key_sets=key_sets)
+        key_sets.drop()
+    """
+
+    def __init__(self, con: DuckDBPyConnection, schema: Optional[str] = None):
+        self.con = con
+        self.schema = schema
+        self.key_tables: Dict[Tuple[str, str], str] = dict()  # a dict of {(reference_table, reference_column): key table}
+        self._key_locks: Dict[Tuple[str, str], threading.Lock] = dict()
+        self._lock = threading.Lock()
+        if schema:
+            con.execute(f"CREATE SCHEMA IF NOT EXISTS {schema};")
+
+    def get(self, reference_table: str, reference_column: str, con: Optional[DuckDBPyConnection] = None) -> str:
+        """
+        Get the table holding the distinct keys of reference_table.reference_column, in column "key", building it if needed.
+        The returned name is quoted and ready to use in a query.
+
+        Parameters:
+            reference_table (str): the referenced table.
+            reference_column (str): the referenced column.
+            con (Optional[DuckDBPyConnection]): connection (cursor) used to build the key set. Defaults to the connection of the key sets.
+        """
+        key = (reference_table, reference_column)
+        with self._lock:
+            if key in self.key_tables:
+                return self.key_tables[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # one build per key set, key sets of other columns are built at the same time
+        with key_lock:
+            if key not in self.key_tables:
+                if self.schema:
+                    key_table = f'{self.schema}."{reference_table}_{reference_column}"'
+                    create_sql = f"CREATE OR REPLACE TABLE {key_table}"
+                else:
+                    key_table = f'"fk_keys_{reference_table}_{reference_column}"'
+                    create_sql = f"CREATE OR REPLACE TEMP TABLE {key_table}"
+                with ProcessLog(f"build key set {reference_table}.{reference_column}", category='check', table_name=reference_table):
+                    (con or self.con).execute(f"""
+                        {create_sql} AS
+                        SELECT DISTINCT "{reference_column}" AS key
+                        FROM "{reference_table}"
+                        WHERE "{reference_column}" IS NOT NULL;
+                    """)
+                if self.schema:
+                    CatalogCache.invalidate()
+                with self._lock:
+                    self.key_tables[key] = key_table
+        return self.key_tables[key]
+
+    def build(self, con: DuckDBPyConnection, reference_table: str, reference_column: str) -> str:
+        """
+        Build the key set of reference_table.reference_column, e.g. as a CheckScheduler task. Same as get().
+        """
+        return self.get(reference_table, reference_column, con=con)
+
+    def drop(self):
+        """
+        Drop all key set tables.
+        """
+        for key_table in self.key_tables.values():
+            self.con.execute(f'DROP TABLE IF EXISTS {key_table};')
+        if self.schema:
+            self.con.execute(f"DROP SCHEMA IF EXISTS {self.schema};")
+            CatalogCache.invalidate()
+        self.key_tables = dict()
+        self._key_locks = dict()
+
+@ProcessLog.trace()
+def check_fk_violations(
+    con: DuckDBPyConnection,
+    main_table: str,
+    foreign_keys: List[Tuple[str, str, str]],
+    key_sets: Optional[ReferenceKeySets] = None,
+    thresholds: Optional[Dict[str, dict[str, float]]] = None,
+    skip_tables: list = None,
+    fail_fast: bool = False
+) -> List[CheckResult]:
+    """
+    Check all foreign keys of a table in a single scan of the table. Each foreign key column is probed against the distinct
+    keys of its referenced column (see ReferenceKeySets), with one COUNT(*) FILTER aggregate per foreign key.
+    The most frequent violating values of each foreign key are sampled by the same scan.
+
+    Produces the same CheckResults as calling check_fk_violation for each foreign key.
+
+    Parameters:
+    - con: DuckDBPyConnection, a duckdb connection.
+    - main_table: str, the name of the main table to check.
+    - foreign_keys: List[Tuple[str, str, str]], a list of (main_column, reference_table, reference_column).
+    - key_sets: Optional[ReferenceKeySets], key sets shared by the checks of all tables. If not provided, key sets are built and dropped by this call.
+    - thresholds: Optional[Dict[str, dict[str, float]]], a dict of {main_column: threshold}. Defaults to the 'foreign_key_violation' thresholds.
+    - skip_tables: list, tables not to check, e.g. tables that failed to load. Foreign keys of a main table or referencing a table in the list
+      are not checked and have no result. The list is read when the check runs, so it can be filled while the checks are scheduled.
+    - fail_fast: bool, stop the scan once the violations found are enough to fail the check of a foreign key (see
+      count_violations_until_fail), the result then records a lower bound of the violation rate. Defaults to False.
+
+    Returns:
+    - List[CheckResult]: Results of the foreign key checks, in the order of foreign_keys.
+    """
+    if skip_tables:
+        if main_table in skip_tables:
+            return []
+        foreign_keys = [foreign_key for foreign_key in foreign_keys if foreign_key[1] not in skip_tables]
+    thresholds = thresholds or dict()
+    own_key_sets = key_sets is None
+    if own_key_sets:
+        key_sets = ReferenceKeySets(con)
+    results = [None] * len(foreign_keys)
+    probes = []  # a list of (index in foreign_keys, key table)
+    for i, (main_column, reference_table, reference_column) in enumerate(foreign_keys):
+        skip_message = None
+        if not table_exists(con, main_table):
+            skip_message = f'Main table {main_table} does not exist in the database.'
+        elif not table_exists(con, reference_table):
+            skip_message = f'Reference table {reference_table} does not exist in the database.'
+        elif not column_exists(con, main_table, main_column):
+            skip_message = f'Main column {main_column} does not exist in the main table {main_table}.'
+        elif not column_exists(con, reference_table, reference_column):
+            skip_message = f'Reference column {reference_column} does not exist in the reference table {reference_table}.'
+        if skip_message:
+            results[i] = CheckResult(
+                check_type='foreign_key_violation',
+                table_name=main_table,
+                column_name=main_column,
+                status='SKIPPED',
+                troubleshooting_message=skip_message,
+                reference_table=reference_table,
+                reference_column=reference_column
+            )
+        else:
+            probes.append((i, key_sets.get(reference_table, reference_column, con=con)))
+
+    try:
+        if probes:
+            # one scan of the main table, one hash join probe per foreign key.
+            # Violation count and the 5 most frequent violating values of each foreign key come from the same aggregate
+            violation_filters = [f'm."{foreign_keys[i][0]}" IS NOT NULL AND k{j}.key IS NULL' for j, (i, _) in enumerate(probes)]
+            probe_thresholds = [thresholds.get(foreign_keys[i][0]) or get_threshold('foreign_key_violation', table_name=main_table, column_name=foreign_keys[i][0]) for i, _ in probes]
+
+            def get_from_sql(probe_indexes) -> str:
+                # the main table joined to the key sets of the given probes
+                return f'"{main_table}" AS m ' + ' '.join(f'LEFT JOIN {probes[j][1]} AS k{j} ON m."{foreign_keys[probes[j][0]][0]}" = k{j}.key' for j in probe_indexes)
+
+            probe_results = dict()  # a dict of {index in probes: (violation count, sample violating values)}
+            early_exit_probes = []
+            scan_probes = list(range(len(probes)))
+            if fail_fast:
+                # the scan of the foreign keys that can fail stops once their violations are enough to fail
+                total_count = get_table_count(con, main_table)
+                fail_counts = {j: CheckResult.get_fail_count(probe_thresholds[j], total_count) for j in scan_probes}
+                fail_counts = {j: fail_count for j, fail_count in fail_counts.items() if fail_count is not None}
+                if fail_counts:
+                    counts, samples, early_exit_probes = count_violations_until_fail(
+                        con,
+                        get_from_sql(fail_counts),
+                        {j: violation_filters[j] for j in fail_counts},
+                        fail_counts,
+                        {j: f'm."{foreign_keys[probes[j][0]][0]}"' for j in fail_counts}
+                    )
+                    probe_results.update({j: (counts[j], samples[j]) for j in fail_counts})
+                    scan_probes = [j for j in scan_probes if j not in fail_counts]
+            if scan_probes:
+                check_query = f"""
+                    SELECT COUNT(*),
+                        {', '.join(f'COUNT(*) FILTER (WHERE {violation_filters[j]}), approx_top_k(m."{foreign_keys[probes[j][0]][0]}", 5) FILTER (WHERE {violation_filters[j]})' for j in scan_probes)}
+                    FROM {get_from_sql(scan_probes)};
+                """
+                LOGGER.debug(f"Executing fused foreign key check query: {check_query}")
+                total_count, *scan_results = con.execute(check_query).fetchone()
+                probe_results.update({j: (scan_results[2 * k], scan_results[2 * k + 1]) for k, j in enumerate(scan_probes)})
+            for j, (i, key_table) in enumerate(probes):
+                main_column, reference_table, reference_column = foreign_keys[i]
+                violation_count, sample_violations = probe_results[j]
+                if j in early_exit_probes:
+                    results[i] = _fk_early_exit_result(main_table, main_column, reference_table, reference_column, violation_count, total_count, sample_violations, probe_thresholds[j])
+                elif violation_count > 0:
+                    sample_violations_str = ', '.join([str(value) for value in sample_violations])
+                    results[i] = CheckResult(
+                        check_type='foreign_key_violation',
+                        table_name=main_table,
+                        column_name=main_column,
+                        violation_pct= 1.0 * violation_count / total_count,
+                        threshold = probe_thresholds[j],
+                        troubleshooting_message=f'Found {violation_count} foreign key violations in {main_table}.{main_column} referencing {reference_table}.{reference_column}. Total rows in {main_table}: {total_count}.\nSample violating values: {sample_violations_str}',
+                        reference_table=reference_table,
+                        reference_column=reference_column,
+                        **PersonSample.get_check_kwargs(main_table, violation_count, total_count)
+                    )
+                else:
+                    results[i] = CheckResult(
+                        check_type='foreign_key_violation',
+                        table_name=main_table,
+                        column_name=main_column,
+                        status='PASS',
+                        reference_table=reference_table,
+                        reference_column=reference_column,
+                        **PersonSample.get_check_kwargs(main_table, violation_count, total_count)
+                    )
+    finally:
+        if own_key_sets:
+            key_sets.drop()
+    for result in results:
+        result.log(LOGGER, duckdb_conn=con)
+    return results
+
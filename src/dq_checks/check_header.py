@@ -1,23 +1,94 @@
-from src.util import get_csv_header, get_parquet_header
+from src.util import get_csv_header, get_parquet_header, get_csv_files
 from src.dq_checks.check_result import CheckResult
+from src.process_log import ProcessLog
 from collections import Counter
 from src.config import LOGGER
 from src.data_model import DataModel
 
-def check_duplicated_column_in_csv(file_path: str, table_name: str, duckdb_conn = None, context = None) -> CheckResult:
+def _get_csv_header(file_path: str, manifest = None) -> list:
+    """
+    Get the csv header of a table. If file_path is a directory or a glob pattern of csv shards, return the header of the first shard.
+    Header consistency across shards is checked by check_inconsistent_header_in_csv.
+    If a SubmissionManifest is provided, the header is read from the manifest instead of the file.
+    """
+    if manifest is not None:
+        return manifest.get_header(file_path)
+    csv_files = get_csv_files(file_path)
+    if not csv_files:
+        raise FileNotFoundError(f"No CSV file found in: {file_path}")
+    return get_csv_header(csv_files[0])
+
+@ProcessLog.trace(category='file_check', count_table_rows=False)
+def check_inconsistent_header_in_csv(file_path: str, table_name: str, duckdb_conn = None, context = None, manifest = None) -> CheckResult:
+    """
+    Check if all CSV files (shards) of a table have the same header. Only the first line of each shard is read.
+
+    Parameters:
+        file_path (str): Path to the directory containing the CSV files of the table, a glob pattern or a single CSV file.
+        table_name (str): Name of the CDM table to check against.
+        duckdb_conn: Optional DuckDB connection for logging.
+        context: Optional context object for additional runtime information update.
+        manifest: Optional SubmissionManifest, headers are read from the manifest instead of the files.
+
+    Returns:
+        CheckResult: Result of the check, indicating whether the CSV shards have different headers.
+    """
+    if manifest is not None:
+        headers = {csv_file: tuple(header) for csv_file, header in manifest.get_headers(file_path).items()}
+    else:
+        headers = {csv_file: tuple(get_csv_header(csv_file)) for csv_file in get_csv_files(file_path)}
+    csv_files = list(headers.keys())
+    header_counter = Counter(headers.values())
+    if len(header_counter) > 1:
+        # compare each shard with the most common header
+        common_header = header_counter.most_common(1)[0][0]
+        differences = []
+        for csv_file, header in headers.items():
+            if header == common_header:
+                continue
+            missing_columns = [col for col in common_header if col not in header]
+            extra_columns = [col for col in header if col not in common_header]
+            if missing_columns or extra_columns:
+                differences.append(f"{csv_file} (missing: {missing_columns}, extra: {extra_columns})")
+            else:
+                differences.append(f"{csv_file} (different column order)")
+        result = CheckResult(
+            check_type = 'csv header inconsistency',
+            status = 'FAIL',
+            file_name = tuple(csv_file for csv_file, header in headers.items() if header != common_header),
+            table_name = table_name,
+            troubleshooting_message = f'The table will not be loaded. {len(differences)} of {len(csv_files)} CSV file(s) have a different header from the other files: ' + '; '.join(differences)
+        )
+        if context:
+            # if the shards have different headers, don't load the table to duckdb. Also skip other checks on this table.
+            context.skip_duckdb_load_tables.append(table_name)
+            context.skip_check_tables.append(table_name)
+    else:
+        result = CheckResult(
+            check_type = 'csv header inconsistency',
+            status = 'PASS',
+            file_name = file_path,
+            table_name = table_name,
+        )
+    result.log(LOGGER, duckdb_conn=duckdb_conn)
+    return result
+
+@ProcessLog.trace(category='file_check', count_table_rows=False)
+def check_duplicated_column_in_csv(file_path: str, table_name: str, duckdb_conn = None, context = None, manifest = None) -> CheckResult:
     """
     Check if the CSV file has duplicated columns in its header.
 
     Parameters:
-        file_path (str): Path to the CSV file.
+        file_path (str): Path to the CSV file, or the directory containing the CSV files of the table.
         table_name (str): Name of the CDM table to check against.
         duckdb_conn: Optional DuckDB connection for logging.
         context: Optional context object for additional runtime information update.
+        manifest: Optional SubmissionManifest, the header is read from the manifest instead of the file.
 
     Returns:
         CheckResult: Result of the check, indicating whether the CSV header has duplicated columns.
     """
-    csv_header = get_csv_header(file_path)
+    csv_header = _get_csv_header(file_path, manifest)
     if len(csv_header) > len(set(csv_header)):
         duplicated_columns = [item for item, count in Counter(csv_header).items() if count > 1]
         result = CheckResult(
@@ -42,20 +113,22 @@ def check_duplicated_column_in_csv(file_path: str, table_name: str, duckdb_conn
     result.log(LOGGER, duckdb_conn=duckdb_conn)
     return result
 
-def check_extra_column_in_csv(file_path: str, data_model: DataModel, table_name: str, duckdb_conn = None) -> CheckResult:
+@ProcessLog.trace(category='file_check', count_table_rows=False)
+def check_extra_column_in_csv(file_path: str, data_model: DataModel, table_name: str, duckdb_conn = None, manifest = None) -> CheckResult:
     """
     Check if the CSV file has extra columns that are not defined in the CDM table definition.
 
     Parameters:
-        file_path (str): Path to the CSV file.
+        file_path (str): Path to the CSV file, or the directory containing the CSV files of the table.
         data_model (DataModel): DataModel object containing CDM table definitions.
         table_name (str): Name of the CDM table to check against.
         duckdb_conn: Optional DuckDB connection for logging.
+        manifest: Optional SubmissionManifest, the header is read from the manifest instead of the file.
 
     Returns:
         CheckResult: Result of the check, indicating whether the CSV header has extra columns.
     """
-    csv_header = get_csv_header(file_path)
+    csv_header = _get_csv_header(file_path, manifest)
     cdm_columns = data_model.all_column_names_in_table(table_name)
     # check extra header in csv
     extra_csv_column = set(csv_header) - set(cdm_columns)
@@ -76,21 +149,23 @@ def check_extra_column_in_csv(file_path: str, data_model: DataModel, table_name:
     result.log(LOGGER, duckdb_conn=duckdb_conn)
     return result
 
-def check_missing_column_in_csv(file_path: str, data_model: DataModel, table_name: str, duckdb_conn = None, context = None) -> CheckResult:
+@ProcessLog.trace(category='file_check', count_table_rows=False)
+def check_missing_column_in_csv(file_path: str, data_model: DataModel, table_name: str, duckdb_conn = None, context = None, manifest = None) -> CheckResult:
     """
     Check if the CSV file has all the required columns defined in the CDM table definition.
 
     Parameters:
-        file_path (str): Path to the CSV file.
+        file_path (str): Path to the CSV file, or the directory containing the CSV files of the table.
         data_model (DataModel): DataModel object containing CDM table definitions.
         table_name (str): Name of the CDM table to check against.
         duckdb_conn: Optional DuckDB connection for logging.
         context: Optional context object for additional runtime information update.
+        manifest: Optional SubmissionManifest, the header is read from the manifest instead of the file.
 
     Returns:
         CheckResult: Result of the check, indicating whether the CSV header is missing any required columns.
     """
-    csv_header = get_csv_header(file_path)
+    csv_header = _get_csv_header(file_path, manifest)
     cdm_columns = data_model.all_column_names_in_table(table_name)
     # check extra header in csv
     missing_csv_column = set(cdm_columns) - set(csv_header)
@@ -113,7 +188,8 @@ def check_missing_column_in_csv(file_path: str, data_model: DataModel, table_nam
     result.log(LOGGER, duckdb_conn=duckdb_conn)
     return result
 
-def check_extra_column_in_parquet(file_path: str, data_model: DataModel, table_name: str, duckdb_conn = None) -> CheckResult:
+@ProcessLog.trace(category='file_check', count_table_rows=False)
+def check_extra_column_in_parquet(file_path: str, data_model: DataModel, table_name: str, duckdb_conn = None, manifest = None) -> CheckResult:
     """
     Check if the Parquet file has extra columns that are not defined in the CDM table definition.
 
@@ -122,11 +198,12 @@ def check_extra_column_in_parquet(file_path: str, data_model: DataModel, table_n
         data_model (DataModel): DataModel object containing CDM table definitions.
         table_name (str): Name of the CDM table to check against.
         duckdb_conn: Optional DuckDB connection for logging.
+        manifest: Optional SubmissionManifest, the header is read from the manifest instead of the file.
 
     Returns:
         CheckResult: Result of the check, indicating whether the Parquet header has extra columns.
     """
-    parquet_header = get_parquet_header(file_path)
+    parquet_header = manifest.get_header(file_path) if manifest is not None else get_parquet_header(file_path)
     cdm_columns = data_model.all_column_names_in_table(table_name)
     # check extra header in parquet
     extra_parquet_column = set(parquet_header) - set(cdm_columns)
@@ -147,7 +224,8 @@ def check_extra_column_in_parquet(file_path: str, data_model: DataModel, table_n
     result.log(LOGGER, duckdb_conn=duckdb_conn)
     return result
 
-def check_missing_column_in_parquet(file_path: str, data_model: DataModel, table_name: str, duckdb_conn = None, context = None) -> CheckResult:
+@ProcessLog.trace(category='file_check', count_table_rows=False)
+def check_missing_column_in_parquet(file_path: str, data_model: DataModel, table_name: str, duckdb_conn = None, context = None, manifest = None) -> CheckResult:
     """
     Check if the Parquet file has all the required columns defined in the CDM table definition.
 
@@ -157,11 +235,12 @@ def check_missing_column_in_parquet(file_path: str, data_model: DataModel, table
         table_name (str): Name of the CDM table to check against.
         duckdb_conn: Optional DuckDB connection for logging.
         context: Optional context object for additional runtime information update.
+        manifest: Optional SubmissionManifest, the header is read from the manifest instead of the file.
 
     Returns:
         CheckResult: Result of the check, indicating whether the Parquet header is missing any required columns.
     """
-    parquet_header = get_parquet_header(file_path)
+    parquet_header = manifest.get_header(file_path) if manifest is not None else get_parquet_header(file_path)
     cdm_columns = data_model.all_column_names_in_table(table_name)
     # check extra header in parquet
     missing_parquet_column = set(cdm_columns) - set(parquet_header)
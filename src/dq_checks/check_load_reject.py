@@ -0,0 +1,75 @@
+from src.dq_checks.check_result import CheckResult
+from src.process_log import ProcessLog
+from src.config import LOGGER
+from duckdb import DuckDBPyConnection
+from typing import Optional
+from src.util import get_table_count, table_exists, get_threshold
+
+@ProcessLog.trace()
+def check_load_reject(
+    con: DuckDBPyConnection,
+    table_name: str,
+    threshold: Optional[dict[str, float] ]= None,
+    rejects_schema: str = 'rejects'
+) -> CheckResult:
+    """
+    Check the rate of csv rows rejected while loading a table (rows that could not be parsed or cast to the column types).
+    Rejected rows are stored by load_csv_to_duckdb(..., store_rejects=True) in table {rejects_schema}.{table_name}.
+
+    Parameters:
+    - con: DuckDBPyConnection, a duckdb connection.
+    - table_name: str, the name of the loaded table to check.
+    - threshold: Optional[dict[str, float]], thresholds of the reject rate. Defaults to the 'load_reject_violation' thresholds.
+    - rejects_schema: str, schema of the reject tables. Defaults to 'rejects'.
+
+    Returns:
+    - CheckResult: Result of the reject check.
+    """
+    if threshold is None:
+        threshold = get_threshold('load_reject_violation', table_name=table_name)
+    if not table_exists(con, table_name, rejects_schema):
+        result = CheckResult(
+            check_type='load_reject_violation',
+            table_name=table_name,
+            status='SKIPPED',
+            troubleshooting_message=f'Reject table {rejects_schema}.{table_name} does not exist in the database. The table was not loaded with reject capture.'
+        )
+        result.log(LOGGER, duckdb_conn=con)
+        return result
+
+    # a rejected row can have more than one error, count distinct rows
+    check_query = f"""
+        SELECT COUNT(DISTINCT (file_path, line))
+        FROM {rejects_schema}."{table_name}";
+    """
+    sample_query = f"""
+        SELECT error_type, COALESCE(column_name, 'n/a') AS column_name, COUNT(*) AS error_count, MIN(file_path || ':' || line) AS first_line
+        FROM {rejects_schema}."{table_name}"
+        GROUP BY error_type, column_name
+        ORDER BY error_count DESC
+        LIMIT 5;
+    """
+    LOGGER.debug(f"Executing load reject check query: {check_query}")
+    reject_count = con.execute(check_query).fetchone()[0]
+    if reject_count > 0:
+        LOGGER.debug(f"Executing sample query for load rejects: {sample_query}")
+        con.execute(sample_query)
+        sample_errors_str = '; '.join([f"{row[0]} on column {row[1]}: {row[2]} error(s), first at {row[3]}" for row in con.fetchall()])
+        total_count = get_table_count(con, table_name) + reject_count
+        violation_pct = 1.0 * reject_count / total_count
+        result = CheckResult(
+            check_type='load_reject_violation',
+            status=None,  # Let CheckResult infer the status based on threshold and violation_pct
+            table_name=table_name,
+            violation_pct=violation_pct,
+            threshold=threshold,
+            troubleshooting_message=f'{reject_count} out of {total_count} rows ({violation_pct:.2%}) in the submission file(s) of table "{table_name}" could not be loaded. Most common errors: {sample_errors_str}. All rejected rows are in table {rejects_schema}.{table_name}.'
+        )
+    else:
+        result = CheckResult(
+            check_type='load_reject_violation',
+            status='PASS',
+            table_name=table_name
+        )
+    result.log(LOGGER, duckdb_conn=con)
+    return result
@@ -1,14 +1,19 @@
 from src.dq_checks.check_result import CheckResult
+from src.process_log import ProcessLog
 from src.config import LOGGER
 from duckdb import DuckDBPyConnection
-from typing import Optional
-from src.util import get_table_count, table_exists, column_exists, get_threshold
+from typing import Optional, List, Dict
+from src.util import get_table_count, table_exists, column_exists, get_threshold, count_violations_until_fail
+from src.parquet_stats import ParquetFooterStats
+from src.person_sample import PersonSample
 
+@ProcessLog.trace()
 def check_not_null_violation(
     con: DuckDBPyConnection,
     table_name: str,
     column_name: str,
-    threshold: Optional[dict[str, float] ]= None
+    threshold: Optional[dict[str, float] ]= None,
+    fail_fast: bool = False
 ) -> CheckResult:
     """
     Check for NOT NULL constraint violations in the specified table and column.
@@ -17,6 +22,12 @@ def check_not_null_violation(
     - con: DuckDBPyConnection, a duckdb connection.
     - table_name: str, the name of the table to check.
     - column_name: str, the column in the table that should not contain NULL values.
+    - threshold: Optional[dict[str, float]], thresholds of the violation rate. Defaults to the 'not_null_violation' thresholds.
+    - fail_fast: bool, stop counting NULL values once they are enough to fail the check, the result then records a lower
+      bound of the violation rate. Defaults to False.
+
+    If the table is registered in ParquetFooterStats and the footers have null counts for the column,
+    the check is answered from the footer statistics without scanning the table.
 
     Returns:
     - CheckResult: Result of the NOT NULL check.
@@ -45,17 +56,55 @@ def check_not_null_violation(
         result.log(LOGGER, duckdb_conn=con)
         return result
     
-    # check for NOT NULL violations
-    check_query = f"""
-        SELECT COUNT(*)
-        FROM "{table_name}"
-        WHERE "{column_name}" IS NULL;
+    # check for NOT NULL violations, from parquet footer statistics if available
+    violation_count = ParquetFooterStats.get_null_count(con, table_name, column_name)
+    fail_count = CheckResult.get_fail_count(threshold, get_table_count(con, table_name)) if fail_fast and violation_count is None else None
+    early_exit = False
+    if violation_count is not None:
+        LOGGER.debug(f"NOT NULL check of {table_name}.{column_name} answered from parquet footer statistics: {violation_count} NULL values")
+    elif fail_count is not None:
+        counts, _, lower_bounds = count_violations_until_fail(con, f'"{table_name}"', {column_name: f'"{column_name}" IS NULL'}, {column_name: fail_count})
+        violation_count = counts[column_name]
+        early_exit = column_name in lower_bounds
+    else:
+        check_query = f"""
+            SELECT COUNT(*)
+            FROM "{table_name}"
+            WHERE "{column_name}" IS NULL;
+        """
+        LOGGER.debug(f"Executing NOT NULL check query: {check_query}")
+        violation_count = con.execute(check_query).fetchone()[0]
+    # the row count of a sampled table is also needed without violations, for the confidence interval of the rate
+    total_count = get_table_count(con, table_name) if violation_count > 0 or PersonSample.is_sampled(table_name) else None
+    result = _not_null_result(table_name, column_name, violation_count, total_count, threshold, early_exit)
+    result.log(LOGGER, duckdb_conn=con)
+    return result
+
+def _not_null_result(
+    table_name: str,
+    column_name: str,
+    violation_count: int,
+    total_count: Optional[int],
+    threshold: dict[str, float],
+    early_exit: bool = False
+) -> CheckResult:
     """
-    
-    LOGGER.debug(f"Executing NOT NULL check query: {check_query}")
-    violation_count = con.execute(check_query).fetchone()[0]
+    Build the CheckResult of a NOT NULL check from the NULL count and row count of the column.
+    If early_exit, the NULL count is a lower bound, the count stopped once the check failed.
+    """
+    if early_exit:
+        return CheckResult(
+            check_type='not_null_violation',
+            status='FAIL',
+            table_name=table_name,
+            column_name=column_name,
+            violation_pct=violation_count / total_count,
+            threshold=threshold,
+            troubleshooting_message = f'The column "{column_name}" in table "{table_name}" has at least {violation_count} NULL values out of {total_count} rows ({violation_count / total_count:.2%}, counting stopped once the check failed). Please ensure this column does not contain NULL values.',
+            early_exit=True
+        )
+    sample_kwargs = PersonSample.get_check_kwargs(table_name, violation_count, total_count)
     if violation_count > 0:
-        total_count = get_table_count(con, table_name)
         violation_pct = violation_count / total_count
         result = CheckResult(
             check_type='not_null_violation',
@@ -64,14 +113,104 @@ def check_not_null_violation(
             column_name=column_name,
             violation_pct=violation_pct,
             threshold=threshold,
-            troubleshooting_message = f'The column "{column_name}" in table "{table_name}" has {violation_count} NULL values out of {total_count} rows ({violation_pct:.2%}). Please ensure this column does not contain NULL values.'
+            troubleshooting_message = f'The column "{column_name}" in table "{table_name}" has {violation_count} NULL values out of {total_count} rows ({violation_pct:.2%}). Please ensure this column does not contain NULL values.',
+            **sample_kwargs
         )
     else:
         result = CheckResult(
             check_type='not_null_violation',
             status='PASS',
             table_name=table_name,
-            column_name=column_name
+            column_name=column_name,
+            **sample_kwargs
         )
-    result.log(LOGGER, duckdb_conn=con)
     return result
+
+@ProcessLog.trace()
+def check_not_null_violations(
+    con: DuckDBPyConnection,
+    table_name: str,
+    column_names: List[str],
+    thresholds: Optional[Dict[str, dict[str, float]]] = None,
+    fail_fast: bool = False
+) -> List[CheckResult]:
+    """
+    Check for NOT NULL constraint violations of several columns of a table in one scan of the table.
+    The NULL count of every column and the row count are computed by a single query with one COUNT(*) FILTER (WHERE ... IS NULL)
+    aggregate per column. Columns answered from parquet footer statistics (see check_not_null_violation) are not scanned.
+
+    Produces the same CheckResults as calling check_not_null_violation for each column, one per item of column_names
+    (a column listed twice, e.g. in a NOT NULL constraint and in the primary key, gets two results).
+
+    Parameters:
+    - con: DuckDBPyConnection, a duckdb connection.
+    - table_name: str, the name of the table to check.
+    - column_names: List[str], the columns in the table that should not contain NULL values.
+    - thresholds: Optional[Dict[str, dict[str, float]]], a dict of {column_name: threshold}. Defaults to the 'not_null_violation' thresholds.
+    - fail_fast: bool, stop the scan once the NULL values found are enough to fail the check of a column (see
+      count_violations_until_fail), the result then records a lower bound of the violation rate. Defaults to False.
+
+    Returns:
+    - List[CheckResult]: Results of the NOT NULL checks, in the order of column_names.
+    """
+    thresholds = thresholds or dict()
+    if not table_exists(con, table_name):
+        results = [CheckResult(
+            check_type='not_null_violation',
+            table_name=table_name,
+            column_name=column_name,
+            status='SKIPPED',
+            troubleshooting_message=f'Table {table_name} does not exist in the database.'
+        ) for column_name in column_names]
+        for result in results:
+            result.log(LOGGER, duckdb_conn=con)
+        return results
+
+    existing_columns = [column_name for column_name in dict.fromkeys(column_names) if column_exists(con, table_name, column_name)]
+    column_thresholds = {column_name: thresholds.get(column_name) or get_threshold('not_null_violation', table_name=table_name, column_name=column_name) for column_name in existing_columns}
+    # NULL counts from parquet footer statistics, the other columns are counted in one scan
+    violation_counts = {column_name: ParquetFooterStats.get_null_count(con, table_name, column_name) for column_name in existing_columns}
+    scan_columns = [column_name for column_name, violation_count in violation_counts.items() if violation_count is None]
+    total_count = None
+    early_exit_columns = []
+    if fail_fast and scan_columns:
+        # the scan of the columns that can fail stops once their NULL values are enough to fail
+        total_count = get_table_count(con, table_name)
+        fail_counts = {column_name: CheckResult.get_fail_count(column_thresholds[column_name], total_count) for column_name in scan_columns}
+        fail_counts = {column_name: fail_count for column_name, fail_count in fail_counts.items() if fail_count is not None}
+        if fail_counts:
+            counts, _, early_exit_columns = count_violations_until_fail(
+                con,
+                f'"{table_name}"',
+                {column_name: f'"{column_name}" IS NULL' for column_name in fail_counts},
+                fail_counts
+            )
+            violation_counts.update(counts)
+            scan_columns = [column_name for column_name in scan_columns if column_name not in fail_counts]
+    if scan_columns:
+        check_query = f"""
+            SELECT COUNT(*),
+                {', '.join(f'COUNT(*) FILTER (WHERE "{column_name}" IS NULL)' for column_name in scan_columns)}
+            FROM "{table_name}";
+        """
+        LOGGER.debug(f"Executing fused NOT NULL check query: {check_query}")
+        total_count, *scan_counts = con.execute(check_query).fetchone()
+        violation_counts.update(zip(scan_columns, scan_counts))
+    if total_count is None and any(violation_counts.values()):
+        total_count = get_table_count(con, table_name)
+
+    results = []
+    for column_name in column_names:
+        if column_name not in violation_counts:
+            result = CheckResult(
+                check_type='not_null_violation',
+                table_name=table_name,
+                column_name=column_name,
+                status='SKIPPED',
+                troubleshooting_message=f'Column {column_name} does not exist in table {table_name}.'
+            )
+        else:
+            result = _not_null_result(table_name, column_name, violation_counts[column_name], total_count, column_thresholds[column_name], column_name in early_exit_columns)
+        result.log(LOGGER, duckdb_conn=con)
+        results.append(result)
+    return results
@@ -1,5 +1,7 @@
 from typing import Literal, Tuple, List, Optional
+import threading
 import logging
+import math
 import duckdb
 
 
@@ -31,6 +33,7 @@ class CheckResult:
     dq_skip: List['CheckResult'] = []  # Class variable to store all skipped checks
     
     success_count: int = 0  # Class variable to count successful checks
+    _lock = threading.Lock()  # Checks may run concurrently, see CheckScheduler
 
     ALLOWED_STATUS: Tuple[str, ...] = ("PASS", "WARN", "FAIL", "SKIPPED")
     StatusLiteral = Literal["PASS", "WARN", "FAIL", "SKIPPED"]
@@ -98,14 +101,15 @@ class CheckResult:
                     "Status not provided and cannot infer status because either "
                     "violation_pct or threshold is not provided."
                 )
-        if self.status == 'FAIL':
-            CheckResult.dq_fail.append(self)
-        elif self.status == 'WARN':
-            CheckResult.dq_warn.append(self)
-        elif self.status == 'SKIPPED':
-            CheckResult.dq_skip.append(self)
-        elif self.status == 'PASS':
-            CheckResult.success_count += 1
+        with CheckResult._lock:
+            if self.status == 'FAIL':
+                CheckResult.dq_fail.append(self)
+            elif self.status == 'WARN':
+                CheckResult.dq_warn.append(self)
+            elif self.status == 'SKIPPED':
+                CheckResult.dq_skip.append(self)
+            elif self.status == 'PASS':
+                CheckResult.success_count += 1
 
 
     def __bool__(self):
@@ -157,6 +161,28 @@ class CheckResult:
                 return
         self.status = 'FAIL'
 
+    @staticmethod
+    def get_fail_count(threshold: Optional[dict], row_count: int) -> Optional[int]:
+        """
+        Get the smallest number of violations out of row_count rows whose violation rate is inferred as FAIL, i.e. past the
+        highest cutoff of the other statuses. A check that found that many violations fails whatever the rest of the table,
+        so it can stop counting.
+        Returns None if no number of violations fails, e.g. for an empty table.
+        """
+        threshold = threshold or {'PASS': 0.0}
+        if row_count <= 0:
+            return None
+        cutoff = max((cutoff for status, cutoff in threshold.items() if status != 'FAIL'), default=None)
+        if cutoff is None:
+            return 1
+        fail_count = max(1, math.floor(cutoff * row_count) + 1)
+        # correct floating point rounding of the product, infer_status compares violation_count / row_count
+        while fail_count > 1 and (fail_count - 1) / row_count > cutoff:
+            fail_count -= 1
+        while fail_count <= row_count and fail_count / row_count <= cutoff:
+            fail_count += 1
+        return fail_count if fail_count <= row_count else None
+
     def log(self, logger: logging.Logger, level_str: str = 'DQ', duckdb_conn: Optional[duckdb.DuckDBPyConnection] = None, duckdb_schema: Optional[str] = 'logging', duckdb_table: Optional[str] = 'dq'):
         """
         Log the CheckResult using the provided logger at the specified log level. 
@@ -0,0 +1,71 @@
+from src.dq_checks.check_result import CheckResult
+from src.process_log import ProcessLog
+from src.config import LOGGER
+from duckdb import DuckDBPyConnection
+from typing import Optional
+from src.util import table_exists, get_threshold
+
+@ProcessLog.trace()
+def check_type_conformance(
+    con: DuckDBPyConnection,
+    table_name: str,
+    column_name: str,
+    threshold: Optional[dict[str, float] ]= None,
+    cast_failure_schema: str = 'cast_failures'
+) -> CheckResult:
+    """
+    Check the rate of values of a column that cannot be cast to the column type of the data model (e.g. '2020-13-45' in a DATE column).
+    Cast failures are counted by load_csv_to_duckdb_staging while loading the table, and stored in table {cast_failure_schema}.{table_name}.
+    Failing values are loaded as NULL.
+
+    Parameters:
+    - con: DuckDBPyConnection, a duckdb connection.
+    - table_name: str, the name of the loaded table to check.
+    - column_name: str, the typed column to check.
+    - threshold: Optional[dict[str, float]], thresholds of the cast failure rate. Defaults to the 'type_conformance_violation' thresholds.
+    - cast_failure_schema: str, schema of the cast failure tables. Defaults to 'cast_failures'.
+
+    Returns:
+    - CheckResult: Result of the type conformance check.
+    """
+    if threshold is None:
+        threshold = get_threshold('type_conformance_violation', table_name=table_name, column_name=column_name)
+    cast_failure = None
+    if table_exists(con, table_name, cast_failure_schema):
+        cast_failure = con.execute(f"""
+            SELECT column_type, row_count, failure_count, sample_value
+            FROM {cast_failure_schema}."{table_name}"
+            WHERE column_name = ?;
+        """, (column_name,)).fetchone()
+    if cast_failure is None:
+        result = CheckResult(
+            check_type='type_conformance_violation',
+            table_name=table_name,
+            column_name=column_name,
+            status='SKIPPED',
+            troubleshooting_message=f'No cast failure statistics for {table_name}.{column_name}. The table was not loaded through a staging table, or the column is not typed or not in the submission file.'
+        )
+        result.log(LOGGER, duckdb_conn=con)
+        return result
+
+    column_type, row_count, failure_count, sample_value = cast_failure
+    if failure_count > 0:
+        violation_pct = failure_count / row_count
+        result = CheckResult(
+            check_type='type_conformance_violation',
+            status=None,  # Let CheckResult infer the status based on threshold and violation_pct
+            table_name=table_name,
+            column_name=column_name,
+            violation_pct=violation_pct,
+            threshold=threshold,
+            troubleshooting_message=f'{failure_count} out of {row_count} values ({violation_pct:.2%}) of column "{column_name}" in table "{table_name}" cannot be converted to {column_type}, e.g. \'{sample_value}\'. These values were loaded as NULL.'
+        )
+    else:
+        result = CheckResult(
+            check_type='type_conformance_violation',
+            status='PASS',
+            table_name=table_name,
+            column_name=column_name
+        )
+    result.log(LOGGER, duckdb_conn=con)
+    return result
@@ -1,9 +1,15 @@
-from typing import List
-from src.util import get_csv_header, get_table_count, get_parquet_header
+from typing import List, Dict, Optional
+from src.util import get_csv_header, get_table_count, table_exists, get_parquet_header, get_path_size, get_path_fingerprint, get_csv_files, get_csv_source, get_read_csv_options
 from src.config import CONFIG, LOGGER
 from duckdb import DuckDBPyConnection
 import duckdb
 from src.data_model import DataModel
+from src.process_log import ProcessLog
+from src.submission_manifest import SubmissionManifest
+from src.catalog_cache import CatalogCache
+from src.table_stats import TableStats
+from src.person_sample import PersonSample
+from src.parquet_stats import ParquetFooterStats
 
 def init_duckdb_logging_schema(con: DuckDBPyConnection, run_id: str, run_config: dict, logging_schema = 'logging') -> DuckDBPyConnection:
     con.execute(f"""
@@ -28,6 +34,22 @@ def init_duckdb_logging_schema(con: DuckDBPyConnection, run_id: str, run_config:
         start_time TIMESTAMP,
         end_time TIMESTAMP
     );
+    ALTER TABLE {logging_schema}.process ADD COLUMN IF NOT EXISTS category VARCHAR;
+    ALTER TABLE {logging_schema}.process ADD COLUMN IF NOT EXISTS rows_processed BIGINT;
+    ALTER TABLE {logging_schema}.process ADD COLUMN IF NOT EXISTS bytes_read BIGINT;
+    CREATE TABLE IF NOT EXISTS {logging_schema}.table_fingerprint (
+        table_name VARCHAR,
+        run_id VARCHAR,
+        file_path VARCHAR,
+        file_count INTEGER,
+        file_size BIGINT,
+        modified_time DOUBLE,
+        content_hash VARCHAR,
+        data_model VARCHAR,
+        load_time TIMESTAMP
+    );
+    ALTER TABLE {logging_schema}.table_fingerprint ADD COLUMN IF NOT EXISTS load_mode VARCHAR;
+    ALTER TABLE {logging_schema}.table_fingerprint ADD COLUMN IF NOT EXISTS store_rejects BOOLEAN;
     CREATE TABLE IF NOT EXISTS {logging_schema}.run (
         run_id VARCHAR,
         start_time TIMESTAMP,
@@ -39,33 +61,166 @@ def init_duckdb_logging_schema(con: DuckDBPyConnection, run_id: str, run_config:
     con.execute(f"""INSERT INTO {logging_schema}.run (run_id, start_time, config) VALUES ('{run_id}', current_localtimestamp(), ?);""", (str(run_config),))
     return con
 
+def finish_duckdb_logging_run(con: DuckDBPyConnection, run_id: str, logging_schema = 'logging') -> DuckDBPyConnection:
+    """
+    Set the end time of a run in the logging schema.
+    """
+    con.execute(f"""UPDATE {logging_schema}.run SET end_time = current_localtimestamp() WHERE run_id = ?;""", (run_id,))
+    return con
+
+def get_unchanged_tables(
+        con: DuckDBPyConnection,
+        load_tasks: Dict[str, str],
+        data_model: DataModel,
+        content_hash: bool = False,
+        load_mode: str = 'copy',
+        store_rejects: bool = False,
+        logging_schema = 'logging'
+    ) -> Dict[str, Dict]:
+    """
+    Find tables whose submission file is unchanged since the table was last loaded into DuckDB.
+    A table is unchanged when it exists in DuckDB, was loaded with the same data model name and version from the same path
+    with the same load mode and reject capture, and the submission file has the same file count, size and modification time
+    as when it was loaded. A table loaded in another mode holds other rows (e.g. values cast to NULL by a staging load are
+    rejected by a copy load), so it is reloaded.
+    If content_hash is True, a file with a new modification time is still unchanged if its content hash is the same.
+
+    Parameters:
+    - con: DuckDBPyConnection, a duckdb connection
+    - load_tasks: Dict[str, str], a dict of {table_name: file_path}.
+    - data_model: DataModel, data model used to create the tables.
+    - content_hash: bool, if True, compare the content hash of files whose modification time changed.
+    - load_mode: str, load mode of the run, 'copy' or 'staging'.
+    - store_rejects: bool, if rejected rows are captured by the loads of the run.
+    - logging_schema: str, schema of the fingerprint table.
+
+    Returns:
+    - Dict[str, Dict]: a dict of {table_name: stored fingerprint record} for unchanged tables.
+    """
+    existing_tables = {item[0] for item in con.execute("SELECT table_name FROM duckdb_tables() WHERE schema_name = 'main'").fetchall()}
+    cursor = con.execute(f"SELECT * FROM {logging_schema}.table_fingerprint")
+    columns = [item[0] for item in cursor.description]
+    stored_fingerprints = {row[0]: dict(zip(columns, row)) for row in cursor.fetchall()}
+    data_model_str = f"{data_model.name} {data_model.version}"
+    unchanged_tables = dict()
+    for table_name, file_path in load_tasks.items():
+        stored = stored_fingerprints.get(table_name)
+        if not stored or table_name not in existing_tables:
+            continue
+        if stored['file_path'] != file_path or stored['data_model'] != data_model_str:
+            continue
+        if stored['load_mode'] != load_mode or stored['store_rejects'] != store_rejects:
+            continue
+        fingerprint = get_path_fingerprint(file_path)
+        if (fingerprint['file_count'], fingerprint['file_size']) != (stored['file_count'], stored['file_size']):
+            continue
+        if fingerprint['modified_time'] != stored['modified_time']:
+            # file was rewritten. With content hash enabled, the table is unchanged if the content is the same.
+            if not content_hash or stored['content_hash'] is None:
+                continue
+            if get_path_fingerprint(file_path, content_hash=True)['content_hash'] != stored['content_hash']:
+                continue
+        unchanged_tables[table_name] = stored
+    return unchanged_tables
+
+def save_table_fingerprint(
+        con: DuckDBPyConnection,
+        run_id: str,
+        table_name: str,
+        file_path: str,
+        fingerprint: Dict,
+        data_model: DataModel,
+        load_mode: str = 'copy',
+        store_rejects: bool = False,
+        logging_schema = 'logging'
+    ) -> DuckDBPyConnection:
+    """
+    Store the fingerprint of the submission file a table was loaded from, with the load mode and reject capture of the load,
+    replacing any previous fingerprint of the table.
+    """
+    con.execute(f"DELETE FROM {logging_schema}.table_fingerprint WHERE table_name = ?;", (table_name,))
+    con.execute(f"""
+        INSERT INTO {logging_schema}.table_fingerprint (table_name, run_id, file_path, file_count, file_size, modified_time, content_hash, data_model, load_time, load_mode, store_rejects)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, current_localtimestamp(), ?, ?);
+    """, (table_name, run_id, file_path, fingerprint['file_count'], fingerprint['file_size'], fingerprint['modified_time'], fingerprint['content_hash'], f"{data_model.name} {data_model.version}", load_mode, store_rejects))
+    return con
+
+def clear_table_fingerprints(con: DuckDBPyConnection, table_names: List[str], logging_schema = 'logging', rejects_schema: str = 'rejects', cast_failure_schema: str = 'cast_failures') -> DuckDBPyConnection:
+    """
+    Remove stored fingerprints of tables, e.g. when the tables are dropped and recreated, with the rejected rows and cast
+    failures of their previous load, so a reload in another mode does not report them.
+    """
+    if table_names:
+        con.execute(f"DELETE FROM {logging_schema}.table_fingerprint WHERE table_name IN (SELECT UNNEST(?));", (list(table_names),))
+        con.execute(''.join(f'DROP TABLE IF EXISTS {rejects_schema}."{table_name}"; DROP TABLE IF EXISTS {cast_failure_schema}."{table_name}";' for table_name in table_names))
+        CatalogCache.invalidate()
+    return con
+
 def create_duckdb_tables(data_model: DataModel, con: DuckDBPyConnection, skip_tables: List = [], recreate: bool = False):
     ddl_dict = data_model.to_duckdb_ddl()
     tables = set(ddl_dict.keys()) - set(skip_tables)
+    # tables exposed as views over submission files by create_duckdb_view
+    existing_views = {item[0] for item in con.execute("SELECT view_name FROM duckdb_views() WHERE NOT internal AND schema_name = 'main'").fetchall()}
     sql = ''
     for t in tables:
         if recreate:
-            sql += f'DROP TABLE IF EXISTS {t};\n'
+            if t in existing_views:
+                sql += f'DROP VIEW IF EXISTS {t};\n'
+            else:
+                sql += f'DROP TABLE IF EXISTS {t};\n'
         sql += ddl_dict[t] + ';\n' 
     con.execute(sql)
+    CatalogCache.invalidate()
+    for t in tables:
+        # new empty tables, the first load does not need to count them
+        TableStats.set_row_count(t, 0)
     LOGGER.info(f"empty table(s) created -- {tables}")
     return con
 
 
-def load_csv_to_duckdb(csv_path: str, con: DuckDBPyConnection, table_name: str, accept_additional_col: bool = True):
+def _get_submission_header(file_path: str, table_name: str, file_format: str = 'csv', manifest: Optional[SubmissionManifest] = None, con: Optional[DuckDBPyConnection] = None) -> List[str]:
+    """
+    Get the header of the submission file(s) of a table, from the manifest if provided.
+    For csv, all files of the table must have the same header.
     """
-    Loads a CSV file into a DuckDB table. Any additional column in csv will be added to database
+    if file_format == 'parquet':
+        if manifest is not None:
+            return manifest.get_header(file_path)
+        return get_parquet_header(file_path, con=con)
+    if manifest is not None:
+        headers = manifest.get_headers(file_path)
+    else:
+        headers = {csv_file: get_csv_header(csv_file) for csv_file in get_csv_files(file_path)}
+    if not headers:
+        raise FileNotFoundError(f"No CSV file found for table {table_name} in: {file_path}")
+    csv_files = list(headers.keys())
+    for csv_file in csv_files[1:]:
+        if headers[csv_file] != headers[csv_files[0]]:
+            raise ValueError(f"CSV file {csv_file} has a different header from {csv_files[0]}. All CSV files of table {table_name} must have the same header.")
+    return headers[csv_files[0]]
+
+def load_csv_to_duckdb(csv_path: str, con: DuckDBPyConnection, table_name: str, accept_additional_col: bool = True, store_rejects: bool = False, rejects_schema: str = 'rejects', manifest: Optional[SubmissionManifest] = None):
+    """
+    Loads a CSV file, or all CSV files (shards) of a table, into a DuckDB table. Any additional column in csv will be added to database.
+    All shards must have the same header, and are ingested in one parallel scan.
 
     Parameters:
-    - csv_path: str, path to the CSV file.
+    - csv_path: str, path to the CSV file, a directory containing the CSV files of the table, or a glob pattern.
     - con: DuckDBPyConnection, a duckdb connection
     - table_name: str, the name of the table to create/load into.
     - accept_additional_col: bool, if True, add additional columns in csv to duckdb. If False, will throw an error if addtional col in csv
+    - store_rejects: bool, if True, rows that cannot be parsed or cast (e.g. bad dates, wrong number of columns) are skipped instead of failing the load,
+        and stored in table {rejects_schema}.{table_name} with file path, line number, column and error message.
+    - rejects_schema: str, schema of the reject tables. Defaults to 'rejects'.
+    - manifest: Optional[SubmissionManifest], scanned submission files. Headers and sizes are read from the manifest instead of the files.
+
+    If PersonSample is enabled and the csv has a person_id column, only the rows of the sampled persons are loaded,
+    with an INSERT ... SELECT from read_csv instead of COPY.
 
     Returns:
     - duckdb.Connection object connected to the database.
     """
-    csv_header = [item.lower() for item in get_csv_header(csv_path)]
+    csv_header = [item.lower() for item in _get_submission_header(csv_path, table_name, 'csv', manifest)]
     duckdb_columns = con.execute(f'DESCRIBE {table_name}').df()['column_name'].tolist()
     # if csv has more columns than duckdb
     if (set(csv_header) - set(duckdb_columns)):
@@ -73,22 +228,151 @@ def load_csv_to_duckdb(csv_path: str, con: DuckDBPyConnection, table_name: str,
             for col in set(csv_header) - set(duckdb_columns):
                 con.execute(f'ALTER TABLE {table_name} ADD COLUMN {col} VARCHAR;')
                 LOGGER.warning(f"column {col} exists in csv, but not in duckdb ddl. Added '{col} VARCHAR' to duckdb. ")
+            CatalogCache.invalidate()
         else:
             raise ValueError(f"CSV file has additional columns {set(csv_header) - set(duckdb_columns)} not in duckdb table {table_name} and accept_additional_col is set to False.")
     count_before_load = get_table_count(con, table_name)
-    LOGGER.info(f"Loading {csv_path} to {table_name}...")
-    copy_sql = f"""COPY {table_name} ({', '.join(csv_header)}) FROM '{csv_path}' ({CONFIG['duckdb']['copy_options'] + ', AUTO_DETECT false'});"""
+    LOGGER.info(f"Loading CSV file(s) from {csv_path} to {table_name}...")
+    copy_options = CONFIG['duckdb']['copy_options'] + ', AUTO_DETECT false'
+    if store_rejects:
+        # reject tables of DuckDB are temporary tables of the connection, copied to {rejects_schema}.{table_name} after the load
+        copy_options += f", STORE_REJECTS true, REJECTS_TABLE 'reject_errors_{table_name}', REJECTS_SCAN 'reject_scans_{table_name}'"
+    sample_filter = PersonSample.get_filter(csv_header)
+    if sample_filter:
+        column_types = {item[0]: item[1] for item in con.execute(f'DESCRIBE {table_name}').fetchall()}
+        columns_str = '{' + ', '.join(f"'{col}': '{column_types[col]}'" for col in csv_header) + '}'
+        copy_sql = f"""INSERT INTO {table_name} ({', '.join(csv_header)}) SELECT {', '.join(f'"{col}"' for col in csv_header)} FROM read_csv('{get_csv_source(csv_path)}', columns={columns_str}, {get_read_csv_options(copy_options)}) WHERE {sample_filter};"""
+    else:
+        copy_sql = f"""COPY {table_name} ({', '.join(csv_header)}) FROM '{get_csv_source(csv_path)}' ({copy_options});"""
     LOGGER.debug(f"Executing SQL: {copy_sql}")
-    try:
-        con.execute(copy_sql)
-    except Exception as e:
-        LOGGER.error(f"Fail to load CSV to DuckDB: table={table_name}, csv={csv_path}")
-        raise
-    count_after_load = get_table_count(con, table_name)
+    with ProcessLog(f"load {table_name}", category='load', table_name=table_name, bytes_read=manifest.get_size(csv_path) if manifest else get_path_size(csv_path)) as process:
+        try:
+            # COPY and INSERT return the number of loaded rows
+            count_after_load = count_before_load + con.execute(copy_sql).fetchone()[0]
+        except Exception as e:
+            TableStats.invalidate(table_name)
+            LOGGER.error(f"Fail to load CSV to DuckDB: table={table_name}, csv={csv_path}")
+            raise
+        TableStats.set_row_count(table_name, count_after_load)
+        if sample_filter:
+            PersonSample.add_sampled_table(table_name)
+        process.rows_processed = count_after_load - count_before_load
+    LOGGER.info(f"Loaded {count_after_load - count_before_load} rows into {table_name}.")
+    if store_rejects:
+        con.execute(f"""
+            CREATE SCHEMA IF NOT EXISTS {rejects_schema};
+            CREATE OR REPLACE TABLE {rejects_schema}.{table_name} AS
+            SELECT s.file_path, e.line, e.column_name, e.error_type, e.error_message, e.csv_line
+            FROM reject_errors_{table_name} AS e
+            JOIN reject_scans_{table_name} AS s
+                USING (scan_id, file_id);
+            DROP TABLE IF EXISTS reject_errors_{table_name};
+            DROP TABLE IF EXISTS reject_scans_{table_name};
+        """)
+        CatalogCache.invalidate()
+        reject_count = con.execute(f"SELECT COUNT(DISTINCT (file_path, line)) FROM {rejects_schema}.{table_name}").fetchone()[0]
+        if reject_count > 0:
+            LOGGER.warning(f"Rejected {reject_count} rows of {csv_path} that could not be loaded into {table_name}. See table {rejects_schema}.{table_name}.")
+    return con
+
+def load_csv_to_duckdb_staging(csv_path: str, con: DuckDBPyConnection, table_name: str, accept_additional_col: bool = True, cast_failure_schema: str = 'cast_failures', manifest: Optional[SubmissionManifest] = None):
+    """
+    Loads a CSV file, or all CSV files (shards) of a table, into a DuckDB table through an all-VARCHAR staging table.
+    Values are converted to the column types of the table with TRY_CAST in one INSERT ... SELECT, so a value that
+    cannot be cast (e.g. a bad date) is loaded as NULL instead of failing the load.
+
+    The number of cast failures of every typed column, with one failing value as example, is stored in table
+    {cast_failure_schema}.{table_name} (column_name, column_type, row_count, failure_count, sample_value) and
+    reported by check_type_conformance.
+
+    Parameters:
+    - csv_path: str, path to the CSV file, a directory containing the CSV files of the table, or a glob pattern.
+    - con: DuckDBPyConnection, a duckdb connection
+    - table_name: str, the name of the table to create/load into.
+    - accept_additional_col: bool, if True, add additional columns in csv to duckdb. If False, will throw an error if addtional col in csv
+    - cast_failure_schema: str, schema of the cast failure tables. Defaults to 'cast_failures'.
+    - manifest: Optional[SubmissionManifest], scanned submission files. Headers and sizes are read from the manifest instead of the files.
+
+    If PersonSample is enabled and the csv has a person_id column, only the rows of the sampled persons are staged.
+
+    Returns:
+    - duckdb.Connection object connected to the database.
+    """
+    csv_header = [item.lower() for item in _get_submission_header(csv_path, table_name, 'csv', manifest)]
+    duckdb_columns = con.execute(f'DESCRIBE {table_name}').df()['column_name'].tolist()
+    if (set(csv_header) - set(duckdb_columns)):
+        if accept_additional_col:
+            for col in set(csv_header) - set(duckdb_columns):
+                con.execute(f'ALTER TABLE {table_name} ADD COLUMN {col} VARCHAR;')
+                LOGGER.warning(f"column {col} exists in csv, but not in duckdb ddl. Added '{col} VARCHAR' to duckdb. ")
+            CatalogCache.invalidate()
+        else:
+            raise ValueError(f"CSV file has additional columns {set(csv_header) - set(duckdb_columns)} not in duckdb table {table_name} and accept_additional_col is set to False.")
+    column_types = {item[0]: item[1] for item in con.execute(f'DESCRIBE {table_name}').fetchall()}
+    typed_columns = [col for col in csv_header if column_types[col] != 'VARCHAR']
+    staging_table = f'staging_{table_name}'
+    columns_str = '{' + ', '.join(f"'{col}': 'VARCHAR'" for col in csv_header) + '}'
+    # temporary table of the connection, spilled to the temp directory if it does not fit in memory
+    sample_filter = PersonSample.get_filter(csv_header)
+    staging_sql = f"""CREATE OR REPLACE TEMP TABLE {staging_table} AS SELECT * FROM read_csv('{get_csv_source(csv_path)}', columns={columns_str}, {get_read_csv_options(CONFIG['duckdb']['copy_options'])}, auto_detect=false){f' WHERE {sample_filter}' if sample_filter else ''};"""
+    select_columns = [f'TRY_CAST("{col}" AS {column_types[col]}) AS "{col}"' if col in typed_columns else f'"{col}"' for col in csv_header]
+    insert_sql = f"""INSERT INTO {table_name} ({', '.join(csv_header)}) SELECT {', '.join(select_columns)} FROM {staging_table};"""
+    # a cast failure is a value that is not NULL in the file but NULL after TRY_CAST
+    failure_filters = {col: f'"{col}" IS NOT NULL AND TRY_CAST("{col}" AS {column_types[col]}) IS NULL' for col in typed_columns}
+    failure_sql = f"""
+        CREATE SCHEMA IF NOT EXISTS {cast_failure_schema};
+        CREATE OR REPLACE TABLE {cast_failure_schema}.{table_name} (column_name VARCHAR, column_type VARCHAR, row_count BIGINT, failure_count BIGINT, sample_value VARCHAR);
+    """
+    if typed_columns:
+        failure_sql += f"""
+        INSERT INTO {cast_failure_schema}.{table_name}
+        SELECT UNNEST([{', '.join(f"'{col}'" for col in typed_columns)}]) AS column_name,
+            UNNEST([{', '.join(f"'{column_types[col]}'" for col in typed_columns)}]) AS column_type,
+            row_count,
+            UNNEST([{', '.join(f'"failure_count_{i}"' for i in range(len(typed_columns)))}]) AS failure_count,
+            UNNEST([{', '.join(f'"sample_value_{i}"' for i in range(len(typed_columns)))}]) AS sample_value
+        FROM (
+            SELECT COUNT(*) AS row_count,
+                {', '.join(f'COUNT(*) FILTER (WHERE {failure_filters[col]}) AS "failure_count_{i}", ANY_VALUE("{col}") FILTER (WHERE {failure_filters[col]}) AS "sample_value_{i}"' for i, col in enumerate(typed_columns))}
+            FROM {staging_table}
+        );
+        """
+    count_before_load = get_table_count(con, table_name)
+    LOGGER.info(f"Loading CSV file(s) from {csv_path} to {table_name} through staging table {staging_table}...")
+    LOGGER.debug(f"Executing SQL: {staging_sql}\n{insert_sql}")
+    with ProcessLog(f"load {table_name}", category='load', table_name=table_name, bytes_read=manifest.get_size(csv_path) if manifest else get_path_size(csv_path)) as process:
+        try:
+            con.execute(staging_sql)
+            # INSERT returns the number of inserted rows
+            count_after_load = count_before_load + con.execute(insert_sql).fetchone()[0]
+            con.execute(failure_sql)
+            CatalogCache.invalidate()
+        except Exception as e:
+            TableStats.invalidate(table_name)
+            LOGGER.error(f"Fail to load CSV to DuckDB: table={table_name}, csv={csv_path}")
+            raise
+        finally:
+            con.execute(f"DROP TABLE IF EXISTS {staging_table};")
+        TableStats.set_row_count(table_name, count_after_load)
+        if sample_filter:
+            PersonSample.add_sampled_table(table_name)
+        process.rows_processed = count_after_load - count_before_load
     LOGGER.info(f"Loaded {count_after_load - count_before_load} rows into {table_name}.")
+    failure_count = con.execute(f"SELECT COALESCE(SUM(failure_count), 0) FROM {cast_failure_schema}.{table_name}").fetchone()[0]
+    if failure_count > 0:
+        LOGGER.warning(f"{failure_count} value(s) of {csv_path} could not be cast to the column types of {table_name} and were loaded as NULL. See table {cast_failure_schema}.{table_name}.")
     return con
 
-def load_parquet_to_duckdb(parquet_path: str, con: DuckDBPyConnection, table_name: str, accept_additional_col: bool = True):
+def get_cast_failure_columns(con: DuckDBPyConnection, table_name: str, cast_failure_schema: str = 'cast_failures') -> List[str]:
+    """
+    Get the typed columns of a table loaded by load_csv_to_duckdb_staging, i.e. the columns with cast failure statistics.
+    Empty if the table was not loaded through a staging table.
+    """
+    if not table_exists(con, table_name, cast_failure_schema):
+        return []
+    return [item[0] for item in con.execute(f"SELECT column_name FROM {cast_failure_schema}.{table_name} ORDER BY column_name").fetchall()]
+
+def load_parquet_to_duckdb(parquet_path: str, con: DuckDBPyConnection, table_name: str, accept_additional_col: bool = True, manifest: Optional[SubmissionManifest] = None):
     """
     Loads a Parquet file into a DuckDB table. Any additional column in parquet will be added to database
 
@@ -97,11 +381,15 @@ def load_parquet_to_duckdb(parquet_path: str, con: DuckDBPyConnection, table_nam
     - con: DuckDBPyConnection, a duckdb connection
     - table_name: str, the name of the table to create/load into.
     - accept_additional_col: bool, if True, add additional columns in parquet to duckdb. If False, will throw an error if addtional col in parquet
+    - manifest: Optional[SubmissionManifest], scanned submission files. Headers and sizes are read from the manifest instead of the files.
+
+    If PersonSample is enabled and the parquet has a person_id column, only the rows of the sampled persons are loaded,
+    with an INSERT ... SELECT from read_parquet instead of COPY.
 
     Returns:
     - duckdb.Connection object connected to the database.
     """
-    parquet_header = [item.lower() for item in get_parquet_header(parquet_path)]
+    parquet_header = [item.lower() for item in _get_submission_header(parquet_path, table_name, 'parquet', manifest, con=con)]
     duckdb_columns = con.execute(f'DESCRIBE {table_name}').df()['column_name'].tolist()
     # if parquet has more columns than duckdb
     if (set(parquet_header) - set(duckdb_columns)):
@@ -109,17 +397,114 @@ def load_parquet_to_duckdb(parquet_path: str, con: DuckDBPyConnection, table_nam
             for col in set(parquet_header) - set(duckdb_columns):
                 con.execute(f'ALTER TABLE {table_name} ADD COLUMN {col} VARCHAR;')
                 LOGGER.warning(f"column {col} exists in parquet, but not in duckdb ddl. Added '{col} VARCHAR' to duckdb. ")
+            CatalogCache.invalidate()
         else:
             raise ValueError(f"Parquet file has additional columns {set(parquet_header) - set(duckdb_columns)} not in duckdb table {table_name} and accept_additional_col is set to False.")
     count_before_load = get_table_count(con, table_name)
     LOGGER.info(f"Loading {parquet_path} to {table_name}...")
-    copy_sql = f"""COPY {table_name} ({', '.join(parquet_header)}) FROM '{parquet_path}' ({CONFIG['duckdb']['copy_options']});"""
+    sample_filter = PersonSample.get_filter(parquet_header)
+    if sample_filter:
+        copy_sql = f"""INSERT INTO {table_name} ({', '.join(parquet_header)}) SELECT {', '.join(f'"{col}"' for col in parquet_header)} FROM read_parquet('{parquet_path}') WHERE {sample_filter};"""
+    else:
+        copy_sql = f"""COPY {table_name} ({', '.join(parquet_header)}) FROM '{parquet_path}' ({CONFIG['duckdb']['copy_options']});"""
     LOGGER.debug(f"Executing SQL: {copy_sql}")
-    try:
-        con.execute(copy_sql)
-    except Exception as e:
-        LOGGER.error(f"Fail to load Parquet to DuckDB: table={table_name}, parquet={parquet_path}")
-        raise
-    count_after_load = get_table_count(con, table_name)
+    with ProcessLog(f"load {table_name}", category='load', table_name=table_name, bytes_read=manifest.get_size(parquet_path) if manifest else get_path_size(parquet_path)) as process:
+        try:
+            count_after_load = count_before_load + con.execute(copy_sql).fetchone()[0]
+        except Exception as e:
+            TableStats.invalidate(table_name)
+            LOGGER.error(f"Fail to load Parquet to DuckDB: table={table_name}, parquet={parquet_path}")
+            raise
+        TableStats.set_row_count(table_name, count_after_load)
+        if sample_filter:
+            PersonSample.add_sampled_table(table_name)
+        process.rows_processed = count_after_load - count_before_load
     LOGGER.info(f"Loaded {count_after_load - count_before_load} rows into {table_name}.")
-    return con
\ No newline at end of file
+    return con
+
+def load_table_to_duckdb(
+        file_path: str,
+        con: DuckDBPyConnection,
+        table_name: str,
+        file_format: str = 'csv',
+        accept_additional_col: bool = True,
+        store_rejects: bool = False,
+        manifest: Optional[SubmissionManifest] = None,
+        staging: bool = False
+    ):
+    """
+    Loads the submission file(s) of one table into DuckDB with the loader of the file format:
+    load_csv_to_duckdb, load_csv_to_duckdb_staging or load_parquet_to_duckdb.
+
+    Parameters:
+    - file_path: str, path to the CSV/Parquet file, a directory containing the files of the table, or a glob pattern.
+    - con: DuckDBPyConnection, a duckdb connection
+    - table_name: str, the name of the table to load.
+    - file_format: str, 'csv' or 'parquet'.
+    - accept_additional_col: bool, passed to the loader.
+    - store_rejects: bool, passed to load_csv_to_duckdb. Reject capture is not supported for parquet files.
+    - manifest: Optional[SubmissionManifest], scanned submission files, passed to the loader.
+    - staging: bool, if True, csv files are loaded with load_csv_to_duckdb_staging (TRY_CAST from an all-VARCHAR staging table) instead of a typed COPY.
+    """
+    if file_format == 'csv' and staging:
+        load_csv_to_duckdb_staging(csv_path=file_path, con=con, table_name=table_name, accept_additional_col=accept_additional_col, manifest=manifest)
+    elif file_format == 'csv':
+        load_csv_to_duckdb(csv_path=file_path, con=con, table_name=table_name, accept_additional_col=accept_additional_col, store_rejects=store_rejects, manifest=manifest)
+    elif file_format == 'parquet':
+        load_parquet_to_duckdb(parquet_path=file_path, con=con, table_name=table_name, accept_additional_col=accept_additional_col, manifest=manifest)
+    else:
+        raise ValueError(f"Unsupported file_format: {file_format}. Supported types are 'csv' and 'parquet'.")
+
+def create_duckdb_view(file_path: str, con: DuckDBPyConnection, table_name: str, file_format: str = 'csv', manifest: Optional[SubmissionManifest] = None):
+    """
+    Exposes a submission file (or all files of a table) as a view named after the table, instead of copying the data into DuckDB.
+    Checks then run directly against the files: DuckDB pushes column projection and filters down to the file scan,
+    and skips parquet row groups using their min/max and null count statistics.
+
+    The table must already exist (created by create_duckdb_tables). It is replaced by the view and its column types are used:
+    csv columns are read with the data model types. Parquet columns keep the types in the file, so filters are pushed down
+    to the row groups, except columns whose type differs from the data model type: they are read with CAST, so a value that
+    cannot be cast fails the queries of the view instead of being read as NULL, and their null counts are not answered
+    from the parquet footers (see ParquetFooterStats.set_cast_columns).
+    Data model columns missing from the file are exposed as NULL columns, the same as a loaded table.
+    If PersonSample is enabled and the file has a person_id column, the view only exposes the rows of the sampled persons.
+
+    Parameters:
+    - file_path: str, path to the CSV/Parquet file, a directory containing the files of the table, or a glob pattern.
+    - con: DuckDBPyConnection, a duckdb connection
+    - table_name: str, the name of the table to replace with a view.
+    - file_format: str, 'csv' or 'parquet'.
+    - manifest: Optional[SubmissionManifest], scanned submission files. Headers are read from the manifest instead of the files.
+
+    Returns:
+    - duckdb.Connection object connected to the database.
+    """
+    table_column_types = {item[0]: item[1] for item in con.execute(f'DESCRIBE {table_name}').fetchall()}
+    if file_format not in ('csv', 'parquet'):
+        raise ValueError(f"Unsupported file_format: {file_format}. Supported types are 'csv' and 'parquet'.")
+    file_header = [item.lower() for item in _get_submission_header(file_path, table_name, file_format, manifest, con=con)]
+    cast_columns = []
+    if file_format == 'csv':
+        columns_str = '{' + ', '.join(f"'{col}': '{table_column_types.get(col, 'VARCHAR')}'" for col in file_header) + '}'
+        source_sql = f"read_csv('{get_csv_source(file_path)}', columns={columns_str}, {get_read_csv_options(CONFIG['duckdb']['copy_options'])}, auto_detect=false)"
+    else:
+        source_sql = f"read_parquet('{file_path}')"
+        # only the footer is read. A cast column is not pushed down to the row groups, cast the columns of another type only
+        file_column_types = {item[0].lower(): item[1] for item in con.execute(f'DESCRIBE SELECT * FROM {source_sql}').fetchall()}
+        cast_columns = [col for col in file_header if col in table_column_types and file_column_types.get(col) != table_column_types[col]]
+    file_columns = [f'CAST("{col}" AS {table_column_types[col]}) AS "{col}"' if col in cast_columns else f'"{col}"' for col in file_header]
+    select_columns = file_columns + [f'NULL::{col_type} AS "{col}"' for col, col_type in table_column_types.items() if col not in file_header]
+    sample_filter = PersonSample.get_filter(file_header)
+    view_sql = f"""DROP TABLE IF EXISTS {table_name};\nCREATE VIEW {table_name} AS SELECT {', '.join(select_columns)} FROM {source_sql}{f' WHERE {sample_filter}' if sample_filter else ''};"""
+    LOGGER.debug(f"Executing SQL: {view_sql}")
+    with ProcessLog(f"create view {table_name}", category='load'):
+        con.execute(view_sql)
+    CatalogCache.invalidate()
+    TableStats.invalidate(table_name)
+    ParquetFooterStats.set_cast_columns(table_name, cast_columns)
+    if sample_filter:
+        PersonSample.add_sampled_table(table_name)
+    if cast_columns:
+        LOGGER.info(f"Columns of {file_path} with another type than the data model are cast in view {table_name}: {cast_columns}")
+    LOGGER.info(f"Created view {table_name} over {file_path}.")
+    return con
@@ -1,281 +1,193 @@
 from src.config import CONFIG, LOGGER
 from src.dq_checks.check_result import CheckResult
-from src.load_duckdb import create_duckdb_tables, load_csv_to_duckdb, init_duckdb_logging_schema, load_parquet_to_duckdb
+from src.load_duckdb import create_duckdb_tables, init_duckdb_logging_schema, finish_duckdb_logging_run, get_cast_failure_columns, get_unchanged_tables, clear_table_fingerprints
 from src.data_model import DataModel
-from src.constants import OPTIONAL_TABLES
-from src.dq_checks.check_file_completeness import check_missing_submission_file, check_extra_submission_file
-from src.dq_checks.check_header import check_duplicated_column_in_csv, check_extra_column_in_csv, check_missing_column_in_csv, check_extra_column_in_parquet, check_missing_column_in_parquet
-from src.dq_checks.check_fk import check_fk_violation
-from src.dq_checks.check_not_null import check_not_null_violation
-from src.dq_checks.check_distinct import check_distinct_violation
-from src.dq_checks.check_fact_relationship import check_fact_relationship
+from src.util import get_path_fingerprint
+from src.process_log import ProcessLog
+from src.submission_manifest import SubmissionManifest
+from src.parquet_stats import ParquetFooterStats
+from src.resource_planner import ResourcePlanner
+from src.catalog_cache import CatalogCache
+from src.table_stats import TableStats
+from src.person_sample import PersonSample
+from src.check_scheduler import CheckScheduler
+from src.run_tasks import RunContext, init_skip_lists, get_load_mode, get_store_rejects, check_submission_files, load_table, get_load_tasks, register_checks
+from src.dq_checks.check_fk import ReferenceKeySets
+from src.dq_checks.check_load_reject import check_load_reject
+from src.dq_checks.check_type_conformance import check_type_conformance
 import duckdb
 import os
-import fnmatch
+import argparse
 from datetime import datetime
 
-class _Context():
-    '''An explicit context class to hold dynamic state variables during the DQ run.'''
-    def __init__(
-        self, 
-        run_id: str, 
-        skip_check_tables: list = [],
-        skip_check_columns: dict = {}, # a dict of {table_name: (column_name, ...)}
-        skip_duckdb_load_tables: list = [],
-        **kwargs
-    ):
-        self.run_id = run_id
-        self.skip_check_tables = skip_check_tables
-        self.skip_duckdb_load_tables = skip_duckdb_load_tables
-        self.skip_check_columns = skip_check_columns
-        for key, value in kwargs.items():
-            setattr(self, key, value)
-
 def main():
     run_id = CONFIG['core'].get(
         'run_id', 
         datetime.now().strftime("%Y-%m-%d_%H:%M:%S.%f")
     )
     CheckResult.run_id = run_id
-    context = _Context(run_id=run_id) # initialize context.
+    context = RunContext(run_id=run_id) # initialize context.
     with duckdb.connect(CONFIG['duckdb']['path']) as con:
         if CONFIG['duckdb'].get('memory_limit', None):
             con.execute(f"SET memory_limit='{CONFIG['duckdb']['memory_limit']}'")
         con.execute("SET preserve_insertion_order=false")
         init_duckdb_logging_schema(con, run_id, CONFIG)
+        ProcessLog.run_id = run_id
+        ProcessLog.duckdb_conn = con
+        ProcessLog.logger = LOGGER
+        # answer table_exists / column_exists from a catalog snapshot, invalidated by the DDL of the loaders
+        CatalogCache.enable(con)
+        # row counts of the tables, recorded by the loads and reused by the checks
+        TableStats.enable()
+        # keep a deterministic fraction of the persons in every table with a person_id, for a fast pre-submission run
+        if CONFIG['duckdb'].get('sample_fraction', None):
+            PersonSample.enable(float(CONFIG['duckdb']['sample_fraction']))
+            LOGGER.warning(f"Sampling mode: tables with a person_id are loaded for {PersonSample.fraction:.2%} of the persons. Violation rates are estimates, see their confidence_interval.")
         LOGGER.info(f"Run ID: {run_id}.\nRunning with config: " + str(CONFIG))  
         # get data models
-        LOGGER.info(f"Loading data models with config: {CONFIG['data-models']}")
-        data_model = DataModel(**CONFIG['data-models'])
-        #data_models_dict = data_model.data
-        LOGGER.info("Data models loaded successfully. ")
-
-        context.skip_check_tables = list(OPTIONAL_TABLES)
-        context.skip_check_columns = dict() # a dict of {table_name: (column_name, ...)}
-        _skip_duckdb_load_table_patterns = list(CONFIG['duckdb'].get('skip_load', []))
-        context.skip_duckdb_load_tables = [table for table in data_model.all_table_names() if any(fnmatch.fnmatch(table, pattern) for pattern in _skip_duckdb_load_table_patterns)]
-        LOGGER.debug(f"Tables to skip loading into DuckDB from config: {context.skip_duckdb_load_tables}")
+        with ProcessLog('fetch data model'):
+            LOGGER.info(f"Loading data models with config: {CONFIG['data-models']}")
+            data_model = DataModel(**CONFIG['data-models'])
+            #data_models_dict = data_model.data
+            LOGGER.info("Data models loaded successfully. ")
 
-        # Initialize DuckDB database
-        LOGGER.info("Initializing DuckDB database.")
-        create_duckdb_tables(data_model, con, skip_tables = context.skip_duckdb_load_tables, recreate = True)
-        LOGGER.info("DuckDB tables created successfully.")
+        init_skip_lists(context, data_model)
 
-        # check submission files completeness
         submission_dir = CONFIG['submission_files']['dir']
         submission_file_format = CONFIG['submission_files'].get('file_format', 'csv')
         if_multiple_file_per_table = CONFIG['submission_files'].get('multiple_file_per_table', False)
 
-        LOGGER.debug("Checking submission files completeness.")
-        required_cdm_tables = tuple(set(data_model.all_table_names()) - set(OPTIONAL_TABLES) - set(context.skip_duckdb_load_tables))
-        check_result_missing_submission_file = check_missing_submission_file(
-            file_dir = submission_dir,
-            cdm_tables_expected = required_cdm_tables,
-            file_format = submission_file_format,
-            multiple_file_per_table = if_multiple_file_per_table,
-            duckdb_conn = con
-        )
-        if check_result_missing_submission_file.status not in ('PASS', 'SKIPPED'):
-            # skip checks for missing tables
-            context.skip_check_tables.extend(check_result_missing_submission_file.table_name)
-            context.skip_duckdb_load_tables.extend(check_result_missing_submission_file.table_name)
-
-        LOGGER.debug("Checking for extra submission files.")
-        check_result_extra_submission_file = check_extra_submission_file(
-            file_dir = submission_dir,
-            cdm_tables_expected = data_model.all_table_names(),
-            file_format = submission_file_format,
-            multiple_file_per_table = if_multiple_file_per_table,
-            duckdb_conn = con
-        )
-
-        # Check header issues
-        if submission_file_format not in ('csv', 'parquet'):
-            raise ValueError(f"Unsupported submission file format: {submission_file_format}. Supported formats are 'csv' and 'parquet'.")
-        # TODO: implement csv header checks for multiple files per table later
-        if submission_file_format == 'csv' and if_multiple_file_per_table:
-            raise NotImplementedError("Header checks for multiple files per table in CSV format are not implemented yet. For now, please merge your csv files into single file.")
-        if submission_file_format == 'csv' and not if_multiple_file_per_table:
-            submission_file_extension = '.csv'
-            # check header issues
-            for table_name in data_model.all_table_names():
-                # check if file exists for the table
-                file_path = f"{submission_dir}/{table_name}{submission_file_extension}"
-                if not os.path.isfile(file_path):
-                    LOGGER.debug(f"No submission file found for table {table_name}. Skipping header checks. Path: {file_path}")
-                    continue
-                LOGGER.debug(f"Checking header for table: {table_name}, file: {file_path}")
-                # check duplicated columns in csv
-                check_result_duplicated_column = check_duplicated_column_in_csv(file_path, table_name)
-                if check_result_duplicated_column.status != 'PASS':
-                    # if the csv has duplicated columns, don't load the table to duckdb
-                    context.skip_duckdb_load_tables.append(table_name)
-                    context.skip_check_tables.append(table_name)
-                # check extra columns in csv
-                check_result_extra_column = check_extra_column_in_csv(file_path, data_model, table_name, duckdb_conn=con)
-                # check missing columns in csv
-                check_result_missing_column = check_missing_column_in_csv(file_path, data_model, table_name, duckdb_conn=con)
-                if check_result_missing_column.status != 'PASS':
-                    context.skip_check_columns[table_name] = context.skip_check_columns.get(table_name, tuple()) + check_result_missing_column.column_name
-        if submission_file_format == 'parquet':
-            if if_multiple_file_per_table:
-                submission_file_extension = ''
-            else:
-                submission_file_extension = '.parquet'
-            # check header issues
-            for table_name in data_model.all_table_names():
-                file_path = f"{submission_dir}/{table_name}{submission_file_extension}"
-                # check if file_path exists
-                if not os.path.exists(file_path):
-                    LOGGER.debug(f"No submission file found for table {table_name}. Skipping header checks. Path: {file_path}")
-                    continue
-                LOGGER.debug(f"Checking header for table: {table_name}, file: {file_path}")
-                # check extra columns in parquet
-                check_result_extra_column = check_extra_column_in_parquet(file_path, data_model, table_name, duckdb_conn=con)
-                # check missing columns in parquet
-                check_result_missing_column = check_missing_column_in_parquet(file_path, data_model, table_name, duckdb_conn=con)
-                if check_result_missing_column.status != 'PASS':
-                    context.skip_check_columns[table_name] = context.skip_check_columns.get(table_name, tuple()) + check_result_missing_column.column_name
-        # Load submission files into DuckDB
-        LOGGER.info("Loading submission files into DuckDB.")
-        # TODO: implement csv load for multiple files per table later
-        if submission_file_format == 'csv' and if_multiple_file_per_table:
-            raise NotImplementedError("Loading multiple files per table in CSV format into DuckDB is not implemented yet. Please merge your csv files into single file per table.")
-        if submission_file_format == 'csv' and not if_multiple_file_per_table:
-            submission_file_extension = '.csv'
-            # Loading csv files to DuckDB
-            for table_name in data_model.all_table_names():
-                file_path = f"{submission_dir}/{table_name}{submission_file_extension}"
-                if not os.path.isfile(file_path):
-                    LOGGER.debug(f"No submission file found for table {table_name}. Skipping DuckDB load. Path: {file_path}")
-                    continue
-                if table_name in context.skip_duckdb_load_tables:
-                    LOGGER.debug(f"Skipping loading {table_name} to DuckDB as it is in the skip list.")
-                    continue
-                LOGGER.info(f"Loading {file_path} into DuckDB table {table_name}.")
-                load_csv_to_duckdb(csv_path=file_path, con=con, table_name=table_name, accept_additional_col=True)
-        if submission_file_format == 'parquet':
-            if if_multiple_file_per_table:
-                submission_file_extension = ''
-            else:
-                submission_file_extension = '.parquet'
-            # Loading parquet files to DuckDB
-            for table_name in data_model.all_table_names():
-                file_path = f"{submission_dir}/{table_name}{submission_file_extension}"
-                # check if file_path exists
-                if not os.path.exists(file_path):
-                    LOGGER.debug(f"No submission file found for table {table_name}. Skipping DuckDB load. Path: {file_path}")
-                    continue
-                if table_name in context.skip_duckdb_load_tables:
-                    LOGGER.debug(f"Skipping loading {table_name} to DuckDB as it is in the skip list.")
-                    continue
-                LOGGER.info(f"Loading {file_path} into DuckDB table {table_name}.")
-                load_parquet_to_duckdb(parquet_path=file_path, con=con, table_name=table_name, accept_additional_col=True)
-
-
-        LOGGER.info("All submission files loaded into DuckDB successfully.")
-        
-        # Check foreign key violations
-        LOGGER.info("Checking foreign key violations.") 
-        for fk_definition in data_model.data['schema']['constraints']['foreign_keys']:
-            main_table = fk_definition['source_table']
-            main_column = fk_definition['source_field']
-            reference_table = fk_definition['target_table']
-            reference_column = fk_definition['target_field']
-            if main_table in context.skip_check_tables:
-                LOGGER.debug(f"Skipping foreign key check for {main_table}.{main_column} referencing {reference_table}.{reference_column} as main table is in the skip list.")
-                continue
-            if reference_table in context.skip_check_tables or reference_table in context.skip_check_tables:
-                LOGGER.debug(f"Skipping foreign key check for {main_table}.{main_column} referencing {reference_table}.{reference_column} as reference table is in the skip list.")
-                continue
-            if main_table in context.skip_check_columns.keys() and main_column in context.skip_check_columns[main_table]:
-                LOGGER.debug(f"Skipping foreign key check for {main_table}.{main_column} referencing {reference_table}.{reference_column} as the main column is in the skip list.")
-                continue
-            if reference_table in context.skip_check_columns.keys() and reference_column in context.skip_check_columns[reference_table]:
-                LOGGER.debug(f"Skipping foreign key check for {main_table}.{main_column} referencing {reference_table}.{reference_column} as the reference column is in the skip list.")
-                continue
-            check_result_fk = check_fk_violation(
-                con=con,
-                main_table=main_table,
-                main_column=main_column,
-                reference_table=reference_table,
-                reference_column=reference_column,
-            )
-            LOGGER.debug(f"Foreign Key Check Finished.")
-        
-        # Check Not Null violations
-        for not_null_definition in data_model.data['schema']['constraints']['not_null']:
-            table_name = not_null_definition['table']
-            column_name = not_null_definition['field']
-
-            if table_name in context.skip_check_tables:
-                LOGGER.debug(f"Skipping Not Null check for {table_name}.{column_name} as table is in the skip list.")
-                continue
-            if table_name in context.skip_check_columns.keys() and column_name in context.skip_check_columns[table_name]:
-                LOGGER.debug(f"Skipping Not Null check for {table_name}.{column_name} as column is in the skip list.")
-                continue
-            check_result_not_null = check_not_null_violation(
-                con=con,
-                table_name=table_name,
-                column_name=column_name,
+        load_mode = get_load_mode(submission_file_format)
+        store_rejects = get_store_rejects(submission_file_format, load_mode)
+
+        # Scan submission files once. Headers, sizes and parquet row counts are read from the manifest by the checks and loaders below.
+        with ProcessLog('scan submission files'):
+            manifest = SubmissionManifest(
+                file_dir = submission_dir,
+                file_format = submission_file_format,
+                multiple_file_per_table = if_multiple_file_per_table
+            ).scan(con=con)
+
+        # Pick DuckDB threads, memory limit and spill settings from the submission size and the host, changed per stage below
+        planner = None
+        if CONFIG['duckdb'].get('resource_planner', True):
+            table_sizes = [manifest.get_size(manifest.get_table_path(table_name)) for table_name in manifest.table_names()]
+            planner = ResourcePlanner(
+                submission_size = sum(table_sizes),
+                largest_table_size = max(table_sizes, default=0),
+                duckdb_path = CONFIG['duckdb']['path'],
+                memory_limit = CONFIG['duckdb'].get('memory_limit', None),
+                threads = CONFIG['duckdb'].get('threads', None),
+                temp_directory = CONFIG['duckdb'].get('temp_directory', None),
+                max_temp_directory_size = CONFIG['duckdb'].get('max_temp_directory_size', None),
             )
-            LOGGER.debug(f"Not Null Check Finished.")
 
-        # Check Distinct violations
-        for distinct_definition in data_model.data['schema']['constraints']['uniques']:
-            table_name = distinct_definition['table']
-            column_name = distinct_definition['field']
+        # Find tables unchanged since last load, these tables are not recreated or reloaded
+        context.unchanged_tables = dict() # a dict of {table_name: stored fingerprint}
+        if CONFIG['duckdb'].get('skip_unchanged_tables', False) and load_mode in ('copy', 'staging') and not PersonSample.is_enabled():
+            with ProcessLog('fingerprint submission files'):
+                submission_paths = {
+                    table_name: manifest.get_table_path(table_name) for table_name in data_model.all_table_names() 
+                    if table_name not in context.skip_duckdb_load_tables and os.path.exists(manifest.get_table_path(table_name))
+                }
+                context.unchanged_tables = get_unchanged_tables(con, submission_paths, data_model, content_hash=CONFIG['duckdb'].get('fingerprint_content_hash', False), load_mode=load_mode, store_rejects=store_rejects)
+                LOGGER.info(f"Submission files unchanged since last load, skip reloading table(s): {list(context.unchanged_tables.keys())}")
 
-            if table_name in context.skip_check_tables:
-                LOGGER.debug(f"Skipping Distinct check for {table_name}.{column_name} as table is in the skip list.")
-                continue
-            if table_name in context.skip_check_columns.keys() and column_name in context.skip_check_columns[table_name]:
-                LOGGER.debug(f"Skipping Distinct check for {table_name}.{column_name} as column is in the skip list.")
-                continue
-            check_result_distinct = check_distinct_violation(
-                con=con,
+        # Initialize DuckDB database
+        with ProcessLog('create duckdb tables'):
+            LOGGER.info("Initializing DuckDB database.")
+            create_duckdb_tables(data_model, con, skip_tables = context.skip_duckdb_load_tables + list(context.unchanged_tables.keys()), recreate = True)
+            clear_table_fingerprints(con, [table_name for table_name in data_model.all_table_names() if table_name not in context.skip_duckdb_load_tables and table_name not in context.unchanged_tables])
+            LOGGER.info("DuckDB tables created successfully.")
+
+        # check submission files completeness and headers, update the skip lists
+        check_submission_files(context, data_model, manifest, con=con)
+
+        # Load submission files into DuckDB and run the checks in one dependency graph: the checks of a table start
+        # as soon as the table and the tables it references are loaded, alongside the remaining loads
+        use_parquet_statistics = submission_file_format == 'parquet' and CONFIG['duckdb'].get('use_parquet_statistics', True)
+        load_tasks = get_load_tasks(context, data_model, manifest) # a dict of {table_name: file_path}
+        # fingerprint files before loading, so changes made during the load are detected by the next run
+        load_fingerprints = dict()
+        if load_mode != 'external':
+            load_fingerprints = {
+                table_name: get_path_fingerprint(file_path, content_hash=CONFIG['duckdb'].get('fingerprint_content_hash', False)) for table_name, file_path in load_tasks.items()
+            }
+        for table_name in context.unchanged_tables:
+            # kept tables were loaded with the same load mode and reject capture, report the checks of their load again
+            if store_rejects:
+                check_load_reject(con=con, table_name=table_name)
+            for column_name in get_cast_failure_columns(con, table_name):
+                check_type_conformance(con=con, table_name=table_name, column_name=column_name)
+            if use_parquet_statistics:
+                ParquetFooterStats.register(table_name, manifest.get_files(manifest.get_table_path(table_name)))
+
+        # loads and checks share the workers, each task runs on its own cursor and DuckDB shares its threads between them
+        workers = max(int(CONFIG['duckdb'].get('load_workers', 1)), int(CONFIG['duckdb'].get('check_workers', 1)))
+        # the 'load' settings are used while tables are loaded, the 'join' settings once the last load finishes:
+        # foreign key and distinct checks dominate the memory use
+        scheduler = CheckScheduler(
+            con,
+            max_workers=workers,
+            skip_tables=context.skip_check_tables,
+            on_tables_provided=(lambda: planner.apply(con, 'join')) if planner else None,
+        )
+        # key sets are shared by the foreign key checks of all tables. Temporary tables are only visible to their cursor
+        key_sets = ReferenceKeySets(con, schema='fk_keys' if workers > 1 else None)
+        failed_load_tables = dict() # a dict of {table_name: exception}, filled by the load tasks
+        # largest file first, so big tables (e.g. measurement, observation) start first and small tables and checks fill the idle workers
+        ordered_tables = sorted(load_tasks.keys(), key=lambda table_name: manifest.get_size(load_tasks[table_name]), reverse=True)
+        LOGGER.info(f"Loading {len(ordered_tables)} table(s) into DuckDB with load_mode '{load_mode}'. Load order: {ordered_tables}")
+        for table_name in ordered_tables:
+            scheduler.add(
+                f"load {table_name}",
+                load_table,
+                provides_table=table_name,
                 table_name=table_name,
-                column_names=column_name,
+                file_path=load_tasks[table_name],
+                context=context,
+                data_model=data_model,
+                manifest=manifest,
+                load_mode=load_mode,
+                failed_load_tables=failed_load_tables,
+                store_rejects=store_rejects,
+                fingerprint=load_fingerprints.get(table_name),
+                use_parquet_statistics=use_parquet_statistics,
             )
-            LOGGER.debug(f"Distinct Check Finished.")
-        
-        # Check PK violations
-        # PK is a combination of NOT NULL and DISTINCT
-        for pk_definition in data_model.data['schema']['constraints']['primary_keys']:
-            table_name = pk_definition['table']
-            column_names = tuple(pk_definition['fields'])  # list of columns in the primary key
 
-            if table_name in context.skip_check_tables:
-                LOGGER.debug(f"Skipping Primary Key check for {table_name}({', '.join(column_names)}) as table is in the skip list.")
-                continue
-            if table_name in context.skip_check_columns.keys() and any(col in context.skip_check_columns[table_name] for col in column_names):
-                LOGGER.debug(f"Skipping Primary Key check for {table_name}({', '.join(column_names)}) as one or more columns are in the skip list.")
-                continue
-            # check not null for each column in the primary key
-            for column_name in column_names:
-                check_result_pk_not_null = check_not_null_violation(
-                    con=con,
-                    table_name=table_name,
-                    column_name=column_name,
-                )
-                LOGGER.debug(f"Primary Key Not Null Check Finished for {table_name}.{column_name}.")
-            # check distinct for the combination of columns in the primary key
-            check_result_pk_distinct = check_distinct_violation(
-                con=con,
-                table_name=table_name,
-                column_names=column_names
+        register_checks(scheduler, data_model, context, key_sets, con=con)
+
+        if planner and load_tasks:
+            planner.apply(con, 'load')
+        with ProcessLog('load and check'):
+            try:
+                check_results = scheduler.run()
+            finally:
+                key_sets.drop()
+                # statistics of the tables of this run must not answer the next run of the process (e.g. tests, or plan then a run)
+                ParquetFooterStats.unregister()
+                CatalogCache.disable()
+                LOGGER.info(f"Table row counts: {TableStats.hits} lookup(s) answered from the registry, {TableStats.misses} counted.")
+                TableStats.disable()
+                PersonSample.disable()
+        if failed_load_tables:
+            # checks of tables failed to load are not run, fail the run
+            check_result_load = CheckResult(
+                check_type = 'table_load_failure',
+                status = 'FAIL',
+                table_name = tuple(failed_load_tables.keys()),
+                file_name = tuple(load_tasks[table_name] for table_name in failed_load_tables.keys()),
+                troubleshooting_message = 'Failed to load above table(s) into DuckDB. Errors: ' + '; '.join(f"{table_name}: {e}" for table_name, e in failed_load_tables.items())
             )
-            LOGGER.debug(f"Primary Key Distinct Check Finished for {table_name}({', '.join(column_names)}).")
-            LOGGER.debug(f"Primary Key Check Finished for {table_name}.{column_names}.")
-
-        # Check fact_relationship
-        check_result_fact_relationship = check_fact_relationship(
-            con=con,
-            skip_tables = context.skip_check_tables
-        )
+            check_result_load.log(LOGGER, duckdb_conn=con)
+        LOGGER.info("Finished loading submission files and running checks.")
         
         # Summarize DQ results
         CheckResult.summary(LOGGER)
+        finish_duckdb_logging_run(con, run_id)
+        if CONFIG['core'].get('trace_path', None):
+            ProcessLog.export_chrome_trace(CONFIG['core']['trace_path'])
+            LOGGER.info(f"Chrome trace of the run is written to {CONFIG['core']['trace_path']}")
         # Exit with code 1 if there is any DQ failure        
         if len(CheckResult.dq_fail) > 0:
             exit(1)
@@ -283,4 +195,11 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Run data quality checks on the submission files of the config.')
+    parser.add_argument('--plan', action='store_true', help='Print the loads and checks a run would execute, with estimated rows scanned, memory use and duration, without loading any data.')
+    args = parser.parse_args()
+    if args.plan:
+        from src.plan import plan
+        plan()
+    else:
+        main()
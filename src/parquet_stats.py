@@ -0,0 +1,120 @@
+from typing import List, Dict, Optional, Set
+from duckdb import DuckDBPyConnection
+import threading
+
+
+class ParquetFooterStats:
+    """
+    Row counts and per-column null counts of loaded tables, read from the footers of their parquet submission files.
+
+    A table is registered with the parquet files it was loaded from (or the files its view reads).
+    Row counts come from parquet_file_metadata, null counts from the row group statistics of parquet_metadata.
+    The footers of a table are read once, then answered from memory. A null count is only trusted when every
+    row group of every file has a null count statistic for the column; otherwise None is returned and the caller
+    falls back to scanning the table.
+
+    Example:
+        ParquetFooterStats.register('person', ['/data/person.parquet'])
+        ParquetFooterStats.get_null_count(con, 'person', 'person_id')  # 0, without scanning person
+    """
+
+    table_files: Dict[str, List[str]] = dict()  # Class variable, a dict of {table_name: [parquet file path, ...]}
+    _row_counts: Dict[str, int] = dict()  # Class variable, a dict of {table_name: row count}
+    _null_counts: Dict[str, Dict[str, Optional[int]]] = dict()  # Class variable, a dict of {table_name: {column_name: null count}}
+    _cast_columns: Dict[str, Set[str]] = dict()  # Class variable, a dict of {table_name: {column_name, ...}} of columns cast from the file types
+    _lock = threading.Lock()
+
+    @classmethod
+    def register(cls, table_name: str, file_paths: List[str]):
+        """
+        Register the parquet files a table was loaded from. Cached statistics of the table are dropped.
+        """
+        with cls._lock:
+            cls.table_files[table_name] = list(file_paths)
+            cls._row_counts.pop(table_name, None)
+            cls._null_counts.pop(table_name, None)
+
+    @classmethod
+    def unregister(cls, table_name: Optional[str] = None):
+        """
+        Forget a table, e.g. when it is reloaded from other files. Forget all tables if table_name is None.
+        """
+        with cls._lock:
+            if table_name is None:
+                cls.table_files.clear()
+                cls._row_counts.clear()
+                cls._null_counts.clear()
+                cls._cast_columns.clear()
+            else:
+                cls.table_files.pop(table_name, None)
+                cls._row_counts.pop(table_name, None)
+                cls._null_counts.pop(table_name, None)
+                cls._cast_columns.pop(table_name, None)
+
+    @classmethod
+    def set_cast_columns(cls, table_name: str, column_names: List[str]):
+        """
+        Set the columns of a table whose values are cast from the type in the parquet files, e.g. by the view over the files.
+        Their null counts are not answered from the footers.
+        """
+        with cls._lock:
+            cls._cast_columns[table_name] = {column_name.lower() for column_name in column_names}
+
+    @classmethod
+    def _read_footers(cls, con: DuckDBPyConnection, table_name: str):
+        """
+        Read the footers of the parquet files of a table, and cache its row count and the null count of every column.
+        """
+        file_paths = cls.table_files[table_name]
+        with con.cursor() as cursor:
+            row_count, row_group_count = cursor.execute(
+                "SELECT SUM(num_rows)::BIGINT, SUM(num_row_groups)::BIGINT FROM parquet_file_metadata(?)", (file_paths,)
+            ).fetchone()
+            # one row per (file, row group, column chunk). Nested columns have a path like 'a, b' and never match a table column
+            column_stats = cursor.execute("""
+                SELECT lower(path_in_schema) AS column_name,
+                    COUNT(*) AS column_chunk_count,
+                    COUNT(stats_null_count) AS null_count_stats_count,
+                    SUM(stats_null_count)::BIGINT AS null_count
+                FROM parquet_metadata(?)
+                GROUP BY ALL
+            """, (file_paths,)).fetchall()
+        null_counts = dict()
+        for column_name, column_chunk_count, null_count_stats_count, null_count in column_stats:
+            # trust the statistics only if every row group has a null count for the column
+            if column_chunk_count == row_group_count and null_count_stats_count == column_chunk_count:
+                null_counts[column_name] = null_count
+            else:
+                null_counts[column_name] = None
+        with cls._lock:
+            cls._row_counts[table_name] = row_count or 0
+            cls._null_counts[table_name] = null_counts
+
+    @classmethod
+    def get_row_count(cls, con: DuckDBPyConnection, table_name: str) -> Optional[int]:
+        """
+        Get the row count of a table from the parquet footers.
+
+        Returns:
+            Optional[int]: row count, or None if the table is not registered.
+        """
+        if table_name not in cls.table_files:
+            return None
+        if table_name not in cls._row_counts:
+            cls._read_footers(con, table_name)
+        return cls._row_counts[table_name]
+
+    @classmethod
+    def get_null_count(cls, con: DuckDBPyConnection, table_name: str, column_name: str) -> Optional[int]:
+        """
+        Get the number of NULL values in a column from the parquet footer statistics.
+
+        Returns:
+            Optional[int]: null count, or None if the table is not registered, the column is not in the files,
+                is cast from the type in the files, or a row group has no null count statistic for the column.
+        """
+        if table_name not in cls.table_files or column_name.lower() in cls._cast_columns.get(table_name, ()):
+            return None
+        if table_name not in cls._null_counts:
+            cls._read_footers(con, table_name)
+        return cls._null_counts[table_name].get(column_name.lower())
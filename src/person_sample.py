@@ -0,0 +1,107 @@
+from typing import Dict, List, Optional, Set, Tuple
+import threading
+import math
+
+
+class PersonSample:
+    """
+    Deterministic sample of the persons of a submission, for fast pre-submission runs.
+
+    A person is sampled when the hash of its person_id falls in the first `fraction` of the hash range, so the same
+    persons are kept in every table, and in every run with the same fraction. Tables with a person_id column are
+    filtered to the sampled persons when they are loaded (or exposed as views); tables without one (e.g. care_site,
+    provider, location) are loaded whole. Foreign keys between rows of the same person (e.g. condition_occurrence to
+    visit_occurrence) stay consistent, so FK, NOT NULL and distinct checks run on the sample. Rows without a person_id
+    are sampled by the hash of another column of the file, at the same rate.
+
+    Violation rates of sampled tables are estimates: checks record a Wilson score confidence interval of the rate with
+    their result (see get_check_kwargs). The status is still inferred from the rate and the normal thresholds.
+
+    Example:
+        PersonSample.enable(0.01)
+        PersonSample.get_filter(['condition_occurrence_id', 'person_id'])  # SQL predicate of the sampled rows
+        PersonSample.add_sampled_table('condition_occurrence')  # after the filtered load
+        PersonSample.get_check_kwargs('condition_occurrence', 3, 1000)  # {'sample_fraction': 0.01, 'confidence_interval': '[0.10%, 0.88%]'}
+        PersonSample.disable()
+    """
+
+    fraction: Optional[float] = None  # Class variable, fraction of the persons kept. Sampling is disabled while None
+    column_name: str = 'person_id'
+    hash_buckets: int = 1_000_000  # resolution of the fraction
+    z: float = 1.96  # z-score of the confidence intervals, 95%
+    sampled_tables: Set[str] = set()  # Class variable, tables loaded with the sample filter
+    _lock = threading.Lock()
+
+    @classmethod
+    def enable(cls, fraction: float):
+        if not 0 < fraction <= 1:
+            raise ValueError(f"Invalid sample fraction: {fraction}. Expected a number in (0, 1].")
+        with cls._lock:
+            cls.fraction = fraction
+            cls.sampled_tables.clear()
+
+    @classmethod
+    def disable(cls):
+        with cls._lock:
+            cls.fraction = None
+            cls.sampled_tables.clear()
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        return cls.fraction is not None
+
+    @classmethod
+    def get_filter(cls, column_names: List[str]) -> Optional[str]:
+        """
+        Get the SQL predicate keeping the sampled rows of a file or table with the given columns,
+        or None if sampling is disabled or there is no person_id column.
+        person_id is cast to BIGINT, so a person has the same hash in typed, text (staging) and parquet columns.
+        """
+        if cls.fraction is None or cls.column_name not in column_names:
+            return None
+        other_columns = [column_name for column_name in column_names if column_name != cls.column_name]
+        null_hash = f'hash("{other_columns[0]}")' if other_columns else 'hash(NULL)'
+        return (
+            f'(CASE WHEN "{cls.column_name}" IS NULL THEN {null_hash} ELSE hash(TRY_CAST("{cls.column_name}" AS BIGINT)) END)'
+            f' % {cls.hash_buckets} < {round(cls.fraction * cls.hash_buckets)}'
+        )
+
+    @classmethod
+    def add_sampled_table(cls, table_name: str):
+        """
+        Record that a table was loaded with the sample filter.
+        """
+        with cls._lock:
+            cls.sampled_tables.add(table_name)
+
+    @classmethod
+    def is_sampled(cls, table_name: str) -> bool:
+        return cls.fraction is not None and table_name in cls.sampled_tables
+
+    @staticmethod
+    def wilson_interval(violation_count: int, row_count: int, z: float = 1.96) -> Tuple[float, float]:
+        """
+        Wilson score interval of a rate of violation_count out of row_count. Unlike the normal approximation, the
+        interval stays within [0, 1] and is not empty when no violation is found in the sample.
+        """
+        if row_count <= 0:
+            return 0.0, 1.0
+        rate = violation_count / row_count
+        denominator = 1 + z ** 2 / row_count
+        center = (rate + z ** 2 / (2 * row_count)) / denominator
+        half_width = z * math.sqrt(rate * (1 - rate) / row_count + z ** 2 / (4 * row_count ** 2)) / denominator
+        return max(0.0, center - half_width), min(1.0, center + half_width)
+
+    @classmethod
+    def get_check_kwargs(cls, table_name: str, violation_count: int, row_count: Optional[int]) -> Dict[str, str]:
+        """
+        Get the CheckResult kwargs recording the sample of a check of a sampled table: the sample fraction and the
+        confidence interval of the violation rate. Empty if the table is not sampled.
+        """
+        if not cls.is_sampled(table_name) or row_count is None:
+            return dict()
+        low, high = cls.wilson_interval(violation_count, row_count, cls.z)
+        return {
+            'sample_fraction': cls.fraction,
+            'confidence_interval': f'[{low:.2%}, {high:.2%}]',
+        }
@@ -0,0 +1,336 @@
+from typing import Dict, List, Optional, Tuple
+from src.config import CONFIG, LOGGER
+from src.data_model import DataModel
+from src.submission_manifest import SubmissionManifest
+from src.resource_planner import ResourcePlanner, format_size
+from src.process_log import ProcessLog
+from src.check_scheduler import CheckScheduler, CheckTask
+from src.load_duckdb import get_unchanged_tables
+from src.dq_checks.check_fk import check_fk_violations, ReferenceKeySets
+from src.dq_checks.check_distinct import check_distinct_violation
+from src.dq_checks.check_concept import check_concept_ids
+from src.dq_checks.check_fact_relationship import check_fact_relationship, FACT_RELATIONSHIP_DOMAIN_CONCEPT_ID_TO_CDM_MAPPING
+from src.run_tasks import RunContext, init_skip_lists, get_load_mode, get_store_rejects, check_submission_files, get_load_tasks, register_checks, load_table
+from datetime import datetime
+import duckdb
+import gzip
+import os
+
+CSV_SAMPLE_SIZE = 1024 ** 2  # bytes of a csv file read to estimate its row count
+KEY_BYTES = 16  # memory of one key in a hash table (key sets, DISTINCT, GROUP BY)
+VALUE_BYTES = 8  # memory of one value of a column
+
+
+def estimate_csv_rows(file_path: str, sample_size: int = CSV_SAMPLE_SIZE) -> Optional[int]:
+    """
+    Estimate the row count of a csv file from the line length of its first sample_size bytes.
+    Gzip compressed files are sampled after decompression and scaled by the compressed bytes read.
+    Zstd compressed files are not sampled (zstd is not in the python standard library), None is returned.
+    """
+    if file_path.endswith('.zst'):
+        return None
+    file_size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as raw_file:
+        if file_path.endswith('.gz'):
+            with gzip.GzipFile(fileobj=raw_file) as csv_file:
+                sample = csv_file.read(sample_size)
+                eof = len(sample) < sample_size
+            sampled_size = raw_file.tell()
+        else:
+            sample = raw_file.read(sample_size)
+            eof = len(sample) < sample_size
+            sampled_size = len(sample)
+    line_count = sample.count(b'\n') + (0 if sample.endswith(b'\n') or not sample else 1)
+    if eof:
+        return max(0, line_count - 1)  # whole file read, minus header
+    if line_count == 0 or sampled_size == 0:
+        return None
+    return max(0, int(line_count * file_size / sampled_size) - 1)
+
+
+def get_process_history(con: duckdb.DuckDBPyConnection, logging_schema: str = 'logging') -> Dict[str, Tuple[float, Optional[int], Optional[int]]]:
+    """
+    Read the last successful run of every process (stage) from logging.process.
+
+    Returns:
+        Dict[str, Tuple[float, Optional[int], Optional[int]]]: a dict of {process_name: (duration in seconds, rows_processed, bytes_read)}.
+    """
+    rows = con.execute(f"""
+        SELECT process_name, epoch(end_time - start_time), rows_processed, bytes_read
+        FROM {logging_schema}.process
+        WHERE status = 'SUCCESS'
+        QUALIFY row_number() OVER (PARTITION BY process_name ORDER BY end_time DESC) = 1;
+    """).fetchall()
+    return {process_name: (duration, rows_processed, bytes_read) for process_name, duration, rows_processed, bytes_read in rows}
+
+
+def estimate_table_rows(
+    table_name: str,
+    manifest: SubmissionManifest,
+    history: Dict[str, Tuple[float, Optional[int], Optional[int]]],
+    existing_rows: Dict[str, int],
+) -> Tuple[Optional[int], str]:
+    """
+    Estimate the row count of a table, from the first available source: the table in DuckDB (for tables that are
+    not reloaded), the parquet footers, the last load of the table scaled by the submission file size, or a sample
+    of the csv files.
+
+    Returns:
+        Tuple[Optional[int], str]: the estimated row count (None if unknown) and its source.
+    """
+    if table_name in existing_rows:
+        return existing_rows[table_name], 'duckdb table'
+    file_paths = manifest.get_files(manifest.get_table_path(table_name))
+    if not file_paths:
+        return None, 'no file'
+    file_infos = [manifest.files.get(file_path, {}) for file_path in file_paths]
+    if manifest.file_format == 'parquet' and all(file_info.get('num_rows') is not None for file_info in file_infos):
+        return sum(file_info['num_rows'] for file_info in file_infos), 'parquet footer'
+    _, rows_processed, bytes_read = history.get(f"load {table_name}", (None, None, None))
+    if rows_processed is not None:
+        if bytes_read:
+            return int(rows_processed * manifest.get_size(manifest.get_table_path(table_name)) / bytes_read), 'previous run'
+        return rows_processed, 'previous run'
+    if manifest.file_format == 'csv':
+        sampled_rows = [estimate_csv_rows(file_path) for file_path in file_paths]
+        if all(rows is not None for rows in sampled_rows):
+            return sum(sampled_rows), 'file sample'
+    return None, 'unknown'
+
+
+def _estimate_duration(
+    process_names: List[str],
+    rows: Optional[int],
+    history: Dict[str, Tuple[float, Optional[int], Optional[int]]]
+) -> Optional[float]:
+    """
+    Estimate the duration of a process from its last successful run, scaled by the rows it will scan.
+    """
+    for process_name in process_names:
+        if process_name in history:
+            duration, rows_processed, _ = history[process_name]
+            if rows is not None and rows_processed:
+                return duration * rows / rows_processed
+            return duration
+    return None
+
+
+def _estimate_task(
+    task: CheckTask,
+    key_sets: ReferenceKeySets,
+    table_rows: Dict[str, Optional[int]]
+) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Estimate the rows scanned and the memory use of a check task.
+    Key sets and DISTINCT / GROUP BY keep one hash table entry per row (upper bound),
+    foreign key checks keep the key sets they probe in memory, concept checks the concept table, NOT NULL checks stream.
+
+    Returns:
+        Tuple[Optional[int], Optional[int]]: rows scanned and memory in bytes, None if the row count of a table is unknown.
+    """
+    def rows_of(table_names) -> Optional[int]:
+        rows = [table_rows.get(table_name) for table_name in table_names]
+        return None if any(r is None for r in rows) else sum(rows)
+
+    if task.func == key_sets.build:
+        rows = rows_of([task.kwargs['reference_table']])
+        return rows, None if rows is None else rows * KEY_BYTES
+    if task.func is check_fk_violations:
+        rows = rows_of([task.kwargs['main_table']])
+        key_set_rows = rows_of({reference_table for _, reference_table, _ in task.kwargs['foreign_keys']})
+        return rows, None if key_set_rows is None else key_set_rows * KEY_BYTES
+    if task.func is check_distinct_violation:
+        column_names = task.kwargs['column_names']
+        column_count = 1 if isinstance(column_names, str) else len(column_names)
+        rows = rows_of([task.kwargs['table_name']])
+        return rows, None if rows is None else rows * (VALUE_BYTES * column_count + KEY_BYTES)
+    if task.func is check_concept_ids:
+        # distinct concept ids of the table, joined to the concept table
+        rows = rows_of([task.kwargs['table_name'], 'concept'])
+        concept_rows = table_rows.get('concept')
+        return rows, None if concept_rows is None else concept_rows * KEY_BYTES
+    if task.func is check_fact_relationship:
+        domain_tables = [
+            mapping['table_name'] for mapping in FACT_RELATIONSHIP_DOMAIN_CONCEPT_ID_TO_CDM_MAPPING.values()
+            if mapping['table_name'] not in task.kwargs.get('skip_tables', [])
+        ]
+        domain_rows = rows_of(domain_tables)
+        rows = table_rows.get('fact_relationship')
+        if rows is None or domain_rows is None:
+            return None, None
+        return rows + domain_rows, domain_rows * KEY_BYTES
+    rows = rows_of(task.tables)
+    return rows, 0
+
+
+def build_plan(
+    context: RunContext,
+    data_model: DataModel,
+    manifest: SubmissionManifest,
+    load_mode: str,
+    con: Optional[duckdb.DuckDBPyConnection] = None
+) -> List[Dict]:
+    """
+    List the loads and checks a run would execute, with estimated rows scanned, memory use and duration.
+    The skip lists of the context are resolved from the manifest, as in a run, and no data is loaded.
+
+    Parameters:
+        context (RunContext): context of the run, with skip lists initialized by init_skip_lists.
+        data_model (DataModel): the data model.
+        manifest (SubmissionManifest): the scanned submission files.
+        load_mode (str): 'copy', 'staging' or 'external'.
+        con (Optional[duckdb.DuckDBPyConnection]): a read-only connection to the DuckDB database of previous runs, if any.
+            Used for unchanged tables, row counts of existing tables and durations of previous runs.
+
+    Returns:
+        List[Dict]: a list of entries {'kind', 'name', 'rows', 'memory', 'duration', 'source'}, in run order.
+    """
+    history = dict()
+    existing_rows = dict()
+    context.unchanged_tables = dict()
+    if con is not None:
+        try:
+            history = get_process_history(con)
+            if CONFIG['duckdb'].get('skip_unchanged_tables', False) and load_mode in ('copy', 'staging'):
+                submission_paths = {
+                    table_name: manifest.get_table_path(table_name) for table_name in data_model.all_table_names()
+                    if table_name not in context.skip_duckdb_load_tables and os.path.exists(manifest.get_table_path(table_name))
+                }
+                context.unchanged_tables = get_unchanged_tables(con, submission_paths, data_model, content_hash=CONFIG['duckdb'].get('fingerprint_content_hash', False), load_mode=load_mode, store_rejects=get_store_rejects(manifest.file_format, load_mode))
+            existing_rows = {
+                table_name: estimated_size for table_name, estimated_size in
+                con.execute("SELECT table_name, estimated_size FROM duckdb_tables() WHERE schema_name = 'main'").fetchall()
+                if table_name in context.unchanged_tables
+            }
+        except duckdb.Error as e:
+            LOGGER.warning(f"Could not read previous runs from the DuckDB database, estimates are based on the submission files only: {e}")
+
+    check_submission_files(context, data_model, manifest, con=None)
+    load_tasks = get_load_tasks(context, data_model, manifest)
+
+    entries = []
+    table_rows = dict()  # a dict of {table_name: estimated row count}
+    for table_name in data_model.all_table_names():
+        if table_name in load_tasks or table_name in context.unchanged_tables:
+            table_rows[table_name], source = estimate_table_rows(table_name, manifest, history, existing_rows)
+        if table_name not in load_tasks:
+            continue
+        rows = table_rows[table_name]
+        if load_mode == 'external':
+            entries.append({
+                'kind': 'view', 'name': f"create view {table_name}", 'rows': 0, 'memory': 0,
+                'duration': _estimate_duration([f"create view {table_name}"], None, history), 'source': source,
+            })
+            continue
+        column_count = len(data_model.all_column_names_in_table(table_name))
+        entries.append({
+            'kind': 'load',
+            'name': f"load {table_name}",
+            'rows': rows,
+            'memory': None if rows is None else rows * column_count * VALUE_BYTES,
+            'duration': _estimate_duration([f"load {table_name}"], rows, history),
+            'source': source,
+        })
+
+    scheduler = CheckScheduler(None)
+    key_sets = ReferenceKeySets(None)
+    # load tasks are registered as in a run, so checks depending on a loaded table (e.g. concept) are registered
+    for table_name in load_tasks:
+        scheduler.add(f"load {table_name}", load_table, provides_table=table_name)
+    register_checks(scheduler, data_model, context, key_sets)
+    for task in scheduler.tasks.values():
+        if task.provides_table:
+            continue
+        rows, memory = _estimate_task(task, key_sets, table_rows)
+        process_names = [task.name, ProcessLog.get_trace_name(task.func, **task.kwargs)]
+        entries.append({
+            'kind': 'check',
+            'name': task.name,
+            'rows': rows,
+            'memory': memory,
+            'duration': _estimate_duration(process_names, rows, history),
+            'source': 'previous run' if any(process_name in history for process_name in process_names) else ('row estimates' if rows is not None else 'unknown'),
+        })
+    return entries
+
+
+def format_plan(entries: List[Dict]) -> str:
+    """
+    Format plan entries as a table, followed by the totals. Unknown estimates are shown as '?'.
+    """
+    def format_rows(rows):
+        return '?' if rows is None else f"{rows:,}"
+    def format_memory(memory):
+        return '?' if memory is None else ('0' if memory == 0 else format_size(memory))
+    def format_duration(duration):
+        return '?' if duration is None else f"{duration:.1f}s"
+
+    header = ('kind', 'name', 'rows', 'memory', 'duration', 'source')
+    lines = [header] + [
+        (e['kind'], e['name'], format_rows(e['rows']), format_memory(e['memory']), format_duration(e['duration']), e['source'])
+        for e in entries
+    ]
+    widths = [max(len(line[i]) for line in lines) for i in range(len(header))]
+    text = '\n'.join('  '.join(value.ljust(width) for value, width in zip(line, widths)).rstrip() for line in lines)
+    known_durations = [e['duration'] for e in entries if e['duration'] is not None]
+    text += (
+        f"\n\n{sum(e['kind'] == 'load' for e in entries)} load(s), {sum(e['kind'] == 'check' for e in entries)} check(s)."
+        f"\nRows scanned: {format_rows(sum(e['rows'] or 0 for e in entries))}"
+        f"{' (excluding ' + str(sum(e['rows'] is None for e in entries)) + ' unknown)' if any(e['rows'] is None for e in entries) else ''}."
+        f"\nLargest memory use: {format_memory(max((e['memory'] or 0 for e in entries), default=0))}."
+        f"\nDuration of previous runs, scaled to the estimated rows: {format_duration(sum(known_durations))} for {len(known_durations)} of {len(entries)} step(s), run one at a time."
+    )
+    return text
+
+
+def plan() -> List[Dict]:
+    """
+    Dry run: print the loads and checks a run with the current config would execute, with estimated rows scanned,
+    memory use and duration. Submission files are scanned (headers, sizes, parquet footers) but no data is loaded,
+    and the DuckDB database, if it exists, is only opened read-only to read previous runs.
+
+    Returns:
+        List[Dict]: the plan entries, see build_plan.
+    """
+    run_id = CONFIG['core'].get('run_id', datetime.now().strftime("%Y-%m-%d_%H:%M:%S.%f"))
+    context = RunContext(run_id=run_id)
+    data_model = DataModel(**CONFIG['data-models'])
+    init_skip_lists(context, data_model)
+    submission_file_format = CONFIG['submission_files'].get('file_format', 'csv')
+    load_mode = get_load_mode(submission_file_format)
+    manifest = SubmissionManifest(
+        file_dir = CONFIG['submission_files']['dir'],
+        file_format = submission_file_format,
+        multiple_file_per_table = CONFIG['submission_files'].get('multiple_file_per_table', False)
+    ).scan()
+
+    con = None
+    duckdb_path = CONFIG['duckdb']['path']
+    if duckdb_path != ':memory:' and os.path.exists(duckdb_path):
+        try:
+            con = duckdb.connect(duckdb_path, read_only=True)
+        except duckdb.Error as e:
+            LOGGER.warning(f"Could not open {duckdb_path} read-only, previous runs are not used for the estimates: {e}")
+    try:
+        entries = build_plan(context, data_model, manifest, load_mode, con=con)
+    finally:
+        if con is not None:
+            con.close()
+
+    text = format_plan(entries)
+    if CONFIG['duckdb'].get('resource_planner', True):
+        table_sizes = [manifest.get_size(manifest.get_table_path(table_name)) for table_name in manifest.table_names()]
+        planner = ResourcePlanner(
+            submission_size = sum(table_sizes),
+            largest_table_size = max(table_sizes, default=0),
+            duckdb_path = duckdb_path,
+            memory_limit = CONFIG['duckdb'].get('memory_limit', None),
+            threads = CONFIG['duckdb'].get('threads', None),
+            temp_directory = CONFIG['duckdb'].get('temp_directory', None),
+            max_temp_directory_size = CONFIG['duckdb'].get('max_temp_directory_size', None),
+        )
+        # the 'load' settings are used until the last load finishes, then the 'join' settings
+        text += f"\nDuckDB settings while loading: {planner.plan('load')}"
+        text += f"\nDuckDB settings once loaded: {planner.plan('join')}"
+    print(text)
+    return entries
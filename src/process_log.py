@@ -0,0 +1,188 @@
+from typing import List, Optional, Callable
+from datetime import datetime
+from functools import wraps
+import threading
+import inspect
+import logging
+import json
+import time
+import os
+import duckdb
+from src.table_stats import TableStats
+
+
+class ProcessLog:
+    """
+    Times one stage (process) of a DQ run, e.g. data model fetch, DDL, a table load or a single check.
+
+    Use as a context manager. The stage is written to the logging.process table when it ends,
+    and kept in memory so the whole run can be exported as a Chrome-trace JSON file (chrome://tracing, Perfetto).
+
+    Parameters:
+        process_name (str): Name of the stage, e.g. 'load person'.
+        category (str): Category of the stage, e.g. 'stage', 'load', 'check'. Defaults to 'stage'.
+        table_name (Optional[str]): Table processed by the stage. If rows_processed is not set when the stage ends,
+            the row count of the table is read from TableStats or the DuckDB catalog.
+        rows_processed (Optional[int]): Number of rows processed by the stage. Can be set inside the with block.
+        bytes_read (Optional[int]): Number of bytes read from submission files by the stage. Can be set inside the with block.
+
+    Example:
+        with ProcessLog('load person', category='load', bytes_read=1024) as process:
+            ...
+            process.rows_processed = 100
+    """
+
+    run_id = None  # Class variable to store the current run ID
+    duckdb_conn: Optional[duckdb.DuckDBPyConnection] = None  # Class variable, connection used to write logging.process records
+    duckdb_schema: str = 'logging'
+    logger: Optional[logging.Logger] = None  # Class variable, logger used to log stage duration
+    processes: List['ProcessLog'] = []  # Class variable to store all finished stages
+    _lock = threading.Lock()
+
+    def __init__(
+        self,
+        process_name: str,
+        category: str = 'stage',
+        table_name: Optional[str] = None,
+        rows_processed: Optional[int] = None,
+        bytes_read: Optional[int] = None,
+    ):
+        self.process_name = process_name
+        self.category = category
+        self.table_name = table_name
+        self.rows_processed = rows_processed
+        self.bytes_read = bytes_read
+        self.status = None
+        self.start_time = None
+        self.end_time = None
+        self.thread_id = None
+        self._start_counter = None
+        self.duration = None
+
+    def __enter__(self) -> 'ProcessLog':
+        self.start_time = datetime.now()
+        self._start_counter = time.perf_counter()
+        self.thread_id = threading.get_ident()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.duration = time.perf_counter() - self._start_counter
+        self.end_time = datetime.now()
+        self.status = 'FAIL' if exc_type else 'SUCCESS'
+        if self.rows_processed is None and self.table_name and self.duckdb_conn:
+            self.rows_processed = self._get_table_row_count(self.table_name)
+        with ProcessLog._lock:
+            ProcessLog.processes.append(self)
+        self.log()
+        return False
+
+    def _get_table_row_count(self, table_name: str) -> Optional[int]:
+        """
+        Read the row count of a table from TableStats, or from the DuckDB catalog, without scanning the table.
+        """
+        row_count = TableStats.peek_row_count(table_name)
+        if row_count is not None:
+            return row_count
+        with ProcessLog._lock:
+            with self.duckdb_conn.cursor() as cursor:
+                row = cursor.execute(
+                    "SELECT estimated_size FROM duckdb_tables() WHERE table_name = ? AND schema_name = 'main'",
+                    (table_name,)
+                ).fetchone()
+        return row[0] if row else None
+
+    def log(self):
+        """
+        Log the stage duration and insert the stage into logging.process if a DuckDB connection is set.
+        """
+        if self.logger:
+            self.logger.debug(f"Process '{self.process_name}' ({self.category}) finished with status {self.status} in {self.duration:.3f}s. Rows processed: {self.rows_processed}, bytes read: {self.bytes_read}")
+        if self.duckdb_conn:
+            with ProcessLog._lock:
+                with self.duckdb_conn.cursor() as cursor:
+                    cursor.execute(f"""
+                        INSERT INTO {self.duckdb_schema}.process (run_id, process_name, category, status, start_time, end_time, rows_processed, bytes_read)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?);
+                    """, (self.run_id, self.process_name, self.category, self.status, self.start_time, self.end_time, self.rows_processed, self.bytes_read))
+
+    @staticmethod
+    def trace(category: str = 'check', count_table_rows: bool = True) -> Callable:
+        """
+        Decorator to time every call of a function as a stage. The stage is named after the function and its
+        table/column arguments, e.g. 'check_not_null_violation person.person_id'.
+
+        Parameters:
+            category (str): Category of the stage. Defaults to 'check'.
+            count_table_rows (bool): If True, record the row count of the checked table as rows processed.
+        """
+        def decorator(func: Callable) -> Callable:
+            signature = inspect.signature(func)
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                arguments = signature.bind_partial(*args, **kwargs).arguments
+                process_name, table_name = ProcessLog._get_trace_name(func.__name__, arguments)
+                with ProcessLog(process_name, category=category, table_name=table_name if count_table_rows and isinstance(table_name, str) else None):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def _get_trace_name(func_name: str, arguments: dict) -> tuple:
+        """
+        Get the stage name and table name of a traced call from its bound arguments.
+        """
+        table_name = arguments.get('table_name') or arguments.get('main_table')
+        column_name = arguments.get('column_name') or arguments.get('main_column') or arguments.get('column_names')
+        process_name = func_name
+        if table_name:
+            process_name += f" {table_name}"
+            if column_name:
+                if isinstance(column_name, (tuple, list)):
+                    column_name = '(' + ', '.join(column_name) + ')'
+                process_name += f".{column_name}"
+        return process_name, table_name
+
+    @staticmethod
+    def get_trace_name(func: Callable, *args, **kwargs) -> str:
+        """
+        Get the stage name a function decorated with trace() would log for a call, without calling it.
+        E.g. 'check_fk_violations visit_occurrence' for check_fk_violations(con, main_table='visit_occurrence', ...).
+        """
+        arguments = inspect.signature(func).bind_partial(*args, **kwargs).arguments
+        return ProcessLog._get_trace_name(func.__name__, arguments)[0]
+
+    @staticmethod
+    def export_chrome_trace(file_path: str) -> str:
+        """
+        Export all finished stages as a Chrome-trace JSON file (Trace Event Format, complete events).
+
+        Parameters:
+            file_path (str): path of the JSON file to write.
+
+        Returns:
+            str: file_path
+        """
+        pid = os.getpid()
+        thread_ids = dict()  # map python thread ident to a small integer for readability
+        trace_events = []
+        for process in sorted(ProcessLog.processes, key=lambda p: p.start_time):
+            tid = thread_ids.setdefault(process.thread_id, len(thread_ids))
+            trace_events.append({
+                'name': process.process_name,
+                'cat': process.category,
+                'ph': 'X',
+                'ts': int(process.start_time.timestamp() * 1_000_000),
+                'dur': int(process.duration * 1_000_000),
+                'pid': pid,
+                'tid': tid,
+                'args': {
+                    'run_id': ProcessLog.run_id,
+                    'status': process.status,
+                    'table_name': process.table_name,
+                    'rows_processed': process.rows_processed,
+                    'bytes_read': process.bytes_read,
+                },
+            })
+        with open(file_path, 'w') as f:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, f)
+        return file_path
@@ -0,0 +1,183 @@
+from typing import Optional, Dict
+from duckdb import DuckDBPyConnection
+from src.config import LOGGER
+import shutil
+import math
+import os
+import re
+
+_SIZE_UNITS = {
+    '': 1, 'b': 1,
+    'kb': 1000, 'mb': 1000 ** 2, 'gb': 1000 ** 3, 'tb': 1000 ** 4,
+    'kib': 1024, 'mib': 1024 ** 2, 'gib': 1024 ** 3, 'tib': 1024 ** 4,
+}
+
+
+def parse_size(size: str) -> int:
+    """
+    Parse a DuckDB size string, e.g. '32GB', '512 MiB', into bytes.
+    """
+    match = re.fullmatch(r'\s*([0-9.]+)\s*([a-zA-Z]*)\s*', str(size))
+    if not match or match.group(2).lower() not in _SIZE_UNITS:
+        raise ValueError(f"Invalid size: {size}. Expected a number followed by a unit, e.g. '32GB' or '512MiB'.")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).lower()])
+
+
+def format_size(size: int) -> str:
+    """
+    Format a size in bytes as a DuckDB size string in MiB, e.g. '2048MiB'.
+    """
+    return f"{max(1, size // 1024 ** 2)}MiB"
+
+
+def _read_cgroup_file(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def get_host_memory() -> int:
+    """
+    Get the memory available to the process in bytes: the physical memory, or the container (cgroup) memory limit if lower.
+    """
+    memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        limit = _read_cgroup_file(path)
+        if limit and limit.isdigit():
+            memory = min(memory, int(limit))
+    return memory
+
+
+def get_host_cpu_count() -> int:
+    """
+    Get the number of CPUs available to the process: the CPUs the process can run on, or the container (cgroup) CPU quota if lower.
+    """
+    cpu_count = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    cpu_max = _read_cgroup_file('/sys/fs/cgroup/cpu.max')  # e.g. '200000 100000', or 'max 100000' if unlimited
+    if cpu_max and cpu_max.split()[0].isdigit():
+        quota, period = cpu_max.split()
+        cpu_count = min(cpu_count, max(1, math.ceil(int(quota) / int(period))))
+    return cpu_count
+
+
+class ResourcePlanner:
+    """
+    Picks DuckDB threads, memory_limit, temp_directory and spill budget (max_temp_directory_size) for a run,
+    from the size of the submission files and the memory and CPUs of the host (or container).
+
+    Settings are applied per stage with apply():
+        - 'load': all CPUs, base memory limit. Loads are mostly CSV parsing, which scales with threads.
+        - 'join': checks, once all tables are loaded. FK anti-joins, distinct and primary key checks dominate the memory
+          use: higher memory limit, and fewer threads if needed so that each thread gets enough memory for its share of
+          the largest table's hash table.
+    Values set in the config (memory_limit, threads, temp_directory, max_temp_directory_size) are kept for every stage.
+
+    Parameters:
+        submission_size (int): total size in bytes of the submission files.
+        largest_table_size (int): size in bytes of the submission file(s) of the largest table.
+        duckdb_path (str): path of the DuckDB database file. The default temp_directory is '{duckdb_path}.tmp'.
+        memory_limit (Optional[str]): memory limit from the config, e.g. '32GB'.
+        threads (Optional[int]): number of threads from the config.
+        temp_directory (Optional[str]): spill directory from the config.
+        max_temp_directory_size (Optional[str]): spill budget from the config, e.g. '200GB'.
+        host_memory (Optional[int]): memory of the host in bytes. Detected if not provided.
+        host_cpu_count (Optional[int]): number of CPUs of the host. Detected if not provided.
+
+    Example:
+        planner = ResourcePlanner(submission_size=10 * 1024 ** 3, largest_table_size=4 * 1024 ** 3, duckdb_path='/data/cdm.duckdb')
+        planner.apply(con, 'join')
+    """
+
+    base_memory_fraction = 0.75  # memory limit of the 'load' stage, leaves room for python and the OS page cache
+    join_memory_fraction = 0.85  # memory limit of the 'join' stage
+    min_join_memory_per_thread = 256 * 1024 ** 2
+    max_join_memory_per_thread = 4 * 1024 ** 3
+    spill_disk_fraction = 0.9  # share of the free disk space of the temp directory used as spill budget
+
+    def __init__(
+        self,
+        submission_size: int,
+        largest_table_size: int,
+        duckdb_path: str,
+        memory_limit: Optional[str] = None,
+        threads: Optional[int] = None,
+        temp_directory: Optional[str] = None,
+        max_temp_directory_size: Optional[str] = None,
+        host_memory: Optional[int] = None,
+        host_cpu_count: Optional[int] = None,
+    ):
+        self.submission_size = submission_size
+        self.largest_table_size = largest_table_size
+        self.host_memory = host_memory if host_memory is not None else get_host_memory()
+        self.host_cpu_count = host_cpu_count if host_cpu_count is not None else get_host_cpu_count()
+        self.fixed_memory_limit = parse_size(memory_limit) if memory_limit else None
+        self.fixed_threads = int(threads) if threads else None
+        if temp_directory:
+            self.temp_directory = temp_directory
+        elif duckdb_path and duckdb_path != ':memory:':
+            self.temp_directory = f"{duckdb_path}.tmp"
+        else:
+            self.temp_directory = '.tmp'
+        if max_temp_directory_size:
+            self.max_temp_directory_size = parse_size(max_temp_directory_size)
+        else:
+            # the temp directory is created by DuckDB on first spill, measure the disk of its closest existing parent
+            disk_path = os.path.abspath(self.temp_directory)
+            while not os.path.exists(disk_path):
+                disk_path = os.path.dirname(disk_path)
+            self.max_temp_directory_size = int(shutil.disk_usage(disk_path).free * self.spill_disk_fraction)
+        if self.max_temp_directory_size < 2 * self.submission_size:
+            LOGGER.warning(f"Spill budget {format_size(self.max_temp_directory_size)} in {self.temp_directory} is less than twice the submission size ({format_size(self.submission_size)}). Large joins may fail if they spill to disk.")
+        self.applied_settings: Dict[str, str] = dict()
+
+    def plan(self, stage: str) -> Dict[str, str]:
+        """
+        Get the DuckDB settings of a stage.
+
+        Parameters:
+            stage (str): 'load' or 'join'.
+
+        Returns:
+            Dict[str, str]: a dict of {setting name: value}.
+        """
+        if stage not in ('load', 'join'):
+            raise ValueError(f"Unsupported stage: {stage}. Supported stages are 'load' and 'join'.")
+        memory_fraction = self.join_memory_fraction if stage == 'join' else self.base_memory_fraction
+        memory_limit = self.fixed_memory_limit or int(self.host_memory * memory_fraction)
+        threads = self.fixed_threads or self.host_cpu_count
+        if stage == 'join' and not self.fixed_threads:
+            # give each thread memory for about 1/8 of the largest table, e.g. the measurement hash table of an FK anti-join
+            memory_per_thread = min(max(self.largest_table_size // 8, self.min_join_memory_per_thread), self.max_join_memory_per_thread)
+            threads = max(1, min(threads, memory_limit // memory_per_thread))
+        return {
+            'threads': str(threads),
+            'memory_limit': format_size(memory_limit),
+            'temp_directory': self.temp_directory,
+            'max_temp_directory_size': format_size(self.max_temp_directory_size),
+        }
+
+    def apply(self, con: DuckDBPyConnection, stage: str) -> Dict[str, str]:
+        """
+        Apply the DuckDB settings of a stage to the database of a connection, and log them.
+        Settings are global to the database, so they also apply to the cursors of the connection.
+
+        Parameters:
+            con (DuckDBPyConnection): a duckdb connection.
+            stage (str): 'load' or 'join'.
+
+        Returns:
+            Dict[str, str]: the applied settings.
+        """
+        settings = self.plan(stage)
+        # only set changed values, DuckDB cannot switch the temp directory once it has spilled
+        for name, value in settings.items():
+            if self.applied_settings.get(name) != value:
+                con.execute(f"SET {name} = '{value}'")
+                self.applied_settings[name] = value
+        LOGGER.info(
+            f"DuckDB settings for stage '{stage}': " + ', '.join(f"{name}={value}" for name, value in settings.items())
+            + f" (host memory {format_size(self.host_memory)}, {self.host_cpu_count} CPU(s), submission size {format_size(self.submission_size)}, largest table {format_size(self.largest_table_size)})"
+        )
+        return settings
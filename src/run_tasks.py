@@ -0,0 +1,457 @@
+from src.config import CONFIG, LOGGER
+from src.dq_checks.check_result import CheckResult
+from src.load_duckdb import load_table_to_duckdb, create_duckdb_view, get_cast_failure_columns, save_table_fingerprint
+from src.data_model import DataModel
+from src.constants import OPTIONAL_TABLES
+from src.util import table_exists, column_exists
+from src.process_log import ProcessLog
+from src.submission_manifest import SubmissionManifest
+from src.parquet_stats import ParquetFooterStats
+from src.person_sample import PersonSample
+from src.check_scheduler import CheckScheduler
+from src.dq_checks.check_file_completeness import check_missing_submission_file, check_extra_submission_file
+from src.dq_checks.check_header import check_inconsistent_header_in_csv, check_duplicated_column_in_csv, check_extra_column_in_csv, check_missing_column_in_csv, check_extra_column_in_parquet, check_missing_column_in_parquet
+from src.dq_checks.check_fk import check_fk_violations, ReferenceKeySets
+from src.dq_checks.check_not_null import check_not_null_violations
+from src.dq_checks.check_distinct import check_distinct_violation
+from src.dq_checks.check_field_size import check_field_sizes, get_size_columns
+from src.dq_checks.check_concept import check_concept_ids, get_concept_columns
+from src.dq_checks.check_fact_relationship import check_fact_relationship, FACT_RELATIONSHIP_DOMAIN_CONCEPT_ID_TO_CDM_MAPPING
+from src.dq_checks.check_load_reject import check_load_reject
+from src.dq_checks.check_type_conformance import check_type_conformance
+from typing import Dict, List, Optional
+import duckdb
+import os
+import fnmatch
+
+class RunContext():
+    '''An explicit context class to hold dynamic state variables during the DQ run.'''
+    def __init__(
+        self, 
+        run_id: str, 
+        skip_check_tables: list = [],
+        skip_check_columns: dict = {}, # a dict of {table_name: (column_name, ...)}
+        skip_duckdb_load_tables: list = [],
+        **kwargs
+    ):
+        self.run_id = run_id
+        self.skip_check_tables = skip_check_tables
+        self.skip_duckdb_load_tables = skip_duckdb_load_tables
+        self.skip_check_columns = skip_check_columns
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+def init_skip_lists(context: RunContext, data_model: DataModel):
+    """
+    Initialize the skip lists of the context from the optional tables and the skip_load patterns of the config.
+    """
+    context.skip_check_tables = list(OPTIONAL_TABLES)
+    context.skip_check_columns = dict() # a dict of {table_name: (column_name, ...)}
+    _skip_duckdb_load_table_patterns = list(CONFIG['duckdb'].get('skip_load', []))
+    context.skip_duckdb_load_tables = [table for table in data_model.all_table_names() if any(fnmatch.fnmatch(table, pattern) for pattern in _skip_duckdb_load_table_patterns)]
+    LOGGER.debug(f"Tables to skip loading into DuckDB from config: {context.skip_duckdb_load_tables}")
+
+def get_load_mode(submission_file_format: str) -> str:
+    """
+    Get the load mode of the config: 'copy', 'staging' or 'external'. 'staging' falls back to 'copy' for parquet files.
+    """
+    load_mode = CONFIG['duckdb'].get('load_mode', 'copy')
+    if load_mode not in ('copy', 'staging', 'external'):
+        raise ValueError(f"Unsupported duckdb load_mode: {load_mode}. Supported modes are 'copy', 'staging' and 'external'.")
+    if load_mode == 'staging' and submission_file_format != 'csv':
+        LOGGER.warning("duckdb load_mode 'staging' is only supported for csv files, parquet files are loaded with load_mode 'copy'.")
+        load_mode = 'copy'
+    return load_mode
+
+def get_store_rejects(submission_file_format: str, load_mode: str) -> bool:
+    """
+    Get the store_rejects option of the config. Rejected rows are only captured for csv files with load_mode 'copy'.
+    """
+    store_rejects = CONFIG['duckdb'].get('store_rejects', False)
+    if store_rejects and (submission_file_format != 'csv' or load_mode != 'copy'):
+        LOGGER.warning("duckdb.store_rejects is only supported for csv files with load_mode 'copy'. Rejected rows will not be captured.")
+        store_rejects = False
+    return store_rejects
+
+def check_submission_files(context: RunContext, data_model: DataModel, manifest: SubmissionManifest, con: Optional[duckdb.DuckDBPyConnection] = None):
+    """
+    Check the completeness and headers of the submission files, and add the tables and columns that cannot be loaded
+    or checked to the skip lists of the context. Only the manifest is read, no data is loaded.
+    Results are written to the logging schema if con is provided.
+    """
+    # check submission files completeness
+    with ProcessLog('check submission files'):
+        LOGGER.debug("Checking submission files completeness.")
+        required_cdm_tables = tuple(set(data_model.all_table_names()) - set(OPTIONAL_TABLES) - set(context.skip_duckdb_load_tables))
+        check_result_missing_submission_file = check_missing_submission_file(
+            file_dir = manifest.file_dir,
+            cdm_tables_expected = required_cdm_tables,
+            file_format = manifest.file_format,
+            multiple_file_per_table = manifest.multiple_file_per_table,
+            duckdb_conn = con,
+            manifest = manifest
+        )
+        if check_result_missing_submission_file.status not in ('PASS', 'SKIPPED'):
+            # skip checks for missing tables
+            context.skip_check_tables.extend(check_result_missing_submission_file.table_name)
+            context.skip_duckdb_load_tables.extend(check_result_missing_submission_file.table_name)
+
+        LOGGER.debug("Checking for extra submission files.")
+        check_result_extra_submission_file = check_extra_submission_file(
+            file_dir = manifest.file_dir,
+            cdm_tables_expected = data_model.all_table_names(),
+            file_format = manifest.file_format,
+            multiple_file_per_table = manifest.multiple_file_per_table,
+            duckdb_conn = con,
+            manifest = manifest
+        )
+
+    # Check header issues
+    if manifest.file_format not in ('csv', 'parquet'):
+        raise ValueError(f"Unsupported submission file format: {manifest.file_format}. Supported formats are 'csv' and 'parquet'.")
+    with ProcessLog('check headers'):
+        if manifest.file_format == 'csv':
+            # check header issues
+            for table_name in data_model.all_table_names():
+                # check if file exists for the table
+                file_path = manifest.get_table_path(table_name)
+                if not manifest.get_files(file_path):
+                    LOGGER.debug(f"No submission file found for table {table_name}. Skipping header checks. Path: {file_path}")
+                    continue
+                LOGGER.debug(f"Checking header for table: {table_name}, file: {file_path}")
+                if manifest.multiple_file_per_table:
+                    # check all csv files of the table have the same header
+                    check_result_inconsistent_header = check_inconsistent_header_in_csv(file_path, table_name, duckdb_conn=con, context=context, manifest=manifest)
+                    if check_result_inconsistent_header.status != 'PASS':
+                        continue
+                # check duplicated columns in csv
+                check_result_duplicated_column = check_duplicated_column_in_csv(file_path, table_name, manifest=manifest)
+                if check_result_duplicated_column.status != 'PASS':
+                    # if the csv has duplicated columns, don't load the table to duckdb
+                    context.skip_duckdb_load_tables.append(table_name)
+                    context.skip_check_tables.append(table_name)
+                # check extra columns in csv
+                check_result_extra_column = check_extra_column_in_csv(file_path, data_model, table_name, duckdb_conn=con, manifest=manifest)
+                # check missing columns in csv
+                check_result_missing_column = check_missing_column_in_csv(file_path, data_model, table_name, duckdb_conn=con, manifest=manifest)
+                if check_result_missing_column.status != 'PASS':
+                    context.skip_check_columns[table_name] = context.skip_check_columns.get(table_name, tuple()) + check_result_missing_column.column_name
+        if manifest.file_format == 'parquet':
+            # check header issues
+            for table_name in data_model.all_table_names():
+                file_path = manifest.get_table_path(table_name)
+                # check if file_path exists
+                if not os.path.exists(file_path):
+                    LOGGER.debug(f"No submission file found for table {table_name}. Skipping header checks. Path: {file_path}")
+                    continue
+                LOGGER.debug(f"Checking header for table: {table_name}, file: {file_path}")
+                # check extra columns in parquet
+                check_result_extra_column = check_extra_column_in_parquet(file_path, data_model, table_name, duckdb_conn=con, manifest=manifest)
+                # check missing columns in parquet
+                check_result_missing_column = check_missing_column_in_parquet(file_path, data_model, table_name, duckdb_conn=con, manifest=manifest)
+                if check_result_missing_column.status != 'PASS':
+                    context.skip_check_columns[table_name] = context.skip_check_columns.get(table_name, tuple()) + check_result_missing_column.column_name
+
+def load_table(
+    con: duckdb.DuckDBPyConnection,
+    table_name: str,
+    file_path: str,
+    context: RunContext,
+    data_model: DataModel,
+    manifest: SubmissionManifest,
+    load_mode: str,
+    failed_load_tables: Dict[str, Exception],
+    store_rejects: bool = False,
+    fingerprint: Optional[Dict] = None,
+    use_parquet_statistics: bool = False
+) -> List[CheckResult]:
+    """
+    Load the submission file(s) of one table into DuckDB, or expose them as a view with load_mode 'external', then run
+    the checks of the load (rejected rows, cast failures). Used as a CheckScheduler task providing the table.
+
+    A failed load does not raise: it is recorded in failed_load_tables and the table is added to context.skip_check_tables,
+    so the checks of the table are not run.
+
+    Parameters:
+        con (duckdb.DuckDBPyConnection): a duckdb connection.
+        table_name (str): the table to load.
+        file_path (str): path of the submission file(s) of the table.
+        context (RunContext): the context of the run.
+        data_model (DataModel): the data model, recorded with the fingerprint of the file.
+        manifest (SubmissionManifest): the scanned submission files.
+        load_mode (str): 'copy', 'staging' or 'external'.
+        failed_load_tables (Dict[str, Exception]): a dict of {table_name: exception} the failure is recorded in.
+        store_rejects (bool): if True, capture and report the rows rejected by the load.
+        fingerprint (Optional[Dict]): fingerprint of the file taken before the load, saved once the table is loaded.
+        use_parquet_statistics (bool): if True, answer row counts and NOT NULL checks of the table from the parquet footers.
+
+    Returns:
+        List[CheckResult]: results of the load checks.
+    """
+    try:
+        if load_mode == 'external':
+            create_duckdb_view(file_path, con, table_name, file_format=manifest.file_format, manifest=manifest)
+        else:
+            load_table_to_duckdb(file_path, con, table_name, file_format=manifest.file_format, accept_additional_col=True, store_rejects=store_rejects, manifest=manifest, staging=load_mode == 'staging')
+    except Exception as e:
+        LOGGER.error(f"Fail to load table {table_name} from {file_path}: {e}")
+        failed_load_tables[table_name] = e
+        context.skip_check_tables.append(table_name)
+        return []
+    check_results = []
+    if load_mode != 'external' and not PersonSample.is_sampled(table_name):
+        # a sampled table is reloaded by the next run
+        save_table_fingerprint(con, context.run_id, table_name, file_path, fingerprint, data_model, load_mode=load_mode, store_rejects=store_rejects)
+    if store_rejects:
+        # report rows rejected during the load
+        check_results.append(check_load_reject(con=con, table_name=table_name))
+    if load_mode == 'staging':
+        # report values that could not be cast to the column types, counted during the load
+        for column_name in get_cast_failure_columns(con, table_name):
+            check_results.append(check_type_conformance(con=con, table_name=table_name, column_name=column_name))
+    if use_parquet_statistics and not PersonSample.is_sampled(table_name):
+        # the table holds exactly the rows of its parquet files
+        ParquetFooterStats.register(table_name, manifest.get_files(file_path))
+    return check_results
+
+def get_load_tasks(context: RunContext, data_model: DataModel, manifest: SubmissionManifest) -> Dict[str, str]:
+    """
+    Get the submission files to load, as a dict of {table_name: file_path}. Skipped and unchanged tables are not loaded.
+    """
+    load_tasks = dict() # a dict of {table_name: file_path}
+    for table_name in data_model.all_table_names():
+        file_path = manifest.get_table_path(table_name)
+        # check if file_path exists
+        if not os.path.exists(file_path):
+            LOGGER.debug(f"No submission file found for table {table_name}. Skipping DuckDB load. Path: {file_path}")
+            continue
+        if table_name in context.skip_duckdb_load_tables:
+            LOGGER.debug(f"Skipping loading {table_name} to DuckDB as it is in the skip list.")
+            continue
+        if table_name in context.unchanged_tables:
+            LOGGER.info(f"Skipping loading {table_name} to DuckDB as the submission file is unchanged since run {context.unchanged_tables[table_name]['run_id']}.")
+            continue
+        load_tasks[table_name] = file_path
+    return load_tasks
+
+def _is_person_table(data_model: DataModel, table_name: str) -> bool:
+    """
+    Check if a table has a person_id column in the data model, i.e. is filtered to the sampled persons by PersonSample.
+    """
+    return PersonSample.column_name in data_model.all_column_names_in_table(table_name)
+
+def _key_set_source_exists(data_model: DataModel, context: RunContext, reference_table: str, reference_column: str, con: Optional[duckdb.DuckDBPyConnection] = None) -> bool:
+    """
+    Check if the referenced column of a key set exists: in the database if con is provided,
+    otherwise in the data model, for tables that will be created.
+    """
+    if con is not None:
+        return table_exists(con, reference_table) and column_exists(con, reference_table, reference_column)
+    return reference_table not in context.skip_duckdb_load_tables and reference_column in data_model.all_column_names_in_table(reference_table)
+
+def log_skipped_check(con: duckdb.DuckDBPyConnection, check_type: str, troubleshooting_message: str) -> CheckResult:
+    """
+    Log a check that is not run as SKIPPED. Registered as a task, so the result is only logged when the checks run.
+    """
+    result = CheckResult(
+        check_type=check_type,
+        status='SKIPPED',
+        troubleshooting_message=troubleshooting_message
+    )
+    result.log(LOGGER, duckdb_conn=con)
+    return result
+
+def register_checks(scheduler: CheckScheduler, data_model: DataModel, context: RunContext, key_sets: ReferenceKeySets, con: Optional[duckdb.DuckDBPyConnection] = None):
+    """
+    Register the database checks of the data model constraints in a CheckScheduler, except skipped tables and columns:
+    foreign keys (with the key sets they probe), NOT NULL, distinct, primary keys, field sizes, concept ids and fact_relationship.
+    Checks wait for the load tasks of the tables they read, which must be registered first.
+
+    Parameters:
+        scheduler (CheckScheduler): the scheduler to register the checks in.
+        data_model (DataModel): the data model.
+        context (RunContext): the context holding the skip lists.
+        key_sets (ReferenceKeySets): key sets shared by the foreign key checks.
+        con (Optional[duckdb.DuckDBPyConnection]): connection used to check that referenced tables exist. If not provided, the data model is used.
+    """
+    # Check foreign key violations
+    LOGGER.info("Checking foreign key violations.") 
+    # group foreign keys by main table, each table is scanned once and each referenced key set is built once
+    foreign_keys = dict() # a dict of {main_table: [(main_column, reference_table, reference_column), ...]}
+    for fk_definition in data_model.data['schema']['constraints']['foreign_keys']:
+        main_table = fk_definition['source_table']
+        main_column = fk_definition['source_field']
+        reference_table = fk_definition['target_table']
+        reference_column = fk_definition['target_field']
+        if main_table in context.skip_check_tables:
+            LOGGER.debug(f"Skipping foreign key check for {main_table}.{main_column} referencing {reference_table}.{reference_column} as main table is in the skip list.")
+            continue
+        if reference_table in context.skip_check_tables or reference_table in context.skip_check_tables:
+            LOGGER.debug(f"Skipping foreign key check for {main_table}.{main_column} referencing {reference_table}.{reference_column} as reference table is in the skip list.")
+            continue
+        if main_table in context.skip_check_columns.keys() and main_column in context.skip_check_columns[main_table]:
+            LOGGER.debug(f"Skipping foreign key check for {main_table}.{main_column} referencing {reference_table}.{reference_column} as the main column is in the skip list.")
+            continue
+        if PersonSample.is_enabled() and _is_person_table(data_model, reference_table) and not _is_person_table(data_model, main_table):
+            # the main table is loaded whole, its rows of persons out of the sample would be violations
+            LOGGER.debug(f"Skipping foreign key check for {main_table}.{main_column} referencing {reference_table}.{reference_column} as only the reference table is sampled by person.")
+            continue
+        if reference_table in context.skip_check_columns.keys() and reference_column in context.skip_check_columns[reference_table]:
+            LOGGER.debug(f"Skipping foreign key check for {main_table}.{main_column} referencing {reference_table}.{reference_column} as the reference column is in the skip list.")
+            continue
+        foreign_keys.setdefault(main_table, []).append((main_column, reference_table, reference_column))
+    for main_table, table_foreign_keys in foreign_keys.items():
+        key_set_tasks = []
+        for main_column, reference_table, reference_column in table_foreign_keys:
+            key_set_task = f"build key set {reference_table}.{reference_column}"
+            if key_set_task not in scheduler.tasks and _key_set_source_exists(data_model, context, reference_table, reference_column, con):
+                scheduler.add(key_set_task, key_sets.build, tables=[reference_table], reference_table=reference_table, reference_column=reference_column)
+            if key_set_task in scheduler.tasks and key_set_task not in key_set_tasks:
+                key_set_tasks.append(key_set_task)
+        # e.g. the foreign keys of visit_occurrence wait for the key sets of person.person_id, provider.provider_id, ...
+        # foreign keys referencing a table that fails to load are dropped by check_fk_violations, the others are still checked
+        scheduler.add(
+            f"check foreign keys {main_table}",
+            check_fk_violations,
+            tables=[main_table],
+            depends_on=key_set_tasks,
+            main_table=main_table,
+            foreign_keys=table_foreign_keys,
+            key_sets=key_sets,
+            skip_tables=context.skip_check_tables,
+            fail_fast=CONFIG['duckdb'].get('fail_fast', False),
+        )
+
+    # Check Not Null violations
+    # group the NOT NULL checks of each table, including the NOT NULL part of primary keys, to check them in one scan per table
+    not_null_columns = dict() # a dict of {table_name: [column_name, ...]}
+    for not_null_definition in data_model.data['schema']['constraints']['not_null']:
+        table_name = not_null_definition['table']
+        column_name = not_null_definition['field']
+
+        if table_name in context.skip_check_tables:
+            LOGGER.debug(f"Skipping Not Null check for {table_name}.{column_name} as table is in the skip list.")
+            continue
+        if table_name in context.skip_check_columns.keys() and column_name in context.skip_check_columns[table_name]:
+            LOGGER.debug(f"Skipping Not Null check for {table_name}.{column_name} as column is in the skip list.")
+            continue
+        not_null_columns.setdefault(table_name, []).append(column_name)
+    for pk_definition in data_model.data['schema']['constraints']['primary_keys']:
+        table_name = pk_definition['table']
+        column_names = tuple(pk_definition['fields'])
+        if table_name in context.skip_check_tables:
+            continue
+        if table_name in context.skip_check_columns.keys() and any(col in context.skip_check_columns[table_name] for col in column_names):
+            continue
+        # check not null for each column in the primary key
+        not_null_columns.setdefault(table_name, []).extend(column_names)
+    for table_name, column_names in not_null_columns.items():
+        scheduler.add(
+            f"check not null {table_name}",
+            check_not_null_violations,
+            tables=[table_name],
+            table_name=table_name,
+            column_names=column_names,
+            fail_fast=CONFIG['duckdb'].get('fail_fast', False),
+        )
+
+    # Check Distinct violations
+    for distinct_definition in data_model.data['schema']['constraints']['uniques']:
+        table_name = distinct_definition['table']
+        column_name = distinct_definition['field']
+
+        if table_name in context.skip_check_tables:
+            LOGGER.debug(f"Skipping Distinct check for {table_name}.{column_name} as table is in the skip list.")
+            continue
+        if table_name in context.skip_check_columns.keys() and column_name in context.skip_check_columns[table_name]:
+            LOGGER.debug(f"Skipping Distinct check for {table_name}.{column_name} as column is in the skip list.")
+            continue
+        if f"check distinct {table_name}.{column_name}" in scheduler.tasks:
+            continue
+        scheduler.add(
+            f"check distinct {table_name}.{column_name}",
+            check_distinct_violation,
+            tables=[table_name],
+            table_name=table_name,
+            column_names=column_name,
+            approx_precheck=CONFIG['duckdb'].get('distinct_approx_precheck', False),
+        )
+
+    # Check PK violations
+    # PK is a combination of NOT NULL and DISTINCT
+    for pk_definition in data_model.data['schema']['constraints']['primary_keys']:
+        table_name = pk_definition['table']
+        column_names = tuple(pk_definition['fields'])  # list of columns in the primary key
+
+        if table_name in context.skip_check_tables:
+            LOGGER.debug(f"Skipping Primary Key check for {table_name}({', '.join(column_names)}) as table is in the skip list.")
+            continue
+        if table_name in context.skip_check_columns.keys() and any(col in context.skip_check_columns[table_name] for col in column_names):
+            LOGGER.debug(f"Skipping Primary Key check for {table_name}({', '.join(column_names)}) as one or more columns are in the skip list.")
+            continue
+        if f"check primary key {table_name}({', '.join(column_names)})" in scheduler.tasks:
+            continue
+        # not null for each column in the primary key is checked with the other NOT NULL checks of the table
+        # check distinct for the combination of columns in the primary key
+        scheduler.add(
+            f"check primary key {table_name}({', '.join(column_names)})",
+            check_distinct_violation,
+            tables=[table_name],
+            table_name=table_name,
+            column_names=column_names,
+            approx_precheck=CONFIG['duckdb'].get('distinct_approx_precheck', False),
+        )
+
+    # Check values against the string lengths and numeric precisions of the data model, in one scan per table
+    for table_name, fields in get_size_columns(data_model).items():
+        if table_name in context.skip_check_tables:
+            LOGGER.debug(f"Skipping field size check for {table_name} as table is in the skip list.")
+            continue
+        fields = {column_name: field for column_name, field in fields.items() if column_name not in context.skip_check_columns.get(table_name, ())}
+        if not fields:
+            continue
+        scheduler.add(
+            f"check field size {table_name}",
+            check_field_sizes,
+            tables=[table_name],
+            table_name=table_name,
+            fields=fields,
+        )
+
+    # Check concept ids against the vocabulary, if the concept table is loaded by the run or unchanged since the last one
+    # all concept columns of a table are checked by one scan of the table
+    if 'concept' in scheduler.table_providers or 'concept' in getattr(context, 'unchanged_tables', dict()):
+        for table_name, column_names in get_concept_columns(data_model).items():
+            if table_name in context.skip_check_tables:
+                LOGGER.debug(f"Skipping concept check for {table_name} as table is in the skip list.")
+                continue
+            column_names = [column_name for column_name in column_names if column_name not in context.skip_check_columns.get(table_name, ())]
+            if not column_names:
+                continue
+            scheduler.add(
+                f"check concept ids {table_name}",
+                check_concept_ids,
+                tables=[table_name],
+                depends_on=[scheduler.table_providers['concept']] if 'concept' in scheduler.table_providers else [],
+                table_name=table_name,
+                column_names=column_names,
+            )
+
+    # Check fact_relationship
+    if PersonSample.is_enabled():
+        # fact_relationship is not sampled by person, its facts of persons out of the sample would be violations
+        scheduler.add(
+            "check fact_relationship",
+            log_skipped_check,
+            check_type='fact_relationship_violation',
+            troubleshooting_message='The fact_relationship check is not supported with a person sample.',
+        )
+        return
+    # domain tables that fail to load are dropped by check_fact_relationship, so the task only waits for the loads
+    fact_relationship_tables = ['fact_relationship'] + [mapping['table_name'] for mapping in FACT_RELATIONSHIP_DOMAIN_CONCEPT_ID_TO_CDM_MAPPING.values()]
+    scheduler.add(
+        "check fact_relationship",
+        check_fact_relationship,
+        depends_on=[scheduler.table_providers[table_name] for table_name in dict.fromkeys(fact_relationship_tables) if table_name in scheduler.table_providers],
+        skip_tables=context.skip_check_tables,
+    )
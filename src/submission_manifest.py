@@ -0,0 +1,187 @@
+from typing import List, Dict, Optional, Set
+from concurrent.futures import ThreadPoolExecutor
+from src.util import get_csv_header, get_parquet_header, get_csv_files, CSV_FILE_EXTENSIONS
+from src.config import LOGGER
+import duckdb
+import glob
+import os
+
+
+class SubmissionManifest:
+    """
+    A manifest of the submission files, built by walking the submission directory once.
+
+    For every submission file, the manifest holds the table name, header, size, modification time and,
+    for parquet files, the row count and row group count from the parquet footer. Files are scanned in parallel.
+    Header checks and loaders read the header from the manifest instead of reopening the files.
+
+    Parameters:
+        file_dir (str): Path to the directory containing submission files.
+        file_format (str): file format, either 'csv' or 'parquet'. Default to 'csv'.
+        multiple_file_per_table (bool): whether each table is a folder of files named after the table,
+            or a single file named {table_name}.[csv/parquet]. Default to False.
+
+    Example:
+        manifest = SubmissionManifest('/data', 'csv').scan()
+        manifest.get_header('/data/person.csv')
+    """
+
+    def __init__(self, file_dir: str, file_format: str = 'csv', multiple_file_per_table: bool = False):
+        if file_format not in ('csv', 'parquet'):
+            raise ValueError(f"Unsupported file_format: {file_format}. Supported types are 'csv' and 'parquet'.")
+        self.file_dir = file_dir
+        self.file_format = file_format
+        self.multiple_file_per_table = multiple_file_per_table
+        self.table_files: Dict[str, List[str]] = dict()  # a dict of {table_name: [file_path, ...]}
+        self.files: Dict[str, Dict] = dict()  # a dict of {file_path: file info}
+
+    def _list_table_files(self) -> Dict[str, List[str]]:
+        """
+        List submission files of each table, without opening them.
+        """
+        file_extensions = CSV_FILE_EXTENSIONS if self.file_format == 'csv' else ('.parquet', )
+        table_files = dict()
+        for entry in sorted(os.listdir(self.file_dir)):
+            entry_path = os.path.normpath(os.path.join(self.file_dir, entry))
+            if self.multiple_file_per_table:
+                if os.path.isdir(entry_path):
+                    table_files[entry] = sorted(
+                        os.path.join(entry_path, f) for f in os.listdir(entry_path)
+                        if f.endswith(file_extensions) and os.path.isfile(os.path.join(entry_path, f))
+                    )
+            elif os.path.isfile(entry_path):
+                for file_extension in file_extensions:
+                    if entry.endswith(file_extension):
+                        table_name = entry[:-len(file_extension)]
+                        if table_name in table_files:
+                            # e.g. person.csv and person.csv.gz
+                            LOGGER.warning(f"More than one submission file found for table {table_name}: {table_files[table_name][0]}, {entry_path}. Only {table_files[table_name][0]} is used.")
+                        else:
+                            table_files[table_name] = [entry_path]
+                        break
+        return table_files
+
+    def _scan_file(self, file_path: str, table_name: str, con: duckdb.DuckDBPyConnection) -> Dict:
+        """
+        Collect header, size, modification time and parquet footer info of one file.
+        """
+        stat = os.stat(file_path)
+        file_info = {
+            'table_name': table_name,
+            'header': None,
+            'error': None,
+            'file_size': stat.st_size,
+            'modified_time': stat.st_mtime,
+            'num_rows': None,
+            'row_group_count': None,
+        }
+        try:
+            if self.file_format == 'csv':
+                file_info['header'] = get_csv_header(file_path)
+            else:
+                with con.cursor() as cursor:
+                    file_info['header'] = get_parquet_header(file_path, con=cursor)
+                    file_info['num_rows'], file_info['row_group_count'] = cursor.execute(
+                        "SELECT num_rows, num_row_groups FROM parquet_file_metadata(?)", (file_path,)
+                    ).fetchone()
+        except Exception as e:
+            # keep the error, it is raised again when the header is requested
+            file_info['error'] = e
+        return file_info
+
+    def scan(self, con: Optional[duckdb.DuckDBPyConnection] = None, max_workers: Optional[int] = None) -> 'SubmissionManifest':
+        """
+        Walk the submission directory once and collect the info of every submission file in parallel.
+
+        Parameters:
+            con (Optional[DuckDBPyConnection]): connection used to read parquet footers. An in-memory connection is used if not provided.
+            max_workers (Optional[int]): number of files scanned at the same time. Defaults to the ThreadPoolExecutor default.
+
+        Returns:
+            SubmissionManifest: self
+        """
+        self.table_files = self._list_table_files()
+        scan_con = con if con is not None else duckdb.connect(database=':memory:')
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {
+                    file_path: executor.submit(self._scan_file, file_path, table_name, scan_con)
+                    for table_name, file_paths in self.table_files.items() for file_path in file_paths
+                }
+                self.files = {file_path: future.result() for file_path, future in futures.items()}
+        finally:
+            if con is None:
+                scan_con.close()
+        LOGGER.info(f"Scanned {len(self.files)} submission file(s) of {len(self.table_files)} table(s) in {self.file_dir}.")
+        return self
+
+    def table_names(self) -> Set[str]:
+        """
+        Get table names of the submission files.
+        """
+        return set(self.table_files.keys())
+
+    def get_table_path(self, table_name: str) -> str:
+        """
+        Get the path of the submission file of a table, e.g. {file_dir}/person.csv.gz, or the table folder if multiple_file_per_table.
+        If the table has no submission file, the default path {file_dir}/{table_name}.[csv/parquet] is returned.
+        """
+        if self.multiple_file_per_table:
+            return os.path.join(self.file_dir, table_name)
+        if self.table_files.get(table_name):
+            return self.table_files[table_name][0]
+        return os.path.join(self.file_dir, f"{table_name}.{self.file_format}")
+
+    def get_files(self, path: str) -> List[str]:
+        """
+        Get the submission files of a path. The path can be a file, a table directory or a glob pattern.
+        Paths outside of the manifest are listed from the file system.
+        """
+        path = os.path.normpath(path)
+        if path in self.files:
+            return [path]
+        table_name = os.path.basename(path)
+        if self.multiple_file_per_table and os.path.normpath(os.path.join(self.file_dir, table_name)) == path and table_name in self.table_files:
+            return self.table_files[table_name]
+        if glob.has_magic(path):
+            return sorted(f for f in self.files if glob.fnmatch.fnmatch(f, path)) or sorted(glob.glob(path))
+        if self.file_format == 'csv':
+            return get_csv_files(path)
+        return [path] if os.path.isfile(path) else sorted(glob.glob(os.path.join(path, '*.parquet')))
+
+    def get_headers(self, path: str) -> Dict[str, List[str]]:
+        """
+        Get the header of every submission file of a path, as a dict of {file_path: header}.
+
+        Raises:
+            ValueError: If a file is empty or cannot be read.
+        """
+        headers = dict()
+        for file_path in self.get_files(path):
+            file_info = self.files.get(file_path)
+            if file_info is None:
+                # file not in the manifest, read it now
+                headers[file_path] = get_csv_header(file_path) if self.file_format == 'csv' else get_parquet_header(file_path)
+            elif file_info['error'] is not None:
+                raise file_info['error']
+            else:
+                headers[file_path] = file_info['header']
+        return headers
+
+    def get_header(self, path: str) -> List[str]:
+        """
+        Get the header of a path. For a table directory or a glob pattern, the header of its first file is returned.
+
+        Raises:
+            FileNotFoundError: If no submission file is found for the path.
+        """
+        file_paths = self.get_files(path)
+        if not file_paths:
+            raise FileNotFoundError(f"No submission file found in: {path}")
+        return self.get_headers(file_paths[0])[file_paths[0]]
+
+    def get_size(self, path: str) -> int:
+        """
+        Get the total size in bytes of the submission files of a path.
+        """
+        return sum(self.files[f]['file_size'] if f in self.files else os.path.getsize(f) for f in self.get_files(path))
@@ -0,0 +1,86 @@
+from typing import Dict, Optional, Tuple
+import threading
+
+
+class TableStats:
+    """
+    Row counts of the tables of a run, shared by the loaders, the checks and ProcessLog.
+
+    A load records the row count of its table from the number of rows returned by COPY / INSERT, so checks
+    (e.g. the denominator of a failing FK or NOT NULL check) do not run COUNT(*) again. Row counts of tables that
+    were not loaded in the run (e.g. unchanged tables, views) are recorded by util.get_table_count on first use.
+    A row count is dropped by invalidate() when its table changes (CREATE, DROP, view creation).
+
+    hits and misses count the lookups answered from the registry and the lookups that had to count the table.
+
+    Example:
+        TableStats.enable()
+        TableStats.set_row_count('person', 1000)  # after COPY person FROM ...
+        util.get_table_count(con, 'person')  # 1000, without scanning person
+        TableStats.invalidate('person')
+        TableStats.disable()
+    """
+
+    enabled: bool = False  # Class variable, row counts are neither recorded nor returned while False
+    hits: int = 0  # Class variable to count lookups answered from the registry
+    misses: int = 0  # Class variable to count lookups not answered from the registry
+    _row_counts: Dict[Tuple[str, str], int] = dict()  # Class variable, a dict of {(schema, table_name): row count}
+    _lock = threading.Lock()
+
+    @classmethod
+    def enable(cls):
+        with cls._lock:
+            cls.enabled = True
+            cls.hits = 0
+            cls.misses = 0
+            cls._row_counts.clear()
+
+    @classmethod
+    def disable(cls):
+        with cls._lock:
+            cls.enabled = False
+            cls._row_counts.clear()
+
+    @classmethod
+    def set_row_count(cls, table_name: str, row_count: int, schema: Optional[str] = None):
+        """
+        Record the row count of a table, e.g. after it is loaded.
+        """
+        if not cls.enabled:
+            return
+        with cls._lock:
+            cls._row_counts[(schema or 'main', table_name)] = row_count
+
+    @classmethod
+    def get_row_count(cls, table_name: str, schema: Optional[str] = None) -> Optional[int]:
+        """
+        Get the recorded row count of a table, or None (a miss) if it is not recorded.
+        """
+        if not cls.enabled:
+            return None
+        with cls._lock:
+            row_count = cls._row_counts.get((schema or 'main', table_name))
+            if row_count is None:
+                cls.misses += 1
+            else:
+                cls.hits += 1
+            return row_count
+
+    @classmethod
+    def peek_row_count(cls, table_name: str, schema: Optional[str] = None) -> Optional[int]:
+        """
+        Get the recorded row count of a table without counting a hit or miss.
+        """
+        with cls._lock:
+            return cls._row_counts.get((schema or 'main', table_name))
+
+    @classmethod
+    def invalidate(cls, table_name: Optional[str] = None, schema: Optional[str] = None):
+        """
+        Drop the row count of a table after it changes. Drop all row counts if table_name is None.
+        """
+        with cls._lock:
+            if table_name is None:
+                cls._row_counts.clear()
+            else:
+                cls._row_counts.pop((schema or 'main', table_name), None)
@@ -1,15 +1,24 @@
 import csv
-from typing import List, Dict
+import gzip
+from typing import List, Dict, Optional, Tuple
 from src.config import CONFIG, LOGGER
 import os
 from src.constants import DQ_THRESHOLDS
+from src.parquet_stats import ParquetFooterStats
+from src.catalog_cache import CatalogCache
+from src.table_stats import TableStats
 import fnmatch
+import glob
+import hashlib
 import duckdb
 
+CSV_FILE_EXTENSIONS = ('.csv', '.csv.gz', '.csv.zst')  # plain, gzip and zstd compressed csv files
+
 
 def get_csv_header(file_path: str, **kwargs) -> List[str]:
     """
-    Get header column list from a csv file.
+    Get header column list from a csv file. Gzip (.csv.gz) and zstd (.csv.zst) compressed files are read
+    without decompressing them to disk, only the first line is decompressed.
 
     Args:
         file_path (str): path to csv file.
@@ -20,7 +29,9 @@ def get_csv_header(file_path: str, **kwargs) -> List[str]:
     Returns:
         list[str]: A list of strings, each representing a column name. 
     """
-    with open(file_path) as csvfile:
+    if file_path.endswith('.zst'):
+        return _get_zstd_csv_header(file_path)
+    with (gzip.open(file_path, 'rt') if file_path.endswith('.gz') else open(file_path)) as csvfile:
         reader = csv.reader(csvfile, kwargs)
         header = next(reader, None)
         if header is None:
@@ -28,20 +39,187 @@ def get_csv_header(file_path: str, **kwargs) -> List[str]:
         else:
             return([x.lower() for x in header])
 
-def get_parquet_header(file_path: str) -> List[str]:
+def _get_zstd_csv_header(file_path: str) -> List[str]:
+    """
+    Get header column list from a zstd compressed csv file, decompressed by DuckDB (zstd is not in the python standard library).
+    The first line is parsed with the csv options of the 'copy_options' config.
+    """
+    read_csv_options = get_read_csv_options(CONFIG['duckdb']['copy_options'], skip_options=('format', 'header'))
+    with duckdb.connect(database=':memory:') as con:
+        header = con.execute(
+            f"SELECT * FROM read_csv('{file_path}', header=false, all_varchar=true{', ' + read_csv_options if read_csv_options else ''}) LIMIT 1"
+        ).fetchone()
+    if header is None:
+        raise ValueError(f"CSV file: {file_path} is empty.")
+    return [x.lower() for x in header]
+
+def strip_csv_extension(file_name: str) -> str:
+    """
+    Remove the csv file extension, including the compression extension, from a file name. E.g. 'person.csv.gz' -> 'person'.
+    """
+    for file_extension in sorted(CSV_FILE_EXTENSIONS, key=len, reverse=True):
+        if file_name.endswith(file_extension):
+            return file_name[:-len(file_extension)]
+    return file_name
+
+def get_csv_files(path: str) -> List[str]:
+    """
+    Get the list of csv files (shards) for a table.
+
+    Args:
+        path (str): path to a csv file, a directory containing csv files, or a glob pattern (e.g. '/data/measurement/*.csv').
+
+    Returns:
+        list[str]: A sorted list of csv file paths. Empty if nothing matches.
+    """
+    if os.path.isfile(path):
+        return [path]
+    if os.path.isdir(path):
+        return sorted(
+            os.path.join(path, f) for f in os.listdir(path)
+            if f.endswith(CSV_FILE_EXTENSIONS) and os.path.isfile(os.path.join(path, f))
+        )
+    return sorted(f for f in glob.glob(path) if os.path.isfile(f))
+
+def get_csv_source(path: str) -> str:
+    """
+    Get the source string for a csv file, directory or glob pattern that can be used in a DuckDB COPY/read_csv statement.
+    A directory is converted to a glob pattern matching all csv files in it, so all shards are read in one parallel scan.
+    Compressed shards are decompressed by DuckDB while parsing, the compression is detected from the file extension.
+
+    Args:
+        path (str): path to a csv file, a directory containing csv files, or a glob pattern.
+
+    Raises:
+        ValueError: If the directory mixes compressions and also has other files matching '*.csv*'.
+
+    Returns:
+        str: file path or glob pattern.
+    """
+    if os.path.isdir(path):
+        file_extensions = {next(e for e in sorted(CSV_FILE_EXTENSIONS, key=len, reverse=True) if f.endswith(e)) for f in get_csv_files(path)}
+        if len(file_extensions) <= 1:
+            return os.path.join(path, '*' + (file_extensions.pop() if file_extensions else '.csv'))
+        # shards with different compressions, e.g. .csv and .csv.gz
+        source = os.path.join(path, '*.csv*')
+        if len(glob.glob(source)) != len(get_csv_files(path)):
+            raise ValueError(f"Directory {path} has csv files with different compressions and other files matching {source}. Please remove the other files.")
+        return source
+    return path
+
+def get_read_csv_options(copy_options: str, skip_options: tuple = ('format', )) -> str:
+    """
+    Convert csv options of a DuckDB COPY statement (e.g. the 'copy_options' config) into read_csv named parameters.
+    Options in skip_options (by default FORMAT) are dropped. Options without a value (e.g. HEADER) are set to true.
+
+    Args:
+        copy_options (str): COPY options, e.g. "FORMAT CSV, HEADER, DELIM ',', ESCAPE '\"'".
+        skip_options (tuple): lower case names of the options to drop. Default to ('format', ).
+
+    Returns:
+        str: read_csv parameters, e.g. "header=true, delim=',', escape='\"'".
+    """
+    options = []
+    current = ''
+    quote_char = None
+    # split on commas outside of quotes
+    for char in copy_options:
+        if quote_char:
+            if char == quote_char:
+                quote_char = None
+        elif char in ("'", '"'):
+            quote_char = char
+        elif char == ',':
+            options.append(current.strip())
+            current = ''
+            continue
+        current += char
+    if current.strip():
+        options.append(current.strip())
+    read_csv_options = []
+    for option in options:
+        key, _, value = option.partition(' ')
+        key = key.lower()
+        value = value.strip()
+        if key in skip_options:
+            continue
+        read_csv_options.append(f"{key}={value if value else 'true'}")
+    return ', '.join(read_csv_options)
+
+def get_parquet_header(file_path: str, con: duckdb.DuckDBPyConnection = None) -> List[str]:
     """
     Get header column list from a parquet file.
 
     Args:
         file_path (str): path to parquet file.
+        con (DuckDBPyConnection): connection used to read the file. A new in-memory connection is opened if not provided.
     Returns:
         list[str]: A list of strings, each representing a column name. 
     """
-    with duckdb.connect(database=':memory:') as con:
-        con.execute(f"DESCRIBE SELECT * FROM read_parquet('{file_path}')")
-        header = [item[0].lower() for item in con.fetchall()]
-        LOGGER.debug(f"Parquet file: {file_path} has columns: {header}")
-        return header
+    if con is None:
+        with duckdb.connect(database=':memory:') as con:
+            return get_parquet_header(file_path, con)
+    con.execute(f"DESCRIBE SELECT * FROM read_parquet('{file_path}')")
+    header = [item[0].lower() for item in con.fetchall()]
+    LOGGER.debug(f"Parquet file: {file_path} has columns: {header}")
+    return header
+
+def get_path_size(path: str) -> int:
+    """
+    Get the size in bytes of a submission file, or the total size of all files under a submission folder.
+
+    Args:
+        path (str): path to a file, a directory or a glob pattern.
+
+    Returns:
+        int: size in bytes. 0 if the path does not exist.
+    """
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total_size = 0
+    if os.path.isdir(path):
+        for dir_path, _, file_names in os.walk(path):
+            for file_name in file_names:
+                total_size += os.path.getsize(os.path.join(dir_path, file_name))
+    else:
+        total_size = sum(os.path.getsize(f) for f in glob.glob(path) if os.path.isfile(f))
+    return total_size
+
+def get_path_fingerprint(path: str, content_hash: bool = False) -> Dict:
+    """
+    Get a fingerprint of a submission file, or of all files under a submission folder.
+    Used to detect if a submission file changed since it was loaded into DuckDB.
+
+    Args:
+        path (str): path to a file, a directory or a glob pattern.
+        content_hash (bool): if True, also compute a blake2b hash of the file content(s). This reads the whole file(s).
+
+    Returns:
+        dict: {'file_count': int, 'file_size': int, 'modified_time': float, 'content_hash': str or None}.
+            file_size is the total size in bytes; modified_time is the latest modification time (epoch seconds) of the file(s).
+    """
+    if os.path.isfile(path):
+        file_paths = [path]
+    elif os.path.isdir(path):
+        file_paths = sorted(os.path.join(dir_path, file_name) for dir_path, _, file_names in os.walk(path) for file_name in file_names)
+    else:
+        file_paths = sorted(f for f in glob.glob(path) if os.path.isfile(f))
+    file_stats = [os.stat(file_path) for file_path in file_paths]
+    fingerprint = {
+        'file_count': len(file_paths),
+        'file_size': sum(stat.st_size for stat in file_stats),
+        'modified_time': max((stat.st_mtime for stat in file_stats), default=0.0),
+        'content_hash': None,
+    }
+    if content_hash:
+        hasher = hashlib.blake2b(digest_size=32)
+        for file_path in file_paths:
+            hasher.update(os.path.relpath(file_path, path if os.path.isdir(path) else os.path.dirname(file_path)).encode())
+            with open(file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(8 * 1024 * 1024), b''):
+                    hasher.update(chunk)
+        fingerprint['content_hash'] = hasher.hexdigest()
+    return fingerprint
 
 def get_table_count(
         con, 
@@ -50,6 +228,9 @@ def get_table_count(
     ) -> int:
     """
     Get the count of rows in a DuckDB table.
+    The count is read from TableStats if the table was loaded or counted before in the run. Otherwise, if the table is
+    registered in ParquetFooterStats, the count is read from the parquet footers instead of scanning the table.
+    The count is then recorded in TableStats.
 
     Args:
         con (DuckDBPyConnection): A DuckDB connection object.
@@ -59,17 +240,94 @@ def get_table_count(
     Returns:
         int: The number of rows in the specified table.
     """
+    count = TableStats.get_row_count(table_name, schema)
+    if count is not None:
+        return count
+    if not schema:
+        count = ParquetFooterStats.get_row_count(con, table_name)
+        if count is not None:
+            LOGGER.debug(f"Row count of table {table_name} read from parquet footers: {count}")
+            TableStats.set_row_count(table_name, count)
+            return count
     if schema:
         sql = f"SELECT COUNT(*) FROM {schema}.{table_name}"
     else:
         sql = f"SELECT COUNT(*) FROM {table_name}"
     count = con.execute(sql).fetchone()[0]
     assert isinstance(count, int), f"Count for table {table_name} is not an integer: {count}"
+    TableStats.set_row_count(table_name, count, schema)
     return count
 
+def count_violations_until_fail(
+        con,
+        from_sql: str,
+        violation_filters: Dict[str, str],
+        fail_counts: Dict[str, int],
+        sample_values: Optional[Dict[str, str]] = None
+    ) -> Tuple[Dict[str, int], Dict[str, list], List[str]]:
+    """
+    Count the violating rows of several checks of a table, stopping the scan once the violations found guarantee the FAIL
+    status of a check (see CheckResult.get_fail_count).
+    The violating rows are read with a LIMIT of the sum of the fail counts of the checks. If the scan stops at the limit,
+    at least one check reached its fail count: its count is recorded as its fail count, a lower bound, and the other
+    checks are counted again. Otherwise every count is exact.
+
+    Args:
+        con (DuckDBPyConnection): A DuckDB connection object.
+        from_sql (str): FROM clause of the scanned rows, e.g. '"person"' or '"visit_occurrence" AS m LEFT JOIN ...'.
+        violation_filters (Dict[str, str]): a dict of {name: SQL predicate of the violating rows of a check}.
+        fail_counts (Dict[str, int]): a dict of {name: number of violations that fails the check}, for each check.
+        sample_values (Optional[Dict[str, str]]): a dict of {name: SQL expression}, the 5 most frequent values of the
+            expression among the violating rows of the check are sampled. Defaults to None, no samples.
+
+    Returns:
+        Tuple[Dict[str, int], Dict[str, list], List[str]]: a dict of {name: violation count}, a dict of {name: sampled values}
+            and the names of the checks whose count is a lower bound.
+    """
+    sample_values = sample_values or dict()
+    counts = dict()
+    samples = dict()
+    lower_bounds = []
+    remaining = list(violation_filters)
+    while remaining:
+        limit = sum(fail_counts[name] for name in remaining)
+        inner_columns = []
+        outer_columns = ['COUNT(*)']
+        for i, name in enumerate(remaining):
+            inner_columns.append(f'({violation_filters[name]}) AS v{i}')
+            outer_columns.append(f'COUNT(*) FILTER (WHERE v{i})')
+            if name in sample_values:
+                inner_columns.append(f'{sample_values[name]} AS s{i}')
+                outer_columns.append(f'approx_top_k(s{i}, 5) FILTER (WHERE v{i})')
+        query = f"""
+            SELECT {', '.join(outer_columns)}
+            FROM (
+                SELECT {', '.join(inner_columns)}
+                FROM {from_sql}
+                WHERE {' OR '.join(f'({violation_filters[name]})' for name in remaining)}
+                LIMIT {limit}
+            );
+        """
+        LOGGER.debug(f"Executing early exit violation count query: {query}")
+        row_count, *values = con.execute(query).fetchone()
+        round_counts = dict()
+        for name in remaining:
+            round_counts[name] = values.pop(0)
+            if name in sample_values:
+                samples[name] = values.pop(0)
+        if row_count < limit:
+            counts.update(round_counts)
+            break
+        decided = [name for name in remaining if round_counts[name] >= fail_counts[name]]
+        for name in decided:
+            counts[name] = fail_counts[name]
+            lower_bounds.append(name)
+        remaining = [name for name in remaining if name not in decided]
+    return counts, samples, lower_bounds
+
 def table_exists(con, table_name: str, schema: str = None) -> bool:
     """
-    Check if a table exists in the DuckDB database.
+    Check if a table exists in the DuckDB database. Answered from the CatalogCache snapshot if the cache is enabled.
 
     Args:
         con (DuckDBPyConnection): A DuckDB connection object.
@@ -79,20 +337,20 @@ def table_exists(con, table_name: str, schema: str = None) -> bool:
     Returns:
         bool: True if the table exists, False otherwise.
     """
+    if CatalogCache.is_enabled():
+        return CatalogCache.table_exists(table_name, schema or 'main')
     if schema:
-        sql = f"""
-            f'SHOW TABLES FROM "{schema}";'
-        """
+        all_tables = [item[0] for item in con.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = ?;", (schema,)).fetchall()]
     else:
         sql = f"""
             SHOW TABLES;
         """
-    all_tables = [item[0] for item in con.execute(sql).fetchall()]
+        all_tables = [item[0] for item in con.execute(sql).fetchall()]
     return table_name in all_tables
 
 def column_exists(con, table_name: str, column_name: str, schema: str = None) -> bool:
     """
-    Check if a column exists in a DuckDB table.
+    Check if a column exists in a DuckDB table. Answered from the CatalogCache snapshot if the cache is enabled.
 
     Args:
         con (DuckDBPyConnection): A DuckDB connection object.
@@ -103,6 +361,8 @@ def column_exists(con, table_name: str, column_name: str, schema: str = None) ->
     Returns:
         bool: True if the column exists in the specified table, False otherwise.
     """
+    if CatalogCache.is_enabled():
+        return CatalogCache.column_exists(table_name, column_name, schema or 'main')
     if not table_exists(con, table_name, schema):
         return False
     if schema:
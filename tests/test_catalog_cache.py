@@ -0,0 +1,22 @@
+from src.catalog_cache import CatalogCache
+from src.util import table_exists, column_exists
+import duckdb
+
+
+def test_catalog_cache():
+    with duckdb.connect(database=':memory:') as con:
+        con.execute("CREATE TABLE person (person_id BIGINT, gender_concept_id INTEGER)")
+        CatalogCache.enable(con)
+        try:
+            assert table_exists(con, 'person')
+            assert column_exists(con, 'person', 'person_id')
+            assert not table_exists(con, 'visit_occurrence')
+            con.execute("ALTER TABLE person ADD COLUMN year_of_birth INTEGER")
+            # snapshot is stale until invalidated
+            assert not column_exists(con, 'person', 'year_of_birth')
+            CatalogCache.invalidate()
+            assert column_exists(con, 'person', 'year_of_birth')
+        finally:
+            CatalogCache.disable()
+        con.execute("CREATE TABLE visit_occurrence (visit_occurrence_id BIGINT)")
+        assert table_exists(con, 'visit_occurrence')
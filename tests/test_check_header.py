@@ -1,4 +1,5 @@
 from src.util import get_csv_header
+from src.dq_checks.check_header import check_inconsistent_header_in_csv
 
 
 def test_get_csv_header():
@@ -8,3 +9,15 @@ def test_get_csv_header():
 
 
 
+
+def test_check_inconsistent_header_in_csv(tmp_path):
+    table_dir = tmp_path / 'person'
+    table_dir.mkdir()
+    (table_dir / 'person_1.csv').write_text('person_id,year_of_birth\n1,2000\n')
+    (table_dir / 'person_2.csv').write_text('person_id,year_of_birth\n2,2001\n')
+    result = check_inconsistent_header_in_csv(str(table_dir), 'person')
+    assert result.status == 'PASS'
+    (table_dir / 'person_3.csv').write_text('person_id,gender_concept_id\n3,8507\n')
+    result = check_inconsistent_header_in_csv(str(table_dir), 'person')
+    assert result.status == 'FAIL'
+    assert result.file_name == (str(table_dir / 'person_3.csv'), )
@@ -0,0 +1,83 @@
+from src.load_duckdb import init_duckdb_logging_schema
+from src.check_scheduler import CheckScheduler
+from src.dq_checks.check_result import CheckResult
+from src.dq_checks.check_fk import check_fk_violations, ReferenceKeySets
+from src.dq_checks.check_not_null import check_not_null_violations
+import threading
+import duckdb
+
+
+def test_check_scheduler_dependencies():
+    with duckdb.connect(database=':memory:') as con:
+        init_duckdb_logging_schema(con, 'test_run', {})
+        events = []
+        lock = threading.Lock()
+        def record(con, event):
+            with lock:
+                events.append(event)
+            return event
+        scheduler = CheckScheduler(con, max_workers=4)
+        scheduler.add('check visit_occurrence', record, tables=['visit_occurrence', 'person'], event='check')
+        scheduler.add('load person', record, provides_table='person', depends_on=['load visit_occurrence'], event='load person')
+        scheduler.add('load visit_occurrence', record, provides_table='visit_occurrence', event='load visit_occurrence')
+        results = scheduler.run()
+        assert events == ['load visit_occurrence', 'load person', 'check']
+        assert list(results.keys()) == ['check visit_occurrence', 'load person', 'load visit_occurrence']
+
+        # a failed task does not stop the run: it fails with a CheckResult, and the tasks depending on it are skipped
+        def fail(con):
+            raise ValueError('load failed')
+        scheduler = CheckScheduler(con, max_workers=2)
+        scheduler.add('load person', fail, provides_table='person')
+        scheduler.add('check person', record, tables=['person'], event='not run')
+        scheduler.add('check care_site', record, tables=['care_site'], event='check care_site')
+        results = scheduler.run()
+        assert 'not run' not in events and 'check care_site' in events
+        assert results['load person'].status == 'FAIL' and 'load failed' in results['load person'].troubleshooting_message
+        assert results['check person'].status == 'SKIPPED'
+        assert isinstance(scheduler.tasks['check person'].error, ValueError)
+
+        # a load task adding its table to skip_tables does not fail the run, readers of the table are not run
+        skip_tables = []
+        def failed_load(con, table_name):
+            skip_tables.append(table_name)
+        scheduler = CheckScheduler(con, max_workers=2, skip_tables=skip_tables)
+        scheduler.add('load person', failed_load, provides_table='person', table_name='person')
+        scheduler.add('check person', record, tables=['person'], event='skipped')
+        scheduler.add('check fact_relationship', record, depends_on=['load person'], event='check fact_relationship')
+        results = scheduler.run()
+        assert results['check person'] is None
+        assert 'skipped' not in events and events[-1] == 'check fact_relationship'
+
+        # on_tables_provided is called once the last load finishes, before the checks waiting for it
+        events.clear()
+        scheduler = CheckScheduler(con, max_workers=1, on_tables_provided=lambda: events.append('loaded'))
+        scheduler.add('check visit_occurrence', record, tables=['visit_occurrence', 'person'], event='check')
+        scheduler.add('load person', record, provides_table='person', event='load person')
+        scheduler.add('load visit_occurrence', record, provides_table='visit_occurrence', event='load visit_occurrence')
+        scheduler.run()
+        assert events == ['load person', 'load visit_occurrence', 'loaded', 'check']
+
+
+def test_check_scheduler_fk_checks_on_cursor_pool():
+    with duckdb.connect(database=':memory:') as con:
+        init_duckdb_logging_schema(con, 'test_run', {})
+        con.execute("CREATE TABLE person AS SELECT range AS person_id FROM range(5)")
+        con.execute("CREATE TABLE visit_occurrence AS SELECT range AS visit_occurrence_id, range AS person_id FROM range(10)")
+        con.execute("CREATE TABLE condition_occurrence AS SELECT range AS condition_occurrence_id, range % 5 AS person_id FROM range(10)")
+        key_sets = ReferenceKeySets(con, schema='fk_keys')
+        fail_count = len(CheckResult.dq_fail)
+        scheduler = CheckScheduler(con, max_workers=3)
+        scheduler.add('build key set person.person_id', key_sets.build, tables=['person'], reference_table='person', reference_column='person_id')
+        for main_table in ('visit_occurrence', 'condition_occurrence'):
+            scheduler.add(f'check foreign keys {main_table}', check_fk_violations, tables=[main_table, 'person'], depends_on=['build key set person.person_id'],
+                          main_table=main_table, foreign_keys=[('person_id', 'person', 'person_id')], key_sets=key_sets)
+            scheduler.add(f'check not null {main_table}', check_not_null_violations, tables=[main_table], table_name=main_table, column_names=['person_id'])
+        try:
+            results = scheduler.run()
+        finally:
+            key_sets.drop()
+        assert [result.status for result in results['check foreign keys visit_occurrence']] == ['FAIL']
+        assert [result.status for result in results['check foreign keys condition_occurrence']] == ['PASS']
+        assert CheckResult.dq_fail[fail_count:] == results['check foreign keys visit_occurrence']
+        assert con.execute("SELECT COUNT(*) FROM duckdb_schemas() WHERE schema_name = 'fk_keys'").fetchone()[0] == 0
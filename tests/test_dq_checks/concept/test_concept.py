@@ -0,0 +1,41 @@
+from src.load_duckdb import init_duckdb_logging_schema
+from src.dq_checks.check_concept import check_concept_ids, get_concept_columns
+from src.data_model import DataModel
+import duckdb
+
+
+def test_get_concept_columns():
+    data_model = DataModel(mode='json', name='pedsnet', version='v57', file_path='tests/data/data_model/pedsnet_v57_data_model.json')
+    concept_columns = get_concept_columns(data_model)
+    assert 'condition_concept_id' in concept_columns['condition_occurrence']
+    assert 'person_id' not in concept_columns['condition_occurrence']
+
+def test_check_concept_ids():
+    with duckdb.connect(database=':memory:') as con:
+        init_duckdb_logging_schema(con, 'test_run', {})
+        con.execute("""
+            CREATE TABLE concept AS SELECT * FROM (VALUES
+                (201826, 'Condition', 'S'), (45571656, 'Condition', NULL), (3004410, 'Measurement', 'S'), (32817, 'Type Concept', 'S')
+            ) AS t(concept_id, domain_id, standard_concept)
+        """)
+        # 10 rows: 2 concept ids not in concept, 1 non-standard condition, 1 measurement concept, 0 and NULL are not violations
+        con.execute("""
+            CREATE TABLE condition_occurrence AS SELECT * FROM (VALUES
+                (201826, 32817), (201826, 32817), (201826, 32817), (201826, 32817), (201826, 99),
+                (45571656, 32817), (3004410, 32817), (0, 32817), (NULL, 32817), (12345, 32817)
+            ) AS t(condition_concept_id, condition_type_concept_id)
+        """)
+        column_names = ['condition_concept_id', 'condition_type_concept_id', 'poa_concept_id']
+        results = check_concept_ids(con, 'condition_occurrence', column_names)
+        assert [(result.check_type, result.column_name[0], result.status) for result in results] == [
+            ('concept_id_violation', 'condition_concept_id', 'FAIL'),
+            ('concept_domain_violation', 'condition_concept_id', 'FAIL'),
+            ('standard_concept_violation', 'condition_concept_id', 'FAIL'),
+            ('concept_id_violation', 'condition_type_concept_id', 'FAIL'),
+            ('concept_id_violation', 'poa_concept_id', 'SKIPPED'),
+        ]
+        assert [result.violation_pct for result in results[:4]] == [0.1, 0.1, 0.1, 0.1]
+        assert '12345' in results[0].troubleshooting_message and '3004410' in results[1].troubleshooting_message
+
+        con.execute("DELETE FROM concept")
+        assert [result.status for result in check_concept_ids(con, 'condition_occurrence', column_names)] == ['SKIPPED'] * 3
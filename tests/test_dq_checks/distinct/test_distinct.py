@@ -0,0 +1,34 @@
+from src.load_duckdb import init_duckdb_logging_schema
+from src.dq_checks.check_distinct import check_distinct_violation
+import duckdb
+
+
+def test_check_distinct_violation_approx_precheck():
+    with duckdb.connect(database=':memory:') as con:
+        init_duckdb_logging_schema(con, 'test_run', {})
+        con.execute("CREATE TABLE person AS SELECT range AS person_id, range % 3 AS gender_concept_id FROM range(100)")
+        con.execute("CREATE TABLE visit_occurrence AS SELECT * FROM (VALUES (1, 'a'), (2, NULL), (3, 'b'), (3, 'b')) v(visit_occurrence_id, visit_source_value)")
+        # a key that looks distinct is confirmed by the exact count
+        precheck_result = check_distinct_violation(con, 'person', 'person_id', approx_precheck=True)
+        assert precheck_result.status == 'PASS'
+        assert 'distinct_estimate' not in precheck_result.kwargs
+        # many duplicates are reported from the estimate, with its relative error
+        precheck_result = check_distinct_violation(con, 'person', 'gender_concept_id', approx_precheck=True)
+        assert precheck_result.status == 'FAIL'
+        assert precheck_result.kwargs['distinct_estimate'] == 3 and 'estimate_relative_error' in precheck_result.kwargs
+        for table_name, column_names in [('person', ('person_id', 'gender_concept_id')), ('person', 'gender_concept_id'), ('visit_occurrence', 'visit_source_value'), ('visit_occurrence', ('visit_occurrence_id', 'visit_source_value'))]:
+            exact_result = check_distinct_violation(con, table_name, column_names)
+            precheck_result = check_distinct_violation(con, table_name, column_names, approx_precheck=True)
+            assert precheck_result.status == exact_result.status
+            assert precheck_result.violation_pct == exact_result.violation_pct
+
+
+def test_check_distinct_violation_sample():
+    with duckdb.connect(database=':memory:') as con:
+        init_duckdb_logging_schema(con, 'test_run', {})
+        con.execute("CREATE TABLE person AS SELECT range AS person_id FROM range(100) UNION ALL SELECT 7 FROM range(3) UNION ALL SELECT 8")
+        result = check_distinct_violation(con, 'person', 'person_id')
+        assert result.status == 'FAIL'
+        assert result.kwargs['violation_count'] == 4
+        # most duplicated values first
+        assert 'Sample non-distinct values: 7, 8.' in result.troubleshooting_message
@@ -0,0 +1,68 @@
+from src.load_duckdb import init_duckdb_logging_schema
+from src.dq_checks.check_fact_relationship import check_fact_relationship
+import duckdb
+
+
+def test_check_fact_relationship_single_scan():
+    with duckdb.connect(database=':memory:') as con:
+        init_duckdb_logging_schema(con, 'test_run', {})
+        con.execute("CREATE TABLE person AS SELECT range AS person_id FROM range(10)")
+        # duplicate ids in a domain table must not duplicate facts
+        con.execute("CREATE TABLE visit_occurrence AS SELECT * FROM (VALUES (1), (2), (2)) v(visit_occurrence_id)")
+        con.execute("""
+            CREATE TABLE fact_relationship AS SELECT * FROM (VALUES
+                (56, 1, 8, 2),
+                (56, 11, 8, 3),
+                (8, 2, 56, NULL),
+                (56, 2, 56, 3)
+            ) v(domain_concept_id_1, fact_id_1, domain_concept_id_2, fact_id_2)
+        """)
+        check_fact_relationship(con, skip_tables=['measurement'])
+        results = {row[0]: row[1:] for row in con.execute("""
+            SELECT trim(table_name, '[]'), status, violation_pct, message
+            FROM logging.dq
+            WHERE check_type = 'fact_relationship_violation'
+        """).fetchall()}
+        # person: 5 facts on both sides, fact_id_1 = 11 and fact_id_2 = NULL are missing
+        assert results['person'][0] == 'WARN'
+        assert abs(results['person'][1] - 2 / 5) < 1e-6
+        assert 'fact_id_1=11' in results['person'][2]
+        # visit_occurrence: 3 facts, 3 is missing
+        assert results['visit_occurrence'][0] == 'WARN'
+        assert abs(results['visit_occurrence'][1] - 1 / 3) < 1e-6
+        assert 'fact_id_2=3' in results['visit_occurrence'][2]
+        assert results['drug_exposure'][0] == 'SKIPPED'
+        assert 'measurement' not in results
+
+
+def test_check_fact_relationship_domain_concept_id_types():
+    with duckdb.connect(database=':memory:') as con:
+        init_duckdb_logging_schema(con, 'test_run', {})
+        con.execute("CREATE TABLE person AS SELECT range AS person_id FROM range(10)")
+        # domain_concept_id read with another type than INTEGER, e.g. from a parquet file
+        con.execute("""
+            CREATE TABLE fact_relationship AS SELECT * FROM (VALUES
+                ('56', 1, '56', 11)
+            ) v(domain_concept_id_1, fact_id_1, domain_concept_id_2, fact_id_2)
+        """)
+        check_fact_relationship(con)
+        results = {row[0]: row[1:] for row in con.execute("""
+            SELECT trim(table_name, '[]'), status, violation_pct
+            FROM logging.dq
+            WHERE check_type = 'fact_relationship_violation'
+        """).fetchall()}
+        assert results['person'][0] == 'WARN'
+        assert abs(results['person'][1] - 1 / 2) < 1e-6
+
+
+def test_check_fact_relationship_only_scans_domains_with_facts():
+    with duckdb.connect(database=':memory:') as con:
+        init_duckdb_logging_schema(con, 'test_run', {})
+        # person has no facts: its table is not scanned, reading the view would fail
+        con.execute("CREATE TABLE person_values AS SELECT 'x' AS person_id")
+        con.execute("CREATE VIEW person AS SELECT person_id::BIGINT AS person_id FROM person_values")
+        con.execute("CREATE TABLE visit_occurrence AS SELECT * FROM (VALUES (1), (2)) v(visit_occurrence_id)")
+        con.execute("CREATE TABLE fact_relationship AS SELECT * FROM (VALUES (8, 1, 8, 3)) v(domain_concept_id_1, fact_id_1, domain_concept_id_2, fact_id_2)")
+        results = {result.table_name[0]: result for result in check_fact_relationship(con)}
+        assert results['person'].status == 'SKIPPED'
+        assert results['visit_occurrence'].status == 'WARN'
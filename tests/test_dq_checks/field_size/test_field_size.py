@@ -0,0 +1,37 @@
+from src.load_duckdb import init_duckdb_logging_schema
+from src.dq_checks.check_field_size import check_field_sizes, get_size_columns
+from src.data_model import DataModel
+import duckdb
+
+
+def test_get_size_columns():
+    data_model = DataModel(mode='json', name='pedsnet', version='v57', file_path='tests/data/data_model/pedsnet_v57_data_model.json')
+    size_columns = get_size_columns(data_model)
+    assert size_columns['concept']['domain_id'] == {'type': 'string', 'length': 20, 'precision': 0, 'scale': 0}
+    assert size_columns['person']['person_source_value']['length'] == 256  # default VARCHAR length of the DDL
+    # scale 0 of a number is the default scale of the DDL, DECIMAL(25, 5)
+    assert size_columns['drug_strength']['numerator_value'] == {'type': 'number', 'length': 30, 'precision': 25, 'scale': 5}
+    assert 'person_id' not in size_columns['person']
+
+def test_check_field_sizes():
+    with duckdb.connect(database=':memory:') as con:
+        init_duckdb_logging_schema(con, 'test_run', {})
+        con.execute("""
+            CREATE TABLE drug_strength AS SELECT * FROM (VALUES
+                ('S', 1.0::DECIMAL(20, 5), 10.25::DECIMAL(20, 5)), ('Dé', 12.5, 1.0), (NULL, 1234.0, 1.5), ('X', NULL, 99.995)
+            ) AS t(invalid_reason, numerator_value, denominator_value)
+        """)
+        fields = {
+            'invalid_reason': {'type': 'string', 'length': 1, 'precision': 0, 'scale': 0},
+            'numerator_value': {'type': 'number', 'length': 0, 'precision': 3, 'scale': 0},
+            'denominator_value': {'type': 'number', 'length': 0, 'precision': 4, 'scale': 2},
+            'amount_value': {'type': 'number', 'length': 0, 'precision': 4, 'scale': 2},
+        }
+        results = check_field_sizes(con, 'drug_strength', fields)
+        assert [result.status for result in results] == ['FAIL', 'FAIL', 'FAIL', 'SKIPPED']
+        # 'Dé' has 2 characters (3 bytes); 1234.0 has 4 integer digits, 12.5 fits precision 3 scale 0 (decimals are not limited)
+        assert results[0].violation_pct == 0.25 and 'Longest value: 2 characters' in results[0].troubleshooting_message
+        assert results[1].violation_pct == 0.25 and '1234' in results[1].troubleshooting_message
+        assert results[2].violation_pct == 0.25 and '99.995' in results[2].troubleshooting_message  # 3 decimals for scale 2
+        con.execute("INSERT INTO drug_strength VALUES ('Y', 1, 100.00)")
+        assert check_field_sizes(con, 'drug_strength', fields)[2].violation_pct == 0.4  # 3 integer digits for precision 4 scale 2
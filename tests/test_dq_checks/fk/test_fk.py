@@ -0,0 +1,35 @@
+from src.load_duckdb import init_duckdb_logging_schema
+from src.dq_checks.check_fk import check_fk_violation, check_fk_violations, ReferenceKeySets
+import duckdb
+
+
+def test_check_fk_violations_grouped():
+    with duckdb.connect(database=':memory:') as con:
+        init_duckdb_logging_schema(con, 'test_run', {})
+        con.execute("CREATE TABLE person AS SELECT range AS person_id FROM range(5)")
+        con.execute("CREATE TABLE provider AS SELECT range AS provider_id FROM range(2)")
+        con.execute("CREATE TABLE visit_occurrence AS SELECT range AS visit_occurrence_id, range AS person_id, CASE WHEN range < 4 THEN range END AS provider_id FROM range(10)")
+        foreign_keys = [('person_id', 'person', 'person_id'), ('provider_id', 'provider', 'provider_id'), ('care_site_id', 'care_site', 'care_site_id')]
+        key_sets = ReferenceKeySets(con)
+        results = check_fk_violations(con, 'visit_occurrence', foreign_keys, key_sets=key_sets)
+        assert list(key_sets.key_tables.keys()) == [('person', 'person_id'), ('provider', 'provider_id')]
+        key_sets.drop()
+        assert [result.status for result in results] == ['FAIL', 'FAIL', 'SKIPPED']
+        for result, (main_column, reference_table, reference_column) in zip(results[:2], foreign_keys):
+            assert result.violation_pct == check_fk_violation(con, 'visit_occurrence', main_column, reference_table, reference_column).violation_pct
+        assert results[0].violation_pct == 0.5
+        assert results[1].violation_pct == 0.2  # NULL provider_id are not violations
+
+def test_check_fk_violations_fail_fast():
+    with duckdb.connect(database=':memory:') as con:
+        init_duckdb_logging_schema(con, 'test_run', {})
+        con.execute("CREATE TABLE person AS SELECT range AS person_id FROM range(500)")
+        con.execute("CREATE TABLE provider AS SELECT range AS provider_id FROM range(999)")
+        con.execute("CREATE TABLE visit_occurrence AS SELECT range AS visit_occurrence_id, range AS person_id, range AS provider_id FROM range(1000)")
+        foreign_keys = [('person_id', 'person', 'person_id'), ('provider_id', 'provider', 'provider_id')]
+        thresholds = {'person_id': {'PASS': 0.0, 'WARN': 0.1}, 'provider_id': {'PASS': 0.0, 'WARN': 0.1}}
+        results = check_fk_violations(con, 'visit_occurrence', foreign_keys, thresholds=thresholds, fail_fast=True)
+        assert [result.status for result in results] == ['FAIL', 'WARN']
+        assert results[0].violation_pct == 0.101 and results[0].kwargs['early_exit']
+        assert results[1].violation_pct == 0.001 and 'early_exit' not in results[1].kwargs
+        assert check_fk_violation(con, 'visit_occurrence', 'person_id', 'person', 'person_id', thresholds['person_id'], fail_fast=True).violation_pct == 0.101
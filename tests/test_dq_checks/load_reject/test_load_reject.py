@@ -0,0 +1,20 @@
+from src.load_duckdb import load_csv_to_duckdb, init_duckdb_logging_schema
+from src.dq_checks.check_load_reject import check_load_reject
+from src.util import get_table_count
+import duckdb
+
+
+def test_check_load_reject(tmp_path):
+    csv_path = tmp_path / 'care_site.csv'
+    csv_path.write_text('care_site_id,care_site_source_value\n1,a\nnot_a_number,b\n3,c\n4,d\n')
+    with duckdb.connect(database=':memory:') as con:
+        init_duckdb_logging_schema(con, 'test_run', {})
+        con.execute('CREATE TABLE care_site (care_site_id BIGINT, care_site_source_value VARCHAR);')
+        load_csv_to_duckdb(str(csv_path), con, 'care_site', store_rejects=True)
+        assert get_table_count(con, 'care_site') == 3
+        assert get_table_count(con, 'care_site', 'rejects') == 1
+        result = check_load_reject(con, 'care_site', threshold={'PASS': 0.0, 'WARN': 0.5})
+        assert result.status == 'WARN'
+        assert result.violation_pct == 0.25
+        result = check_load_reject(con, 'person')
+        assert result.status == 'SKIPPED'
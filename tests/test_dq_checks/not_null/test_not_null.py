@@ -1 +1,49 @@
-#TODO: ADD TESTS
\ No newline at end of file
+from src.load_duckdb import init_duckdb_logging_schema
+from src.dq_checks.check_not_null import check_not_null_violation, check_not_null_violations
+from src.parquet_stats import ParquetFooterStats
+from src.util import get_table_count
+import duckdb
+
+
+def test_check_not_null_violation_from_parquet_footer(tmp_path):
+    parquet_path = str(tmp_path / 'person.parquet')
+    with duckdb.connect(database=':memory:') as con:
+        init_duckdb_logging_schema(con, 'test_run', {})
+        con.execute(f"COPY (SELECT range AS person_id, CASE WHEN range < 2 THEN NULL ELSE 8507 END AS gender_concept_id FROM range(10)) TO '{parquet_path}' (FORMAT PARQUET)")
+        con.execute(f"CREATE VIEW person AS SELECT * FROM read_parquet('{parquet_path}')")
+        scan_result = check_not_null_violation(con, 'person', 'gender_concept_id', threshold={'PASS': 0.0, 'WARN': 0.5})
+        ParquetFooterStats.register('person', [parquet_path])
+        try:
+            assert get_table_count(con, 'person') == 10
+            assert ParquetFooterStats.get_null_count(con, 'person', 'gender_concept_id') == 2
+            footer_result = check_not_null_violation(con, 'person', 'gender_concept_id', threshold={'PASS': 0.0, 'WARN': 0.5})
+            assert footer_result.status == scan_result.status == 'WARN'
+            assert footer_result.violation_pct == scan_result.violation_pct == 0.2
+            assert check_not_null_violation(con, 'person', 'person_id').status == 'PASS'
+        finally:
+            ParquetFooterStats.unregister('person')
+
+def test_check_not_null_violations_fused():
+    with duckdb.connect(database=':memory:') as con:
+        init_duckdb_logging_schema(con, 'test_run', {})
+        con.execute("CREATE TABLE visit_occurrence AS SELECT range AS visit_occurrence_id, CASE WHEN range < 3 THEN NULL ELSE range END AS person_id, NULL::INTEGER AS visit_concept_id FROM range(10)")
+        column_names = ['person_id', 'visit_concept_id', 'visit_occurrence_id', 'not_a_column', 'visit_occurrence_id']
+        results = check_not_null_violations(con, 'visit_occurrence', column_names)
+        assert [result.column_name for result in results] == [(column_name, ) for column_name in column_names]
+        assert [result.status for result in results] == ['FAIL', 'FAIL', 'PASS', 'SKIPPED', 'PASS']
+        for result in results[:3]:
+            assert result.violation_pct == check_not_null_violation(con, 'visit_occurrence', result.column_name[0]).violation_pct
+
+def test_check_not_null_violations_fail_fast():
+    with duckdb.connect(database=':memory:') as con:
+        init_duckdb_logging_schema(con, 'test_run', {})
+        con.execute("CREATE TABLE visit_occurrence AS SELECT range AS visit_occurrence_id, CASE WHEN range % 2 = 0 THEN NULL ELSE range END AS person_id, CASE WHEN range = 0 THEN NULL ELSE range END AS visit_concept_id FROM range(1000)")
+        thresholds = {column_name: {'PASS': 0.0, 'WARN': 0.01} for column_name in ['visit_occurrence_id', 'person_id', 'visit_concept_id']}
+        exact_results = check_not_null_violations(con, 'visit_occurrence', list(thresholds), thresholds)
+        results = check_not_null_violations(con, 'visit_occurrence', list(thresholds), thresholds, fail_fast=True)
+        assert [result.status for result in results] == [result.status for result in exact_results] == ['PASS', 'FAIL', 'WARN']
+        # person_id fails once 11 NULL values are found, its rate is a lower bound
+        assert results[1].violation_pct == 0.011 and results[1].kwargs == {'early_exit': True}
+        assert exact_results[1].violation_pct == 0.5
+        assert results[2].violation_pct == exact_results[2].violation_pct == 0.001
+        assert check_not_null_violation(con, 'visit_occurrence', 'person_id', thresholds['person_id'], fail_fast=True).violation_pct == 0.011
@@ -0,0 +1,22 @@
+from src.load_duckdb import load_csv_to_duckdb_staging, get_cast_failure_columns, init_duckdb_logging_schema
+from src.dq_checks.check_type_conformance import check_type_conformance
+from src.util import get_table_count
+import duckdb
+
+
+def test_check_type_conformance(tmp_path):
+    csv_path = tmp_path / 'person.csv'
+    csv_path.write_text('person_id,birth_date,person_source_value\n1,2020-01-01,a\n2,2020-13-45,b\nthree,,c\n4,2021-02-03,d\n')
+    with duckdb.connect(database=':memory:') as con:
+        init_duckdb_logging_schema(con, 'test_run', {})
+        con.execute('CREATE TABLE person (person_id BIGINT, birth_date DATE, person_source_value VARCHAR);')
+        load_csv_to_duckdb_staging(str(csv_path), con, 'person')
+        assert get_table_count(con, 'person') == 4
+        assert con.execute('SELECT COUNT(*) FROM person WHERE birth_date IS NULL').fetchone()[0] == 2
+        assert get_cast_failure_columns(con, 'person') == ['birth_date', 'person_id']
+        result = check_type_conformance(con, 'person', 'birth_date', threshold={'PASS': 0.0, 'WARN': 0.5})
+        assert result.status == 'WARN'
+        assert result.violation_pct == 0.25  # the empty value is NULL in the file, not a cast failure
+        assert "'2020-13-45'" in result.troubleshooting_message
+        assert check_type_conformance(con, 'person', 'person_id', threshold={'PASS': 0.0, 'WARN': 0.1}).status == 'FAIL'
+        assert check_type_conformance(con, 'person', 'person_source_value').status == 'SKIPPED'
@@ -1 +1,112 @@
-# TODO: Add tests for load_duckdb.py functions
\ No newline at end of file
+from src.load_duckdb import create_duckdb_tables, create_duckdb_view, load_csv_to_duckdb, init_duckdb_logging_schema, get_unchanged_tables, save_table_fingerprint
+from src.data_model import DataModel
+from src.run_tasks import RunContext, load_table
+from src.check_scheduler import CheckScheduler
+from src.submission_manifest import SubmissionManifest
+from src.parquet_stats import ParquetFooterStats
+from src.util import get_table_count, get_path_fingerprint
+import pytest
+import duckdb
+
+file_dir = 'tests/data/cdm/base'
+json_file_path = 'tests/data/data_model/pedsnet_v57_data_model.json'
+
+@pytest.fixture()
+def _con():
+    data_model = DataModel(mode='json', name='pedsnet', version='5.7.0', file_path=json_file_path)
+    with duckdb.connect(database=':memory:') as con:
+        create_duckdb_tables(data_model, con, recreate=True)
+        yield con
+
+def _schedule_loads(con, load_tasks, max_workers):
+    data_model = DataModel(mode='json', name='pedsnet', version='5.7.0', file_path=json_file_path)
+    init_duckdb_logging_schema(con, 'test_run', {})
+    context = RunContext(run_id='test_run', skip_check_tables=[])
+    failed_load_tables = dict()
+    scheduler = CheckScheduler(con, max_workers=max_workers, skip_tables=context.skip_check_tables)
+    for table_name, file_path in load_tasks.items():
+        scheduler.add(
+            f'load {table_name}',
+            load_table,
+            provides_table=table_name,
+            table_name=table_name,
+            file_path=file_path,
+            context=context,
+            data_model=data_model,
+            manifest=SubmissionManifest(file_dir),
+            load_mode='copy',
+            failed_load_tables=failed_load_tables,
+            fingerprint=get_path_fingerprint(file_path),
+        )
+    scheduler.run()
+    return failed_load_tables, context
+
+def test_load_tables_to_duckdb_parallel(_con):
+    load_tasks = {table_name: f'{file_dir}/{table_name}.csv' for table_name in ('person', 'care_site', 'visit_occurrence', 'provider')}
+    failed_tables, _ = _schedule_loads(_con, load_tasks, max_workers=3)
+    assert failed_tables == {}
+    assert get_table_count(_con, 'person') == 2
+    assert get_table_count(_con, 'provider') == 6
+
+def test_load_tables_to_duckdb_failure_does_not_stop_other_loads(_con):
+    load_tasks = {
+        'person': f'{file_dir}/person.csv',
+        'care_site': f'{file_dir}/care_site.csv',
+        'location': f'{file_dir}/not_exist.csv',
+    }
+    failed_tables, context = _schedule_loads(_con, load_tasks, max_workers=2)
+    assert set(failed_tables.keys()) == {'location'}
+    assert 'location' in context.skip_check_tables
+    assert get_table_count(_con, 'person') == 2
+    assert get_table_count(_con, 'care_site') > 0
+
+def test_load_csv_shards_to_duckdb(_con, tmp_path):
+    table_dir = tmp_path / 'care_site'
+    table_dir.mkdir()
+    (table_dir / 'care_site_1.csv').write_text('care_site_id,care_site_source_value\n1,a\n2,b\n')
+    (table_dir / 'care_site_2.csv').write_text('care_site_id,care_site_source_value\n3,c\n')
+    load_csv_to_duckdb(str(table_dir), _con, 'care_site')
+    assert get_table_count(_con, 'care_site') == 3
+
+def test_get_unchanged_tables(_con, tmp_path):
+    data_model = DataModel(mode='json', name='pedsnet', version='5.7.0', file_path=json_file_path)
+    init_duckdb_logging_schema(_con, 'test_run', {})
+    csv_path = tmp_path / 'care_site.csv'
+    csv_path.write_text('care_site_id,care_site_source_value\n1,a\n')
+    load_tasks = {'care_site': str(csv_path)}
+    assert get_unchanged_tables(_con, load_tasks, data_model) == {}
+    save_table_fingerprint(_con, 'test_run', 'care_site', str(csv_path), get_path_fingerprint(str(csv_path)), data_model)
+    assert set(get_unchanged_tables(_con, load_tasks, data_model).keys()) == {'care_site'}
+    # a table loaded in another load mode or reject capture is reloaded
+    assert get_unchanged_tables(_con, load_tasks, data_model, load_mode='staging') == {}
+    assert get_unchanged_tables(_con, load_tasks, data_model, store_rejects=True) == {}
+    csv_path.write_text('care_site_id,care_site_source_value\n1,a\n2,b\n')
+    assert get_unchanged_tables(_con, load_tasks, data_model) == {}
+
+def test_create_duckdb_view(_con):
+    create_duckdb_view(f'{file_dir}/person.csv', _con, 'person', file_format='csv')
+    assert _con.execute("SELECT COUNT(*) FROM duckdb_views() WHERE view_name = 'person'").fetchone()[0] == 1
+    assert get_table_count(_con, 'person') == 2
+    column_types = {item[0]: item[1] for item in _con.execute('DESCRIBE person').fetchall()}
+    assert column_types['person_id'] == 'BIGINT'
+    assert column_types['extra_col'] == 'VARCHAR'
+    assert 'birth_date' in column_types # data model column missing from the file
+
+def test_create_duckdb_view_parquet_types(_con, tmp_path):
+    parquet_path = tmp_path / 'person.parquet'
+    _con.execute(f"COPY (SELECT '1' AS Person_Id, 1::INTEGER AS gender_concept_id, 'a' AS extra_col UNION ALL SELECT 'x', 2, 'b') TO '{parquet_path}' (FORMAT parquet);")
+    create_duckdb_view(str(parquet_path), _con, 'person', file_format='parquet')
+    column_types = {item[0]: item[1] for item in _con.execute('DESCRIBE person').fetchall()}
+    assert column_types['person_id'] == 'BIGINT'
+    assert column_types['extra_col'] == 'VARCHAR'
+    # only the column of another type than the table is cast, and a value that cannot be cast is not read as NULL
+    view_sql = _con.execute("SELECT sql FROM duckdb_views() WHERE view_name = 'person'").fetchone()[0]
+    assert 'CAST(person_id AS BIGINT)' in view_sql and 'CAST(gender_concept_id' not in view_sql
+    ParquetFooterStats.register('person', [str(parquet_path)])
+    try:
+        assert ParquetFooterStats.get_null_count(_con, 'person', 'person_id') is None
+        assert ParquetFooterStats.get_null_count(_con, 'person', 'gender_concept_id') == 0
+    finally:
+        ParquetFooterStats.unregister('person')
+    with pytest.raises(duckdb.ConversionException):
+        _con.execute('SELECT person_id FROM person').fetchall()
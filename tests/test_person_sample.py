@@ -0,0 +1,37 @@
+from src.person_sample import PersonSample
+from src.load_duckdb import init_duckdb_logging_schema
+from src.dq_checks.check_not_null import check_not_null_violations
+import duckdb
+
+
+def test_wilson_interval():
+    low, high = PersonSample.wilson_interval(3, 1000)
+    assert round(low, 5) == 0.00102 and round(high, 5) == 0.00878
+    low, high = PersonSample.wilson_interval(0, 1000)
+    assert low == 0.0 and 0 < high < 0.004
+
+def test_person_sample(tmp_path):
+    PersonSample.enable(0.3)
+    try:
+        assert PersonSample.get_filter(['care_site_id']) is None
+        sample_filter = PersonSample.get_filter(['visit_occurrence_id', 'person_id'])
+        with duckdb.connect(database=':memory:') as con:
+            init_duckdb_logging_schema(con, 'test_run', {})
+            # the same persons are sampled from typed and text person_id columns
+            con.execute("CREATE TABLE person AS SELECT range AS person_id, range AS visit_occurrence_id FROM range(10000)")
+            con.execute("CREATE TABLE visit_occurrence AS SELECT range AS visit_occurrence_id, range::INTEGER::VARCHAR AS person_id FROM range(10000)")
+            person_ids = {row[0] for row in con.execute(f"SELECT person_id FROM person WHERE {sample_filter}").fetchall()}
+            visit_person_ids = {int(row[0]) for row in con.execute(f"SELECT person_id FROM visit_occurrence WHERE {sample_filter}").fetchall()}
+            assert person_ids == visit_person_ids
+            assert 2700 < len(person_ids) < 3300
+
+            con.execute(f"CREATE TABLE condition_occurrence AS SELECT * FROM person WHERE {sample_filter}")
+            con.execute(f"UPDATE condition_occurrence SET visit_occurrence_id = NULL WHERE person_id % 10 = 0")
+            PersonSample.add_sampled_table('condition_occurrence')
+            results = check_not_null_violations(con, 'condition_occurrence', ['visit_occurrence_id', 'person_id'])
+            low, high = (float(value.strip('%')) / 100 for value in results[0].kwargs['confidence_interval'].strip('[]').split(', '))
+            assert low < results[0].violation_pct < high
+            assert results[1].kwargs['sample_fraction'] == 0.3
+            assert 'confidence_interval' not in check_not_null_violations(con, 'person', ['person_id'])[0].kwargs
+    finally:
+        PersonSample.disable()
@@ -0,0 +1,49 @@
+from src.plan import estimate_csv_rows, get_process_history, format_plan, _estimate_task, KEY_BYTES
+from src.check_scheduler import CheckTask
+from src.dq_checks.check_fk import ReferenceKeySets
+from src.dq_checks.check_fact_relationship import check_fact_relationship, FACT_RELATIONSHIP_DOMAIN_CONCEPT_ID_TO_CDM_MAPPING
+from src.load_duckdb import init_duckdb_logging_schema
+import duckdb
+import gzip
+
+
+def test_estimate_csv_rows(tmp_path):
+    csv_path = tmp_path / 'person.csv'
+    content = 'person_id,gender_concept_id\n' + ''.join(f'{i:05d},8507\n' for i in range(10000))
+    csv_path.write_text(content)
+    assert estimate_csv_rows(str(csv_path)) == 10000
+    # sampled: estimate from the line length of the first bytes
+    assert abs(estimate_csv_rows(str(csv_path), sample_size=4096) - 10000) < 1000
+    gz_path = tmp_path / 'person.csv.gz'
+    with gzip.open(gz_path, 'wt') as f:
+        f.write(content)
+    assert estimate_csv_rows(str(gz_path)) == 10000
+    assert estimate_csv_rows(str(tmp_path / 'person.csv.zst')) is None
+
+def test_process_history():
+    with duckdb.connect(database=':memory:') as con:
+        init_duckdb_logging_schema(con, 'run_1', {})
+        con.execute("""
+            INSERT INTO logging.process (run_id, process_name, category, status, start_time, end_time, rows_processed, bytes_read) VALUES
+            ('run_1', 'load person', 'load', 'SUCCESS', '2025-01-01 00:00:00', '2025-01-01 00:00:10', 100, 1000),
+            ('run_2', 'load person', 'load', 'SUCCESS', '2025-01-02 00:00:00', '2025-01-02 00:00:20', 200, 2000),
+            ('run_3', 'load person', 'load', 'FAIL', '2025-01-03 00:00:00', '2025-01-03 00:00:01', NULL, 2000);
+        """)
+        history = get_process_history(con)
+        assert history == {'load person': (20.0, 200, 2000)}
+    text = format_plan([
+        {'kind': 'load', 'name': 'load person', 'rows': 200, 'memory': 0, 'duration': 20.0, 'source': 'previous run'},
+        {'kind': 'check', 'name': 'check not null person', 'rows': None, 'memory': None, 'duration': None, 'source': 'unknown'},
+    ])
+    assert '1 load(s), 1 check(s).' in text
+    assert 'excluding 1 unknown' in text
+
+def test_estimate_fact_relationship_task():
+    task = CheckTask('check fact_relationship', check_fact_relationship, skip_tables=['measurement'])
+    table_rows = {mapping['table_name']: 10 for mapping in FACT_RELATIONSHIP_DOMAIN_CONCEPT_ID_TO_CDM_MAPPING.values()}
+    table_rows['fact_relationship'] = 5
+    table_rows['measurement'] = None
+    assert _estimate_task(task, ReferenceKeySets(None), table_rows) == (5 + 70, 70 * KEY_BYTES)
+    # a domain table of unknown size makes the estimate unknown
+    table_rows['observation'] = None
+    assert _estimate_task(task, ReferenceKeySets(None), table_rows) == (None, None)
@@ -0,0 +1,17 @@
+from src.process_log import ProcessLog
+import json
+
+
+def test_export_chrome_trace(tmp_path):
+    with ProcessLog('load person', category='load', bytes_read=100) as process:
+        process.rows_processed = 2
+    trace_path = ProcessLog.export_chrome_trace(str(tmp_path / 'trace.json'))
+    with open(trace_path) as f:
+        trace = json.load(f)
+    event = [item for item in trace['traceEvents'] if item['name'] == 'load person'][-1]
+    assert event['ph'] == 'X'
+    assert event['cat'] == 'load'
+    assert event['dur'] >= 0
+    assert event['args']['status'] == 'SUCCESS'
+    assert event['args']['rows_processed'] == 2
+    assert event['args']['bytes_read'] == 100
@@ -0,0 +1,32 @@
+from src.resource_planner import ResourcePlanner, parse_size
+import duckdb
+
+GIB = 1024 ** 3
+
+def test_parse_size():
+    assert parse_size('32GB') == 32 * 1000 ** 3
+    assert parse_size('512 MiB') == 512 * 1024 ** 2
+
+def test_resource_planner(tmp_path):
+    planner = ResourcePlanner(
+        submission_size=100 * GIB,
+        largest_table_size=64 * GIB,
+        duckdb_path=str(tmp_path / 'cdm.duckdb'),
+        max_temp_directory_size='500GB',
+        host_memory=64 * GIB,
+        host_cpu_count=32,
+    )
+    load_settings = planner.plan('load')
+    join_settings = planner.plan('join')
+    assert load_settings['threads'] == '32'
+    assert load_settings['memory_limit'] == f'{48 * 1024}MiB'
+    # 4GiB per thread for a 64GiB table
+    assert int(join_settings['threads']) == int(64 * GIB * 0.85) // (4 * GIB)
+    assert join_settings['temp_directory'] == str(tmp_path / 'cdm.duckdb.tmp')
+
+    # config values are kept for every stage
+    planner = ResourcePlanner(submission_size=GIB, largest_table_size=GIB, duckdb_path=':memory:', memory_limit='2GiB', threads=2, host_memory=64 * GIB, host_cpu_count=32)
+    assert planner.plan('join')['threads'] == planner.plan('load')['threads'] == '2'
+    with duckdb.connect(database=':memory:') as con:
+        planner.apply(con, 'join')
+        assert con.execute("SELECT current_setting('threads')").fetchone()[0] == 2
@@ -0,0 +1,31 @@
+from src.submission_manifest import SubmissionManifest
+from src.util import get_csv_header
+import duckdb
+import pytest
+
+file_dir = 'tests/data/cdm/base'
+
+def test_submission_manifest_csv():
+    manifest = SubmissionManifest(file_dir, 'csv').scan()
+    assert 'person' in manifest.table_names()
+    assert manifest.get_header(f'{file_dir}/person.csv') == get_csv_header(f'{file_dir}/person.csv')
+    assert manifest.get_size(f'{file_dir}/person.csv') > 0
+    assert manifest.get_files(f'{file_dir}/not_exist.csv') == []
+
+def test_submission_manifest_shards_and_parquet(tmp_path):
+    table_dir = tmp_path / 'person'
+    table_dir.mkdir()
+    (table_dir / 'person_1.csv').write_text('person_id,gender_concept_id\n1,8507\n')
+    (table_dir / 'person_2.csv').write_text('')
+    manifest = SubmissionManifest(str(tmp_path), 'csv', multiple_file_per_table=True).scan()
+    assert manifest.get_files(str(table_dir)) == [str(table_dir / 'person_1.csv'), str(table_dir / 'person_2.csv')]
+    assert manifest.get_header(str(table_dir / 'person_1.csv')) == ['person_id', 'gender_concept_id']
+    with pytest.raises(ValueError):
+        manifest.get_headers(str(table_dir))
+
+    duckdb.sql(f"COPY (SELECT range AS person_id FROM range(10)) TO '{tmp_path / 'person.parquet'}' (FORMAT PARQUET)")
+    manifest = SubmissionManifest(str(tmp_path), 'parquet').scan()
+    file_info = manifest.files[str(tmp_path / 'person.parquet')]
+    assert file_info['header'] == ['person_id']
+    assert file_info['num_rows'] == 10
+    assert file_info['row_group_count'] == 1
@@ -0,0 +1,25 @@
+from src.load_duckdb import load_csv_to_duckdb
+from src.table_stats import TableStats
+from src.util import get_table_count
+import duckdb
+
+
+def test_table_stats_from_load(tmp_path):
+    csv_path = tmp_path / 'person.csv'
+    csv_path.write_text('person_id,year_of_birth\n1,1980\n2,1990\n3,2000\n')
+    with duckdb.connect(database=':memory:') as con:
+        con.execute("CREATE TABLE person (person_id BIGINT, year_of_birth INTEGER)")
+        TableStats.enable()
+        try:
+            load_csv_to_duckdb(str(csv_path), con, 'person')
+            assert TableStats.peek_row_count('person') == 3
+            misses = TableStats.misses
+            assert get_table_count(con, 'person') == 3
+            assert TableStats.misses == misses and TableStats.hits >= 1
+            # a recorded count is returned until invalidated
+            con.execute("DELETE FROM person WHERE person_id = 1")
+            TableStats.invalidate('person')
+            assert get_table_count(con, 'person') == 2
+            assert TableStats.misses == misses + 1
+        finally:
+            TableStats.disable()
@@ -1,6 +1,22 @@
-from src.util import get_threshold
+from src.util import get_threshold, get_read_csv_options, get_csv_header, get_csv_files, get_csv_source, strip_csv_extension
+import duckdb
+import gzip
 
 
 def test_get_threshold():
     assert get_threshold(check_type='foreign_key_violation', table_name='person', column_name = 'person_id') == 0.01
-    assert get_threshold(check_type='foreign_key_violation', table_name='visit_occurrence_id', column_name = 'some_other_column') == 0.05
\ No newline at end of file
+    assert get_threshold(check_type='foreign_key_violation', table_name='visit_occurrence_id', column_name = 'some_other_column') == 0.05
+
+
+def test_get_read_csv_options():
+    assert get_read_csv_options("""FORMAT CSV, HEADER, DELIM ',', ESCAPE '"'""") == """header=true, delim=',', escape='"'"""
+
+
+def test_compressed_csv(tmp_path):
+    (tmp_path / 'person_1.csv').write_text('Person_ID,gender_concept_id\n1,8507\n')
+    with gzip.open(tmp_path / 'person_2.csv.gz', 'wt') as f:
+        f.write('Person_ID,gender_concept_id\n2,8532\n')
+    duckdb.sql(f"COPY (SELECT 3 AS Person_ID, 8507 AS gender_concept_id) TO '{tmp_path / 'person_3.csv.zst'}' (FORMAT CSV, HEADER, COMPRESSION zstd)")
+    assert [get_csv_header(f) for f in get_csv_files(str(tmp_path))] == [['person_id', 'gender_concept_id']] * 3
+    assert strip_csv_extension('person.csv.zst') == 'person'
+    assert duckdb.sql(f"SELECT COUNT(*) FROM read_csv('{get_csv_source(str(tmp_path))}')").fetchone()[0] == 3